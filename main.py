@@ -1,17 +1,41 @@
-from flask import Flask, render_template, Response, request, jsonify, session
-from openai import OpenAI
+from flask import Flask, render_template, Response, request, jsonify, session, make_response
 from ragflow_sdk import RAGFlow
 from dotenv import load_dotenv
+import asyncio
+import csv
+import io
 import json
 import os
+import random
+import re
+import sys
+import atexit
+import base64
+import hashlib
+import queue
 import threading
 import requests
 import mysql.connector
+import numpy as np
 from mysql.connector import Error
 import uuid
 import time
-from datetime import datetime, timedelta
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import wraps
 from typing import List, Dict, Optional
+from itsdangerous import BadSignature
+from urllib.parse import unquote_to_bytes, urlsplit
+
+try:
+    # Only needed for the asyncio serving mode (python main.py serve-async)
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    aiohttp = None
+    web = None
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
@@ -32,69 +56,958 @@ MYSQL_CONFIG = {
     'password': 'infini_rag_flow'
 }
 
+# "rows" stores one conversation_message row per message; "blob" keeps the legacy JSON column
+MESSAGE_STORAGE = os.getenv("MESSAGE_STORAGE", "rows")
+
 STATS_DIR = "workout_stats"
 os.makedirs(STATS_DIR, exist_ok=True)
 
-try:
-    client = OpenAI(api_key=API_KEY, base_url=f"{BASE_URL}/api/v1/chats_openai/{CHAT_ID}")
-    rag = RAGFlow(api_key=API_KEY, base_url=BASE_URL)
-    assistant = rag.list_chats(id=CHAT_ID)[0]
-    print("✅ OpenAI and RAGFlow clients initialized")
-except Exception as e:
-    print(f"⚠️ Warning initializing clients: {e}")
-    client = None
-    assistant = None
+
+# Connection pool sizing (tune under load via /debug/mysql-pool)
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "5"))
+MYSQL_POOL_MAX_OVERFLOW = int(os.getenv("MYSQL_POOL_MAX_OVERFLOW", "10"))
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "5"))
+MYSQL_POOL_RECYCLE = int(os.getenv("MYSQL_POOL_RECYCLE", "3600"))
+
+
+class MySQLPoolTimeout(Exception):
+    """Raised when no pooled connection becomes available before the checkout timeout"""
+
+
+class PooledConnection:
+    """Proxy around a raw MySQL connection; close() hands it back to the pool"""
+
+    def __init__(self, pool, raw, created_at: float):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw, self._created_at)
+
+
+class MySQLConnectionPool:
+    """Thread-safe MySQL connection pool with overflow, health ping and recycling"""
+
+    def __init__(self, config: Dict, pool_size: int = 5, max_overflow: int = 10,
+                 timeout: float = 5.0, recycle: int = 3600):
+        self.config = config
+        self.pool_size = max(1, pool_size)
+        self.max_overflow = max(0, max_overflow)
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = deque()  # (raw_connection, created_at)
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'exhausted': 0,
+            'connects': 0,
+            'connect_errors': 0,
+            'recycled': 0,
+            'ping_failures': 0
+        }
+
+    def _connect(self):
+        try:
+            raw = mysql.connector.connect(**self.config)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._stats['connect_errors'] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['connects'] += 1
+        return raw, time.time()
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _record_wait(self, waited_for: float):
+        """Caller holds self._cond"""
+        self._stats['waits'] += 1
+        self._stats['wait_time_total'] += waited_for
+        self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited_for)
+
+    def _discard(self, raw):
+        self._close_quietly(raw)
+        with self._cond:
+            self._opened -= 1
+            self._cond.notify()
+
+    def acquire(self) -> PooledConnection:
+        """Check out a connection, waiting up to `timeout` seconds when the pool is exhausted"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._opened < self.pool_size + self.max_overflow:
+                    self._opened += 1
+                    raw, created_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['exhausted'] += 1
+                    # Timed-out checkouts are the worst contention, so they count as waits too
+                    if waited:
+                        self._record_wait(time.monotonic() - started)
+                    raise MySQLPoolTimeout(
+                        f"MySQL pool exhausted ({self._opened} connections in use)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._stats['checkouts'] += 1
+            if waited:
+                self._record_wait(time.monotonic() - started)
+
+        # Stale or dead connections are replaced in place, keeping their pool slot
+        if raw is not None:
+            if self.recycle and time.time() - created_at > self.recycle:
+                with self._cond:
+                    self._stats['recycled'] += 1
+                self._close_quietly(raw)
+                raw = None
+            else:
+                try:
+                    raw.ping(reconnect=False)
+                except Exception:
+                    with self._cond:
+                        self._stats['ping_failures'] += 1
+                    self._close_quietly(raw)
+                    raw = None
+
+        if raw is None:
+            raw, created_at = self._connect()
+
+        return PooledConnection(self, raw, created_at)
+
+    def release(self, raw, created_at: float):
+        """Return a connection to the idle set, closing it if it is surplus or broken"""
+        try:
+            raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+
+        with self._cond:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((raw, created_at))
+                self._cond.notify()
+                return
+        self._discard(raw)
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones are closed on release)"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for raw, _ in idle:
+            self._discard(raw)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'timeout': self.timeout,
+                'recycle': self.recycle,
+                'opened': self._opened,
+                'idle': len(self._idle),
+                'in_use': self._opened - len(self._idle)
+            })
+        stats['wait_time_avg'] = (
+            stats['wait_time_total'] / stats['waits'] if stats['waits'] else 0.0
+        )
+        return stats
+
+
+mysql_pool = MySQLConnectionPool(
+    MYSQL_CONFIG,
+    pool_size=MYSQL_POOL_SIZE,
+    max_overflow=MYSQL_POOL_MAX_OVERFLOW,
+    timeout=MYSQL_POOL_TIMEOUT,
+    recycle=MYSQL_POOL_RECYCLE
+)
 
 
 def get_mysql_connection():
-    """Create and return a MySQL connection"""
+    """Check out a pooled MySQL connection (close() returns it to the pool)"""
     try:
-        connection = mysql.connector.connect(**MYSQL_CONFIG)
-        return connection
-    except Error as e:
+        return mysql_pool.acquire()
+    except (Error, MySQLPoolTimeout) as e:
         print(f"Error connecting to MySQL: {e}")
         return None
 
 
-def create_workout_stats_table():
-    """Create the workout_stats table if it doesn't exist"""
+@contextmanager
+def mysql_connection():
+    """Context manager yielding a pooled MySQL connection, or None if unavailable"""
+    connection = get_mysql_connection()
     try:
-        connection = get_mysql_connection()
-        if not connection:
+        yield connection
+    finally:
+        if connection:
+            connection.close()
+
+
+# Background job queue for post-response side effects
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "200"))
+JOB_QUEUE_OVERFLOW = os.getenv("JOB_QUEUE_OVERFLOW", "block")  # block, drop, caller_runs
+JOB_SUBMIT_TIMEOUT = float(os.getenv("JOB_SUBMIT_TIMEOUT", "2"))
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "30"))
+JOB_TYPE_LIMITS = {
+    "save_to_mysql": 3
+}
+
+
+class BackgroundJobQueue:
+    """Fixed-size worker pool with a bounded queue, overflow policy and per-type concurrency limits"""
+
+    _STOP = object()
+
+    def __init__(self, workers: int = 4, max_queue: int = 200, overflow: str = "block",
+                 submit_timeout: float = 2.0, type_limits: Dict = None):
+        if overflow not in ("block", "drop", "caller_runs"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.workers = max(1, workers)
+        self.overflow = overflow
+        self.submit_timeout = submit_timeout
+        self.type_limits = dict(type_limits or {})
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._lock = threading.Condition()
+        self._running = {}   # job_type -> jobs currently executing
+        self._deferred = {}  # job_type -> jobs parked because the type is at its limit
+        self._pending = 0
+        self._accepting = True
+        self._threads = []
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'ran_inline': 0,
+            'max_depth': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'run_time_total': 0.0,
+            'run_time_max': 0.0
+        }
+        self._by_type = {}
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, job_type: str, func, *args, **kwargs) -> bool:
+        """Queue func(*args, **kwargs); returns False if the job was dropped"""
+        self.start()
+        job = (job_type, func, args, kwargs, time.monotonic())
+
+        with self._lock:
+            if not self._accepting:
+                self._stats['rejected'] += 1
+                print(f"⚠️ Job queue shutting down, dropped {job_type}")
+                return False
+            self._pending += 1
+            self._stats['submitted'] += 1
+
+        try:
+            if self.overflow == "block":
+                self._queue.put(job, timeout=self.submit_timeout)
+            else:
+                self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._pending -= 1
+                self._lock.notify_all()
+            if self.overflow == "caller_runs":
+                with self._lock:
+                    self._stats['ran_inline'] += 1
+                self._run(job)
+                return True
+            with self._lock:
+                self._stats['rejected'] += 1
+            print(f"⚠️ Job queue full, dropped {job_type}")
             return False
 
-        cursor = connection.cursor()
+        with self._lock:
+            self._stats['max_depth'] = max(self._stats['max_depth'], self._queue.qsize())
+        return True
 
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS workout_stats (
-            id VARCHAR(36) PRIMARY KEY,
-            user_id VARCHAR(100) NOT NULL,
-            session_id VARCHAR(100) NOT NULL,
-            exercise_name VARCHAR(200) NOT NULL,
-            exercise_type VARCHAR(50),
-            weight DECIMAL(10, 2),
-            weight_unit VARCHAR(10),
-            reps INT,
-            sets INT,
-            duration INT,
-            duration_unit VARCHAR(20),
-            distance DECIMAL(10, 2),
-            distance_unit VARCHAR(10),
-            calories INT,
-            notes TEXT,
-            workout_date DATE NOT NULL,
-            create_time BIGINT,
-            create_date DATETIME,
-            INDEX idx_user_date (user_id, workout_date),
-            INDEX idx_session (session_id),
-            INDEX idx_exercise (exercise_name)
-        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-        """
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is self._STOP:
+                return
+            job_type = job[0]
+            limit = self.type_limits.get(job_type)
+
+            with self._lock:
+                if limit and self._running.get(job_type, 0) >= limit:
+                    self._deferred.setdefault(job_type, deque()).append(job)
+                    continue
+                self._running[job_type] = self._running.get(job_type, 0) + 1
+
+            # Keep draining parked jobs of the same type while holding its slot
+            while job is not None:
+                self._run(job)
+                with self._lock:
+                    self._pending -= 1
+                    parked = self._deferred.get(job_type)
+                    if parked:
+                        job = parked.popleft()
+                    else:
+                        job = None
+                        self._running[job_type] -= 1
+                    self._lock.notify_all()
+
+    def _run(self, job):
+        job_type, func, args, kwargs, enqueued_at = job
+        started = time.monotonic()
+        waited = started - enqueued_at
+        ok = True
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            ok = False
+            print(f"⚠️ Background job {job_type} failed: {e}")
+        elapsed = time.monotonic() - started
+
+        with self._lock:
+            self._stats['completed' if ok else 'failed'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+            self._stats['run_time_total'] += elapsed
+            self._stats['run_time_max'] = max(self._stats['run_time_max'], elapsed)
+            by_type = self._by_type.setdefault(job_type, {'count': 0, 'failed': 0, 'run_time_total': 0.0})
+            by_type['count'] += 1
+            by_type['failed'] += 0 if ok else 1
+            by_type['run_time_total'] += elapsed
+
+    def shutdown(self, timeout: float = 30.0) -> bool:
+        """Stop accepting jobs and wait up to `timeout` seconds for queued work to finish"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._accepting = False
+            while self._pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+            drained = self._pending == 0
+            threads = list(self._threads)
 
-        cursor.execute(create_table_query)
-        connection.commit()
-        cursor.close()
-        connection.close()
+        if not drained:
+            print(f"⚠️ Job queue shutdown with {self._pending} job(s) unfinished")
+        for _ in threads:
+            try:
+                self._queue.put_nowait(self._STOP)
+            except queue.Full:
+                break
+        return drained
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            finished = stats['completed'] + stats['failed']
+            stats.update({
+                'workers': self.workers,
+                'overflow': self.overflow,
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'pending': self._pending,
+                'running': dict(self._running),
+                'deferred': {k: len(v) for k, v in self._deferred.items()},
+                'wait_time_avg': stats['wait_time_total'] / finished if finished else 0.0,
+                'run_time_avg': stats['run_time_total'] / finished if finished else 0.0,
+                'by_type': {k: dict(v) for k, v in self._by_type.items()}
+            })
+        return stats
+
+
+background_jobs = BackgroundJobQueue(
+    workers=JOB_WORKERS,
+    max_queue=JOB_QUEUE_SIZE,
+    overflow=JOB_QUEUE_OVERFLOW,
+    submit_timeout=JOB_SUBMIT_TIMEOUT,
+    type_limits=JOB_TYPE_LIMITS
+)
+atexit.register(background_jobs.shutdown, JOB_DRAIN_TIMEOUT)
+
+
+# Server-sent stats events (/events)
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "100"))
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "50"))
+# Whole-process cap; under the threaded server every open stream is a request thread
+EVENTS_MAX_SUBSCRIBERS_TOTAL = int(os.getenv("EVENTS_MAX_SUBSCRIBERS_TOTAL", "200"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_RETRY_MS = int(os.getenv("EVENTS_RETRY_MS", "3000"))
+
+
+class EventBroker:
+    """Per-user event fan-out for SSE subscribers.
+
+    Publishing appends to the user's bounded ring and wakes its condition, so it costs O(1) no matter
+    how many tabs are open; each subscriber reads the ring from its own cursor. The broker runs no
+    threads of its own, but wait() parks the calling thread, so under the threaded Flask server every
+    idle /events subscriber still holds a request thread until it disconnects. Only serve-async
+    (wait_async) keeps idle subscribers off threads; max_total bounds the threads either way.
+    """
+
+    def __init__(self, history: int = 100, max_subscribers: int = 50, max_total: int = 200):
+        self.history = max(1, history)
+        self.max_subscribers = max(1, max_subscribers)
+        self.max_total = max(1, max_total)
+        self._total = 0
+        self._lock = threading.Lock()
+        self._channels = {}  # user_id -> {'events', 'last_id', 'cond', 'subscribers'}
+        self._stats = {
+            'published': 0,
+            'subscribed': 0,
+            'rejected': 0,
+            'resyncs': 0
+        }
+
+    def _channel(self, user_id: str) -> Dict:
+        channel = self._channels.get(user_id)
+        if channel is None:
+            channel = self._channels[user_id] = {
+                'events': deque(maxlen=self.history),
+                'last_id': 0,
+                'cond': threading.Condition(self._lock),
+                'waiters': set(),  # (loop, asyncio.Event) of async subscribers
+                'subscribers': 0
+            }
+        return channel
+
+    def _resolve(self, channel: Dict, after_id: int) -> tuple:
+        """Clamp a subscriber cursor to the ring; missed=True means the client should resync"""
+        if after_id > channel['last_id']:
+            # Cursor from before a restart
+            self._stats['resyncs'] += 1
+            return channel['last_id'], True
+        oldest = channel['events'][0]['id'] if channel['events'] else channel['last_id'] + 1
+        if after_id < oldest - 1:
+            self._stats['resyncs'] += 1
+            return oldest - 1, True
+        return after_id, False
+
+    def publish(self, user_id: str, event_type: str, data: Dict) -> int:
+        with self._lock:
+            channel = self._channel(user_id)
+            channel['last_id'] += 1
+            channel['events'].append({'id': channel['last_id'], 'type': event_type, 'data': data})
+            channel['cond'].notify_all()
+            for loop, waiter in channel['waiters']:
+                loop.call_soon_threadsafe(waiter.set)
+            self._stats['published'] += 1
+            return channel['last_id']
+
+    def subscribe(self, user_id: str, last_event_id: Optional[int] = None) -> tuple:
+        """Register a subscriber; returns (cursor, missed). Raises OverflowError when the user is full"""
+        with self._lock:
+            channel = self._channel(user_id)
+            if channel['subscribers'] >= self.max_subscribers:
+                self._stats['rejected'] += 1
+                raise OverflowError(f"too many event subscribers for {user_id}")
+            if self._total >= self.max_total:
+                self._stats['rejected'] += 1
+                raise OverflowError("too many event subscribers on this server")
+            channel['subscribers'] += 1
+            self._total += 1
+            self._stats['subscribed'] += 1
+            if last_event_id is None:
+                return channel['last_id'], False
+            return self._resolve(channel, last_event_id)
+
+    def unsubscribe(self, user_id: str):
+        with self._lock:
+            channel = self._channels.get(user_id)
+            if channel and channel['subscribers'] > 0:
+                channel['subscribers'] -= 1
+                self._total -= 1
+
+    def wait(self, user_id: str, after_id: int, timeout: float) -> tuple:
+        """Block up to timeout for events after after_id; returns (events, missed, new cursor)"""
+        with self._lock:
+            channel = self._channel(user_id)
+            after_id, missed = self._resolve(channel, after_id)
+            if not missed and channel['last_id'] <= after_id:
+                channel['cond'].wait(timeout)
+                after_id, missed = self._resolve(channel, after_id)
+            events = [e for e in channel['events'] if e['id'] > after_id]
+            return events, missed, events[-1]['id'] if events else after_id
+
+    async def wait_async(self, user_id: str, after_id: int, timeout: float) -> tuple:
+        """Coroutine twin of wait(): parks on an asyncio.Event instead of a thread"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            channel = self._channel(user_id)
+            after_id, missed = self._resolve(channel, after_id)
+            if missed or channel['last_id'] > after_id:
+                events = [e for e in channel['events'] if e['id'] > after_id]
+                return events, missed, events[-1]['id'] if events else after_id
+            channel['waiters'].add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                channel['waiters'].discard(waiter)
+        return self.wait(user_id, after_id, 0)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = {u: c['subscribers'] for u, c in self._channels.items() if c['subscribers']}
+            stats['total_subscribers'] = self._total
+            stats['max_total'] = self.max_total
+        return stats
+
+
+event_broker = EventBroker(
+    history=EVENTS_HISTORY,
+    max_subscribers=EVENTS_MAX_SUBSCRIBERS,
+    max_total=EVENTS_MAX_SUBSCRIBERS_TOTAL
+)
+
+
+# Circuit breakers for outbound Ollama / RAGFlow calls
+CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", "60"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "20"))
+CIRCUIT_SLOW_CALL_RATE = float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8"))
+CIRCUIT_BASE_BACKOFF = float(os.getenv("CIRCUIT_BASE_BACKOFF", "5"))
+CIRCUIT_MAX_BACKOFF = float(os.getenv("CIRCUIT_MAX_BACKOFF", "120"))
+
+# Per-call (connect, read) timeouts for Ollama / RAGFlow
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "60"))
+RAGFLOW_CONNECT_TIMEOUT = float(os.getenv("RAGFLOW_CONNECT_TIMEOUT", "5"))
+RAGFLOW_READ_TIMEOUT = float(os.getenv("RAGFLOW_READ_TIMEOUT", "120"))
+
+# Exceptions that mean the backend itself is unhealthy (as opposed to a bad request)
+BACKEND_ERRORS = (
+    requests.exceptions.RequestException,
+    ConnectionError,
+    TimeoutError
+) + ((aiohttp.ClientError,) if aiohttp else ())
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Per-backend closed/open/half-open circuit driven by error rate and slow-call rate"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    class _Outcome:
+        def __init__(self):
+            self.failed = False
+
+        def fail(self):
+            """Mark the guarded call as a backend failure (e.g. HTTP 5xx) without raising"""
+            self.failed = True
+
+    def __init__(self, name: str, window: float = 60, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_call_seconds: float = 20, slow_call_rate: float = 0.8,
+                 base_backoff: float = 5, max_backoff: float = 120):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._calls = deque()  # (timestamp, failed, slow)
+        self._state = self.CLOSED
+        self._open_until = 0.0
+        self._consecutive_opens = 0
+        self._probe_in_flight = False
+        self._stats = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() >= self._open_until:
+                return self.HALF_OPEN
+            return self._state
+
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half-open state only one probe is allowed"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() < self._open_until:
+                    self._stats['rejected'] += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self._stats['rejected'] += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record(self, failed: bool, latency: float):
+        now = time.monotonic()
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['failures'] += 1 if failed else 0
+            self._stats['slow_calls'] += 1 if slow else 0
+
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._trip(now)
+                else:
+                    self._close()
+                return
+
+            self._calls.append((now, failed, slow))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            if len(self._calls) >= self.min_calls:
+                total = len(self._calls)
+                failures = sum(1 for _, f, _ in self._calls if f)
+                slow_calls = sum(1 for _, _, sl in self._calls if sl)
+                if failures / total >= self.error_rate or slow_calls / total >= self.slow_call_rate:
+                    self._trip(now)
+
+    def release(self):
+        """Give back a half-open probe slot without judging the backend"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _trip(self, now: float):
+        # Jittered exponential backoff so recovering backends are not hit in lockstep
+        self._consecutive_opens += 1
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._consecutive_opens - 1))
+        backoff *= random.uniform(0.8, 1.2)
+        self._state = self.OPEN
+        self._open_until = now + backoff
+        self._calls.clear()
+        self._stats['opened'] += 1
+        print(f"🔌 Circuit '{self.name}' opened for {backoff:.1f}s")
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._consecutive_opens = 0
+        self._calls.clear()
+        print(f"🔌 Circuit '{self.name}' closed")
+
+    @contextmanager
+    def guard(self):
+        """Run a backend call under the breaker; raises CircuitOpenError when the circuit is open"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+        outcome = self._Outcome()
+        started = time.monotonic()
+        try:
+            yield outcome
+        except BACKEND_ERRORS:
+            self.record(True, time.monotonic() - started)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(outcome.failed, time.monotonic() - started)
+
+    def call(self, func, *args, **kwargs):
+        with self.guard():
+            return func(*args, **kwargs)
+
+    def stats(self) -> Dict:
+        state = self.state
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'state': state,
+                'window_calls': len(self._calls),
+                'open_for': max(0.0, self._open_until - time.monotonic()) if state == self.OPEN else 0.0
+            })
+        return stats
+
+
+def _make_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        window=CIRCUIT_WINDOW,
+        min_calls=CIRCUIT_MIN_CALLS,
+        error_rate=CIRCUIT_ERROR_RATE,
+        slow_call_seconds=CIRCUIT_SLOW_CALL_SECONDS,
+        slow_call_rate=CIRCUIT_SLOW_CALL_RATE,
+        base_backoff=CIRCUIT_BASE_BACKOFF,
+        max_backoff=CIRCUIT_MAX_BACKOFF
+    )
+
+
+ollama_breaker = _make_breaker("ollama")
+ragflow_breaker = _make_breaker("ragflow")
+circuit_breakers = {"ollama": ollama_breaker, "ragflow": ragflow_breaker}
+
+
+# Shared outbound HTTP client (Ollama, RAGFlow REST and the RAGFlow SDK)
+OUTBOUND_POOL_HOSTS = int(os.getenv("OUTBOUND_POOL_HOSTS", "10"))
+OUTBOUND_POOL_MAXSIZE = int(os.getenv("OUTBOUND_POOL_MAXSIZE", "32"))
+OUTBOUND_CONNECT_TIMEOUT = float(os.getenv("OUTBOUND_CONNECT_TIMEOUT", "5"))
+OUTBOUND_READ_TIMEOUT = float(os.getenv("OUTBOUND_READ_TIMEOUT", "60"))
+OUTBOUND_LATENCY_WINDOW = int(os.getenv("OUTBOUND_LATENCY_WINDOW", "500"))
+
+
+class OutboundHTTP:
+    """One keep-alive connection pool per host for every outbound call, with per-host metrics.
+
+    Calls without an explicit timeout get (OUTBOUND_CONNECT_TIMEOUT, OUTBOUND_READ_TIMEOUT). Latency is
+    time to response headers; a streamed response counts as in flight until it is closed.
+    """
+
+    def __init__(self, pool_hosts: int, pool_maxsize: int, connect_timeout: float, read_timeout: float,
+                 latency_window: int = 500):
+        self.timeout = (connect_timeout, read_timeout)
+        self.latency_window = latency_window
+        # urllib3 keys its pools by scheme/host/port, so each backend gets its own pool of pool_maxsize
+        self._adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_hosts,
+            pool_maxsize=pool_maxsize,
+            max_retries=0  # Retries are the caller's decision (see AIWorkoutDetector)
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host: str) -> Dict:
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = self._hosts[host] = {
+                'requests': 0, 'errors': 0, 'in_flight': 0, 'peak_in_flight': 0,
+                'latencies': deque(maxlen=self.latency_window)
+            }
+        return stats
+
+    def begin(self, host: str) -> float:
+        with self._lock:
+            stats = self._host(host)
+            stats['requests'] += 1
+            stats['in_flight'] += 1
+            stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+        return time.monotonic()
+
+    def responded(self, host: str, started: float, status: Optional[int]):
+        """Record the outcome of a call; status None means it raised before any response"""
+        with self._lock:
+            stats = self._host(host)
+            if status is None or status >= 500:
+                stats['errors'] += 1
+            if status is not None:
+                stats['latencies'].append(time.monotonic() - started)
+
+    def end(self, host: str):
+        with self._lock:
+            self._host(host)['in_flight'] -= 1
+
+    def request(self, method: str, url: str, timeout=None, stream: bool = False, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+        started = self.begin(host)
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.timeout, stream=stream, **kwargs)
+        except BaseException as e:
+            if isinstance(e, BACKEND_ERRORS):
+                self.responded(host, started, None)
+            self.end(host)
+            raise
+        self.responded(host, started, response.status_code)
+        if not stream:
+            self.end(host)
+            return response
+
+        # The body is still being read; leave the call in flight until the response is closed
+        close_response = response.close
+        released = []
+
+        def close():
+            # A hedged leg's response can be closed by the race and by its own generator at once
+            close_response()
+            with self._lock:
+                first = not released
+                released.append(True)
+            if first:
+                self.end(host)
+        response.close = close
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hosts = {}
+            for host, stats in self._hosts.items():
+                latencies = sorted(stats['latencies'])
+                hosts[host] = {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'in_flight': stats['in_flight'],
+                    'peak_in_flight': stats['peak_in_flight'],
+                    'latency_avg_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+                    'latency_p50_ms': 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+                    'latency_p95_ms': 1000 * latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+                }
+        pools = {}
+        for key in self._adapter.poolmanager.pools.keys():
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                # connections_opened well below requests means keep-alive is doing its job
+                pools[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests
+                }
+        return {'hosts': hosts, 'pools': pools}
+
+
+outbound_http = OutboundHTTP(
+    pool_hosts=OUTBOUND_POOL_HOSTS,
+    pool_maxsize=OUTBOUND_POOL_MAXSIZE,
+    connect_timeout=OUTBOUND_CONNECT_TIMEOUT,
+    read_timeout=OUTBOUND_READ_TIMEOUT,
+    latency_window=OUTBOUND_LATENCY_WINDOW
+)
+
+
+class PooledRAGFlow(RAGFlow):
+    """RAGFlow SDK client whose REST calls (sessions, chats, updates) go through outbound_http"""
+
+    def post(self, path, json=None, stream=False, files=None):
+        return outbound_http.post(self.api_url + path, json=json, headers=self.authorization_header,
+                                  stream=stream, files=files)
+
+    def get(self, path, params=None, json=None):
+        return outbound_http.get(self.api_url + path, params=params, headers=self.authorization_header, json=json)
+
+    def delete(self, path, json):
+        return outbound_http.delete(self.api_url + path, json=json, headers=self.authorization_header)
+
+    def put(self, path, json):
+        return outbound_http.put(self.api_url + path, json=json, headers=self.authorization_header)
+
+
+try:
+    rag = PooledRAGFlow(api_key=API_KEY, base_url=BASE_URL)
+    assistant = rag.list_chats(id=CHAT_ID)[0]
+    print("✅ RAGFlow client initialized")
+except Exception as e:
+    print(f"⚠️ Warning initializing clients: {e}")
+    assistant = None
+
+
+def create_workout_stats_table():
+    """Create the workout_stats table if it doesn't exist"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return False
+
+            cursor = connection.cursor()
+
+            create_table_query = """
+            CREATE TABLE IF NOT EXISTS workout_stats (
+                id VARCHAR(36) PRIMARY KEY,
+                user_id VARCHAR(100) NOT NULL,
+                session_id VARCHAR(100) NOT NULL,
+                exercise_name VARCHAR(200) NOT NULL,
+                exercise_type VARCHAR(50),
+                weight DECIMAL(10, 2),
+                weight_unit VARCHAR(10),
+                reps INT,
+                sets INT,
+                duration INT,
+                duration_unit VARCHAR(20),
+                distance DECIMAL(10, 2),
+                distance_unit VARCHAR(10),
+                calories INT,
+                notes TEXT,
+                workout_date DATE NOT NULL,
+                create_time BIGINT NOT NULL DEFAULT 0,
+                create_date DATETIME,
+                INDEX idx_user_date (user_id, workout_date),
+                INDEX idx_session (session_id),
+                INDEX idx_exercise (exercise_name)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+            cursor.execute(create_table_query)
+
+            # The keyset comparison skips NULL create_time rows, so older tables get it backfilled to 0
+            cursor.execute("""
+                SELECT is_nullable FROM information_schema.columns
+                WHERE table_schema = DATABASE() AND table_name = 'workout_stats' AND column_name = 'create_time'
+            """)
+            if cursor.fetchone()[0] == 'YES':
+                cursor.execute("UPDATE workout_stats SET create_time = 0 WHERE create_time IS NULL")
+                cursor.execute("ALTER TABLE workout_stats MODIFY create_time BIGINT NOT NULL DEFAULT 0")
+                print("🗂️ Made workout_stats.create_time NOT NULL")
+
+            # Keyset pagination indexes, added to tables created before they existed
+            cursor.execute("""
+                SELECT DISTINCT index_name FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = 'workout_stats'
+            """)
+            existing = {row[0] for row in cursor.fetchall()}
+            for index_name, columns in WORKOUT_KEYSET_INDEXES.items():
+                if index_name not in existing:
+                    cursor.execute(f"ALTER TABLE workout_stats ADD INDEX {index_name} ({columns})")
+                    print(f"🗂️ Added index {index_name} on workout_stats")
+
+            connection.commit()
+            cursor.close()
         print("✅ Workout stats table created/verified")
         return True
 
@@ -103,37 +1016,669 @@ def create_workout_stats_table():
         return False
 
 
+def create_data_version_table():
+    """Create the user_data_version table (one counter per user, bumped on every workout write)"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return False
+
+            cursor = connection.cursor()
+
+            create_table_query = """
+            CREATE TABLE IF NOT EXISTS user_data_version (
+                user_id VARCHAR(100) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0,
+                update_time BIGINT
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+            cursor.execute(create_table_query)
+            connection.commit()
+            cursor.close()
+        print("✅ User data version table created/verified")
+        return True
+
+    except Exception as e:
+        print(f"Error creating user_data_version table: {e}")
+        return False
+
+
+def create_workout_change_table():
+    """Create the append-only workout_change log read by /workout-stats/changes"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return False
+
+            cursor = connection.cursor()
+
+            create_table_query = """
+            CREATE TABLE IF NOT EXISTS workout_change (
+                seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+                user_id VARCHAR(100) NOT NULL,
+                workout_id VARCHAR(36) NOT NULL,
+                op VARCHAR(10) NOT NULL,
+                workout LONGTEXT,
+                create_time BIGINT,
+                INDEX idx_user_seq (user_id, seq)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+            cursor.execute(create_table_query)
+            connection.commit()
+            cursor.close()
+        print("✅ Workout change log table created/verified")
+        return True
+
+    except Exception as e:
+        print(f"Error creating workout_change table: {e}")
+        return False
+
+
+def create_tables():
+    """Create/verify every table the app writes to (workout_stats first, the others derive from it)"""
+    create_workout_stats_table()
+    create_workout_rollup_table()
+    create_personal_record_table()
+    create_data_version_table()
+    create_workout_change_table()
+    create_conversation_message_table()
+
+
+# Each listing endpoint gets an index that covers its filter plus the keyset sort
+WORKOUT_KEYSET_INDEXES = {
+    "idx_user_keyset": "user_id, workout_date, create_time, id",
+    "idx_user_type_keyset": "user_id, exercise_type, workout_date, create_time, id",
+    "idx_user_exercise_keyset": "user_id, exercise_name, workout_date, create_time, id"
+}
+
+
+def create_conversation_message_table():
+    """Create the append-only conversation_message table if it doesn't exist"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return False
+
+            cursor = connection.cursor()
+
+            create_table_query = """
+            CREATE TABLE IF NOT EXISTS conversation_message (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                dialog_id VARCHAR(100) NOT NULL,
+                seq INT NOT NULL,
+                role VARCHAR(20) NOT NULL,
+                content LONGTEXT,
+                create_time BIGINT,
+                create_date DATETIME,
+                UNIQUE KEY uk_dialog_seq (dialog_id, seq)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+            cursor.execute(create_table_query)
+            connection.commit()
+            cursor.close()
+        print("✅ Conversation message table created/verified")
+        return True
+
+    except Exception as e:
+        print(f"Error creating conversation_message table: {e}")
+        return False
+
+
+def create_workout_rollup_table():
+    """Create the workout_daily_rollup table, backfilling it from workout_stats when it starts empty"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return False
+
+            cursor = connection.cursor(buffered=True)
+
+            create_table_query = """
+            CREATE TABLE IF NOT EXISTS workout_daily_rollup (
+                user_id VARCHAR(100) NOT NULL,
+                workout_date DATE NOT NULL,
+                exercise_type VARCHAR(50) NOT NULL DEFAULT '',
+                exercise_name VARCHAR(200) NOT NULL,
+                weight_unit VARCHAR(10) NOT NULL DEFAULT '',
+                workout_count INT NOT NULL DEFAULT 0,
+                set_count INT NOT NULL DEFAULT 0,
+                rep_total INT,
+                weight_sum DECIMAL(14, 2),
+                weight_count INT NOT NULL DEFAULT 0,
+                max_weight DECIMAL(10, 2),
+                volume DECIMAL(16, 2),
+                duration_total INT,
+                distance_total DECIMAL(14, 2),
+                PRIMARY KEY (user_id, workout_date, exercise_type, exercise_name, weight_unit)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+            cursor.execute(create_table_query)
+            connection.commit()
+
+            cursor.execute("SELECT 1 FROM workout_daily_rollup LIMIT 1")
+            rollup_empty = cursor.fetchone() is None
+            cursor.execute("SELECT 1 FROM workout_stats LIMIT 1")
+            needs_backfill = rollup_empty and cursor.fetchone() is not None
+            cursor.close()
+
+        if needs_backfill:
+            rebuild_daily_rollup()
+        print("✅ Workout daily rollup table created/verified")
+        return True
+
+    except Exception as e:
+        print(f"Error creating workout_daily_rollup table: {e}")
+        return False
+
+
+def create_personal_record_table():
+    """Create the personal_record table, backfilling it from workout_stats when it starts empty"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return False
+
+            cursor = connection.cursor(buffered=True)
+
+            create_table_query = """
+            CREATE TABLE IF NOT EXISTS personal_record (
+                user_id VARCHAR(100) NOT NULL,
+                exercise_name VARCHAR(200) NOT NULL,
+                record_type VARCHAR(20) NOT NULL,
+                unit VARCHAR(32) NOT NULL DEFAULT '',
+                record_value DECIMAL(16, 4) NOT NULL,
+                previous_value DECIMAL(16, 4),
+                workout_id VARCHAR(36),
+                workout_date DATE,
+                update_time BIGINT,
+                PRIMARY KEY (user_id, exercise_name, record_type, unit)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+            cursor.execute(create_table_query)
+            connection.commit()
+
+            cursor.execute("SELECT 1 FROM personal_record LIMIT 1")
+            records_empty = cursor.fetchone() is None
+            cursor.execute("SELECT 1 FROM workout_stats LIMIT 1")
+            needs_backfill = records_empty and cursor.fetchone() is not None
+            cursor.close()
+
+        if needs_backfill:
+            rebuild_personal_records()
+        print("✅ Personal record table created/verified")
+        return True
+
+    except Exception as e:
+        print(f"Error creating personal_record table: {e}")
+        return False
+
+
+# Workout detection: deterministic fast path before the LLM
+WORKOUT_FAST_PATH = os.getenv("WORKOUT_FAST_PATH", "1") == "1"
+
+
+class RuleBasedWorkoutParser:
+    """Deterministic extractor for the regular workout phrasings listed in the README.
+
+    parse() returns workouts in the raw shape accepted by AIWorkoutDetector._validate_workouts,
+    or None when the message is not fully understood and should go to the LLM instead.
+    """
+
+    # (pattern, canonical exercise name, exercise type); specific phrases come first
+    EXERCISE_ALIASES = [
+        (r"bench(?:\s*press(?:ed|ing)?)?|benched|benching", "bench press", "strength"),
+        (r"(?:overhead|shoulder|military)\s+press(?:ed)?|ohp", "shoulder press", "strength"),
+        (r"leg\s+press(?:ed)?", "leg press", "strength"),
+        (r"(?:back\s+|front\s+)?squat(?:s|ted|ting)?", "squat", "strength"),
+        (r"dead\s*lift(?:s|ed|ing)?", "deadlift", "strength"),
+        (r"(?:barbell\s+|bent[\s-]over\s+)?rows?", "bent over row", "strength"),
+        (r"(?:bicep\s+|barbell\s+)?curl(?:s|ed)?", "bicep curl", "strength"),
+        (r"pull[\s-]?ups?|chin[\s-]?ups?", "pull-up", "strength"),
+        (r"push[\s-]?ups?", "push-up", "strength"),
+        (r"dips", "dip", "strength"),
+        (r"lunges?", "lunge", "strength"),
+        (r"ran|runs?|running|jog(?:s|ged|ging)?", "running", "cardio"),
+        (r"cycl(?:e|ed|ing)|bik(?:e|ed|ing)", "cycling", "cardio"),
+        (r"swam|swim(?:s|ming)?", "swimming", "cardio"),
+        (r"rowed|rowing", "rowing", "cardio"),
+        (r"walk(?:s|ed|ing)?", "walking", "cardio"),
+        (r"hik(?:e|ed|ing)", "hiking", "cardio"),
+        (r"elliptical", "elliptical", "cardio"),
+        (r"treadmill", "treadmill", "cardio"),
+    ]
+    BODYWEIGHT = {"pull-up", "push-up", "dip", "lunge"}
+
+    WEIGHT_UNITS = {"kg": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg", "kilogram": "kg",
+                    "kilograms": "kg", "lb": "lbs", "lbs": "lbs", "pound": "lbs", "pounds": "lbs"}
+
+    # Questions, plans, goals, negations, the past and other people's workouts are not logs
+    NOT_A_LOG = re.compile(
+        r"\?|^\s*(?:how|what|why|when|should|can|could|would|will|is|are|do|does)\b"
+        r"|\b(?:plan|planning|want to|going to|gonna|tomorrow|next week)\b"
+        r"|\b(?:not|never|no|cannot|unable|failed to)\b|n't\b|n’t\b"
+        r"|\b(?:goal|target|aim|aiming|hope|hoping|dream|someday|one day)\b"
+        r"|\b(?:pr|pb|max|best|record)\s+(?:is|was)\b|\bis my\b"
+        r"|\bused to\b|\b(?:years?|months?) ago\b|\bin (?:years|months|ages)\b"
+        r"|\b(?:he|she|they|someone|somebody)\b"
+        r"|\bmy\s+(?:friend|buddy|mate|brother|sister|wife|husband|partner|girlfriend|boyfriend"
+        r"|dad|father|mom|mum|mother|son|daughter|coach|trainer)s?\b",
+        re.IGNORECASE
+    )
+    # Words a confident clause may contain besides exercises and metrics; anything else goes to the LLM
+    FILLER_WORDS = frozenset("""
+        i i've i'm just did do done got hit went managed completed finished today tonight yesterday
+        this morning afternoon evening earlier at for in on of the a an with and my x about around
+        roughly total new pr pb single session day leg chest back arms shoulders workout gym
+        dumbbell dumbbells barbell set
+    """.split())
+    FILLER_TOKEN = re.compile(r"[a-z'’]+", re.IGNORECASE)
+    CLAUSE_SPLIT = re.compile(r"[;\n]|,|\.\s|\band\b|\bthen\b|\bplus\b", re.IGNORECASE)
+    NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+    def __init__(self):
+        self._exercises = [
+            (re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE), name, etype)
+            for pattern, name, etype in self.EXERCISE_ALIASES
+        ]
+        num = r"(\d+(?:\.\d+)?)"
+        # Order matters: earlier patterns claim their text before later ones run
+        self._metrics = [
+            ("weight", re.compile(rf"{num}\s*(kgs?|kilos?|kilograms?|lbs?|pounds?)\b", re.IGNORECASE)),
+            ("sets_of_reps", re.compile(r"(\d+)\s*sets?\s*(?:of|x|×)\s*(\d+)(?:\s*reps?)?\b", re.IGNORECASE)),
+            ("sets_x_reps", re.compile(r"\b(\d+)\s*[x×]\s*(\d+)\b", re.IGNORECASE)),
+            ("reps", re.compile(r"(\d+)\s*(?:reps?|repetitions?)\b", re.IGNORECASE)),
+            ("sets", re.compile(r"(\d+)\s*sets?\b", re.IGNORECASE)),
+            ("duration", re.compile(rf"{num}\s*-?\s*(minutes?|mins?|hours?|hrs?|hr|h)\b", re.IGNORECASE)),
+            ("distance", re.compile(rf"{num}\s*-?\s*(km|kms|kilomet(?:er|re)s?|miles?|mi|met(?:er|re)s?|m)\b", re.IGNORECASE)),
+            ("calories", re.compile(r"(\d+)\s*(?:kcal|calories|cals?)\b", re.IGNORECASE)),
+        ]
+
+    def parse(self, message: str) -> Optional[List[Dict]]:
+        """Return extracted workouts, or None if the parser is not confident"""
+        if self.NOT_A_LOG.search(message):
+            return None
+
+        workouts = []
+        for clause in self.CLAUSE_SPLIT.split(message):
+            if not clause or not clause.strip():
+                continue
+            parsed = self._parse_clause(clause)
+            if parsed is None:
+                return None
+            exercise, metrics = parsed
+
+            if exercise:
+                workouts.append(dict(exercise, **metrics))
+            elif metrics:
+                # "I benched 80kg for 5 reps, 3 sets": trailing numbers belong to the last exercise
+                if not workouts or any(workouts[-1].get(k) is not None for k in metrics):
+                    return None
+                workouts[-1].update(metrics)
+
+        if not workouts:
+            return None
+        for workout in workouts:
+            if not any(workout.get(k) for k in ("weight", "reps", "sets", "duration", "distance")):
+                return None
+            if workout["exercise_type"] == "cardio" and workout.get("weight"):
+                return None
+        return workouts
+
+    def _parse_clause(self, clause: str):
+        """Return (exercise, metrics) for one clause, or None if it has unexplained numbers"""
+        consumed = []
+
+        def free(start, end):
+            return all(end <= a or start >= b for a, b in consumed)
+
+        exercise = None
+        exercise_span = None
+        for pattern, name, etype in self._exercises:
+            for match in pattern.finditer(clause):
+                if not free(*match.span()):
+                    continue
+                if exercise and exercise["exercise_name"] != name:
+                    return None  # two different exercises in one clause
+                exercise = {"exercise_name": name, "exercise_type": etype}
+                exercise_span = exercise_span or match.span()
+                consumed.append(match.span())
+
+        metrics = {}
+        for kind, pattern in self._metrics:
+            for match in pattern.finditer(clause):
+                if not free(*match.span()):
+                    continue
+                if not self._apply_metric(kind, match, metrics):
+                    return None
+                consumed.append(match.span())
+
+        # "did 20 push-ups": a bare count before a bodyweight exercise is reps
+        if exercise and exercise["exercise_name"] in self.BODYWEIGHT and metrics.get("reps") is None:
+            bare = re.search(r"(\d+)\s*$", clause[:exercise_span[0]])
+            if bare and free(*bare.span(1)):
+                metrics["reps"] = int(bare.group(1))
+                consumed.append(bare.span(1))
+
+        for match in self.NUMBER.finditer(clause):
+            if free(*match.span()):
+                return None
+        for match in self.FILLER_TOKEN.finditer(clause):
+            if free(*match.span()) and match.group().lower() not in self.FILLER_WORDS:
+                return None
+        return exercise, metrics
+
+    def _apply_metric(self, kind: str, match, metrics: Dict) -> bool:
+        """Store one matched metric; False if it conflicts with one already seen"""
+        values = {}
+        if kind == "weight":
+            values = {"weight": float(match.group(1)),
+                      "weight_unit": self.WEIGHT_UNITS[match.group(2).lower()]}
+        elif kind in ("sets_of_reps", "sets_x_reps"):
+            sets, reps = int(match.group(1)), int(match.group(2))
+            if not (0 < sets <= 20 and 0 < reps <= 100):
+                return False
+            values = {"sets": sets, "reps": reps}
+        elif kind == "reps":
+            values = {"reps": int(match.group(1))}
+        elif kind == "sets":
+            values = {"sets": int(match.group(1))}
+        elif kind == "duration":
+            amount = float(match.group(1))
+            if match.group(2).lower().startswith("h"):
+                amount *= 60
+            values = {"duration": int(round(amount)), "duration_unit": "minutes"}
+        elif kind == "distance":
+            amount, unit = float(match.group(1)), match.group(2).lower()
+            if unit.startswith("mi"):
+                values = {"distance": amount, "distance_unit": "miles"}
+            elif unit.startswith("k"):
+                values = {"distance": amount, "distance_unit": "km"}
+            else:
+                values = {"distance": amount / 1000, "distance_unit": "km"}
+        elif kind == "calories":
+            values = {"calories": int(match.group(1))}
+
+        for key, value in values.items():
+            if metrics.get(key) is not None and metrics[key] != value:
+                return False
+            metrics[key] = value
+        return True
+
+
+WORKOUT_GATE = os.getenv("WORKOUT_GATE", "1") == "1"
+WORKOUT_GATE_THRESHOLD = float(os.getenv("WORKOUT_GATE_THRESHOLD", "2.0"))
+
+
+class WorkoutMessageGate:
+    """Cheap scoring pre-classifier deciding whether a message is worth an LLM detection call.
+
+    Evaluate threshold changes with tools/evaluate_workout_gate.py.
+    """
+
+    WEIGHTS = {
+        'number_unit': 2.0,      # "80kg", "5km", "30 minutes", "5x5", "3 sets"
+        'exercise': 1.5,         # exercise names and gym vocabulary
+        'activity_verb': 1.0,    # past-tense "did", "lifted", "trained"
+        'number': 0.5,           # any bare number
+        'question': -1.5,        # "?" or a leading question word
+        'future': -1.0           # "tomorrow", "plan to", "going to"
+    }
+
+    def __init__(self, threshold: float = 2.0):
+        self.threshold = threshold
+        exercise_vocab = "|".join(p for p, _, _ in RuleBasedWorkoutParser.EXERCISE_ALIASES)
+        self._patterns = {
+            'number_unit': re.compile(
+                r"\d+(?:\.\d+)?\s*-?\s*(?:kgs?|kilos?|lbs?|pounds?|km|kms|miles?|mi|m|"
+                r"minutes?|mins?|hours?|hrs?|reps?|sets?|kcal|calories|cals?)\b|\b\d+\s*[x×]\s*\d+\b",
+                re.IGNORECASE
+            ),
+            'exercise': re.compile(
+                rf"\b(?:{exercise_vocab}|workout|work(?:ed)? out|gym|lift(?:s|ed|ing)?|"
+                r"cardio|hiit|yoga|pilates|plank|crossfit|sprints?|laps?|pr|personal (?:best|record))\b",
+                re.IGNORECASE
+            ),
+            'activity_verb': re.compile(
+                r"\b(?:did|done|went|finished|completed|hit|trained|lifted|benched|squatted|deadlifted|"
+                r"pressed|pulled|pushed|curled|ran|jogged|swam|cycled|biked|rowed|walked|hiked|managed)\b",
+                re.IGNORECASE
+            ),
+            'number': re.compile(r"\d"),
+            'question': re.compile(
+                r"\?|^\s*(?:how|what|why|when|which|should|can|could|would|is|are|do|does)\b",
+                re.IGNORECASE
+            ),
+            'future': re.compile(
+                r"\b(?:tomorrow|next week|plan(?:ning)? to|going to|gonna|want to|will)\b",
+                re.IGNORECASE
+            ),
+        }
+
+    def score(self, message: str) -> float:
+        return sum(
+            weight for feature, weight in self.WEIGHTS.items()
+            if self._patterns[feature].search(message)
+        )
+
+    def should_detect(self, message: str) -> bool:
+        return self.score(message) >= self.threshold
+
+
+WORKOUT_CACHE_SIZE = int(os.getenv("WORKOUT_CACHE_SIZE", "512"))
+WORKOUT_CACHE_TTL = int(os.getenv("WORKOUT_CACHE_TTL", "3600"))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, max_size: int = 512, ttl: float = 3600):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            stored_at, value = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats, size=len(self._data), max_size=self.max_size, ttl=self.ttl)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+# Micro-batching of LLM detections; a window of 0 disables it
+WORKOUT_BATCH_WINDOW_MS = int(os.getenv("WORKOUT_BATCH_WINDOW_MS", "0"))
+WORKOUT_BATCH_MAX = int(os.getenv("WORKOUT_BATCH_MAX", "8"))
+
+
+class WorkoutDetectionBatcher:
+    """Coalesces detection requests arriving within a short window into one multi-message call.
+
+    The first caller of a batch acts as its leader: it waits for the window to close (or the
+    batch to fill), issues the call and hands every waiting caller its own result.
+    """
+
+    class _Item:
+        def __init__(self, message: str, history: List[Dict]):
+            self.message = message
+            self.history = history
+            self.result = None
+            self.done = threading.Event()
+
+    def __init__(self, detector, window: float = 0.05, max_batch: int = 8):
+        self.detector = detector
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._open = None  # list of _Item still accepting joiners
+
+    def detect(self, message: str, conversation_history: List[Dict] = None) -> Optional[List[Dict]]:
+        item = self._Item(message, conversation_history)
+        with self._cond:
+            batch = self._open
+            leader = batch is None or len(batch) >= self.max_batch
+            if leader:
+                batch = []
+                self._open = batch
+            batch.append(item)
+            if len(batch) >= self.max_batch:
+                self._cond.notify_all()
+
+        if leader:
+            deadline = time.monotonic() + self.window
+            with self._cond:
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._open is batch:
+                    self._open = None
+            self._dispatch(batch)
+
+        item.done.wait()
+        return item.result
+
+    def _dispatch(self, items: List):
+        results = [None] * len(items)
+        try:
+            if len(items) == 1:
+                results[0] = self.detector._detect_with_llm(items[0].message, items[0].history)
+            else:
+                results = self.detector.detect_batch([item.message for item in items])
+                for idx, item in enumerate(items):
+                    # Messages the batched answer did not cover are retried on their own
+                    if results[idx] is None:
+                        self.detector._count('batch_fallbacks')
+                        results[idx] = self.detector._detect_with_llm(item.message, item.history)
+        except Exception as e:
+            print(f"⚠️ Batched workout detection error: {e}")
+        finally:
+            for item, result in zip(items, results):
+                item.result = result
+                item.done.set()
+
+
 class AIWorkoutDetector:
     """AI-powered workout detection using Ollama or local LLM with retry logic"""
 
+    # Bump PROMPT_VERSION whenever SYSTEM_PROMPT changes so cached results are not reused
+    PROMPT_VERSION = "1"
+    SYSTEM_PROMPT = """Extract workouts from user message. Return ONLY valid JSON array.
+Extract: exercise_name, exercise_type ("strength"/"cardio"), weight, weight_unit, reps, sets, duration, duration_unit, distance, distance_unit, calories, notes.
+Rules: Only include explicitly stated values. Return [] if no workout found."""
+    BATCH_SYSTEM_PROMPT = """Extract workouts from each numbered user message. Return ONLY a JSON object mapping every message number to a JSON array of its workouts, e.g. {"1": [...], "2": []}.
+Extract: exercise_name, exercise_type ("strength"/"cardio"), weight, weight_unit, reps, sets, duration, duration_unit, distance, distance_unit, calories, notes.
+Rules: Only include explicitly stated values. Use [] for a message with no workout."""
+
     def __init__(self, ollama_base_url: str = "http://localhost:11434", model: str = None):
         self.ollama_base_url = ollama_base_url
         self.model = model or os.getenv("MODEL", "llama2")
         self.max_retries = 2
         self.timeout = 15  # Reduced timeout for faster failure detection
-        self._session = None
+        self.fast_parser = RuleBasedWorkoutParser() if WORKOUT_FAST_PATH else None
+        self.gate = WorkoutMessageGate(WORKOUT_GATE_THRESHOLD) if WORKOUT_GATE else None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'fast_path_hits': 0, 'fast_path_misses': 0, 'gate_skipped': 0, 'llm_calls': 0,
+            'batches': 0, 'batched_messages': 0, 'batch_fallbacks': 0
+        }
+        self.cache = TTLCache(WORKOUT_CACHE_SIZE, WORKOUT_CACHE_TTL)
+        self.batcher = None
+        if WORKOUT_BATCH_WINDOW_MS > 0:
+            self.batcher = WorkoutDetectionBatcher(self, WORKOUT_BATCH_WINDOW_MS / 1000, WORKOUT_BATCH_MAX)
+
+    def _cache_key(self, message: str):
+        normalized = " ".join(message.lower().split()).rstrip(" .!")
+        return (normalized, self.model, self.PROMPT_VERSION)
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self) -> Dict:
+        """Detection counters, including the fast-path hit rate"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        attempts = stats['fast_path_hits'] + stats['fast_path_misses']
+        stats['fast_path_hit_rate'] = stats['fast_path_hits'] / attempts if attempts else 0.0
+        stats['cache'] = self.cache.stats()
+        return stats
     
-    @property
-    def session(self):
-        """Lazy-loaded persistent session for connection pooling"""
-        if self._session is None:
-            self._session = requests.Session()
-            # Configure connection pooling for better performance
-            adapter = requests.adapters.HTTPAdapter(
-                pool_connections=5,
-                pool_maxsize=10,
-                max_retries=0  # We handle retries manually
-            )
-            self._session.mount('http://', adapter)
-            self._session.mount('https://', adapter)
-        return self._session
-
     def detect_workouts(self, message: str, conversation_history: List[Dict] = None) -> List[Dict]:
         """Use AI to detect workout information from natural language with retries."""
         # Quick check - skip detection for very short messages or obvious non-workout messages
         if len(message.strip()) < 10:
             return []
-        
+
+        # Regular phrasings ("80kg x 5 reps x 3 sets", "ran 5km in 30 minutes") skip the LLM
+        if self.fast_parser:
+            parsed = self.fast_parser.parse(message)
+            if parsed is not None:
+                self._count('fast_path_hits')
+                validated = self._validate_workouts(parsed)
+                print(f"⚡ Fast path detected {len(validated)} workout(s)")
+                return validated
+            self._count('fast_path_misses')
+
+        # Messages with no workout signal ("what should I eat before bed?") skip the LLM
+        if self.gate and not self.gate.should_detect(message):
+            self._count('gate_skipped')
+            return []
+
+        # Repeated and regenerated messages reuse the previous detection
+        cache_key = self._cache_key(message)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return [dict(w) for w in cached]
+
+        if self.batcher:
+            validated = self.batcher.detect(message, conversation_history)
+        else:
+            validated = self._detect_with_llm(message, conversation_history)
+
+        if validated is None:
+            return []
+        self.cache.set(cache_key, [dict(w) for w in validated])
+        return validated
+
+    def _detect_with_llm(self, message: str, conversation_history: List[Dict] = None) -> Optional[List[Dict]]:
+        """Single-message Ollama detection; returns None when the call fails"""
+        self._count('llm_calls')
+
         # Build context efficiently
         context = ""
         if conversation_history:
@@ -143,39 +1688,39 @@ class AIWorkoutDetector:
                 for m in recent_messages
             ) + "\n\n"
 
-        system_prompt = """Extract workouts from user message. Return ONLY valid JSON array.
-Extract: exercise_name, exercise_type ("strength"/"cardio"), weight, weight_unit, reps, sets, duration, duration_unit, distance, distance_unit, calories, notes.
-Rules: Only include explicitly stated values. Return [] if no workout found."""
-
+        system_prompt = self.SYSTEM_PROMPT
         user_prompt = f"{context}Message: {message}"
 
         for attempt in range(self.max_retries + 1):
             try:
-                response = self.session.post(
-                    f"{self.ollama_base_url}/api/chat",
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        "stream": False,
-                        "format": "json",
-                        "options": {
-                            "temperature": 0.1,
-                            "num_predict": 500,  # Reduced for speed
-                            "num_ctx": 2048      # Smaller context for speed
-                        }
-                    },
-                    timeout=self.timeout
-                )
+                with ollama_breaker.guard() as outcome:
+                    response = outbound_http.post(
+                        f"{self.ollama_base_url}/api/chat",
+                        json={
+                            "model": self.model,
+                            "messages": [
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": user_prompt}
+                            ],
+                            "stream": False,
+                            "format": "json",
+                            "options": {
+                                "temperature": 0.1,
+                                "num_predict": 500,  # Reduced for speed
+                                "num_ctx": 2048      # Smaller context for speed
+                            }
+                        },
+                        timeout=self.timeout
+                    )
+                    if response.status_code >= 500:
+                        outcome.fail()
 
                 if response.status_code != 200:
                     if attempt < self.max_retries:
                         time.sleep(0.5 * (attempt + 1))  # Exponential backoff
                         continue
                     print(f"⚠️ Ollama error: {response.status_code}")
-                    return []
+                    return None
 
                 result = response.json()
                 ai_response = result.get('message', {}).get('content', '[]').strip()
@@ -190,25 +1735,76 @@ Rules: Only include explicitly stated values. Return [] if no workout found."""
                     print(f"💪 AI detected {len(validated)} workout(s)")
                 return validated
 
+            except CircuitOpenError:
+                print("⚠️ Ollama circuit open, skipping workout detection")
+                return None
             except requests.exceptions.Timeout:
-                if attempt < self.max_retries:
-                    print(f"⚠️ Workout detection timeout, retry {attempt + 1}/{self.max_retries}")
-                    continue
-                print("⚠️ Workout detection timed out after retries")
-                return []
+                # A slow backend is not retried; the circuit breaker tracks it instead
+                print("⚠️ Workout detection timed out")
+                return None
             except requests.exceptions.ConnectionError:
                 print("⚠️ Cannot connect to Ollama for workout detection")
-                return []  # Don't retry connection errors
+                return None  # Don't retry connection errors
             except json.JSONDecodeError as e:
                 if attempt < self.max_retries:
                     continue
                 print(f"⚠️ JSON parse error in workout detection: {e}")
-                return []
+                return None
             except Exception as e:
                 print(f"⚠️ Workout detection error: {e}")
-                return []
+                return None
         
-        return []
+        return None
+
+    def detect_batch(self, messages: List[str]) -> List[Optional[List[Dict]]]:
+        """Detect workouts for several messages in one Ollama call; None marks a message to retry alone"""
+        self._count('llm_calls')
+        self._count('batches')
+        self._count('batched_messages', len(messages))
+
+        user_prompt = "\n".join(f"Message {i}: {m}" for i, m in enumerate(messages, start=1))
+        try:
+            with ollama_breaker.guard() as outcome:
+                response = outbound_http.post(
+                    f"{self.ollama_base_url}/api/chat",
+                    json={
+                        "model": self.model,
+                        "messages": [
+                            {"role": "system", "content": self.BATCH_SYSTEM_PROMPT},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        "stream": False,
+                        "format": "json",
+                        "options": {
+                            "temperature": 0.1,
+                            "num_predict": 300 * len(messages),
+                            "num_ctx": 4096
+                        }
+                    },
+                    timeout=self.timeout
+                )
+                if response.status_code >= 500:
+                    outcome.fail()
+            if response.status_code != 200:
+                print(f"⚠️ Ollama error in batched detection: {response.status_code}")
+                return [None] * len(messages)
+            content = response.json().get('message', {}).get('content', '{}').strip()
+            parsed = json.loads(content)
+        except (CircuitOpenError, requests.exceptions.RequestException, ValueError) as e:
+            print(f"⚠️ Batched workout detection failed: {e}")
+            return [None] * len(messages)
+
+        if not isinstance(parsed, dict):
+            return [None] * len(messages)
+
+        results = []
+        for i in range(1, len(messages) + 1):
+            workouts = parsed.get(str(i))
+            if isinstance(workouts, dict):
+                workouts = [workouts]
+            results.append(self._validate_workouts(workouts) if isinstance(workouts, list) else None)
+        print(f"💪 Batched detection handled {len(messages)} message(s)")
+        return results
 
     def _clean_json_response(self, response: str) -> str:
         """Clean up AI response to extract valid JSON"""
@@ -298,100 +1894,741 @@ def extract_workout_data_with_ai(message: str, conversation_history: List[Dict]
         return []
 
 
-def save_workout_stats(session_id, user_id, workouts, workout_date=None):
-    """Save workout statistics to MySQL and JSON file"""
-    if not workouts:
-        return
-
-    if workout_date is None:
-        workout_date = datetime.now().date()
-    elif isinstance(workout_date, str):
-        workout_date = datetime.strptime(workout_date, '%Y-%m-%d').date()
+WORKOUT_INSERT_CHUNK = int(os.getenv("WORKOUT_INSERT_CHUNK", "1000"))
 
-    try:
-        connection = get_mysql_connection()
-        if not connection:
-            print("❌ No MySQL connection for workout stats")
-            return
+# "incremental" appends new rows to a delta file compacted in the background; "full" rewrites the export
+WORKOUT_EXPORT_MODE = os.getenv("WORKOUT_EXPORT_MODE", "incremental")
+WORKOUT_EXPORT_COMPACT_ROWS = int(os.getenv("WORKOUT_EXPORT_COMPACT_ROWS", "500"))
+WORKOUT_EXPORT_COMPACT_INTERVAL = int(os.getenv("WORKOUT_EXPORT_COMPACT_INTERVAL", "300"))
+WORKOUT_EXPORT_FETCH_SIZE = int(os.getenv("WORKOUT_EXPORT_FETCH_SIZE", "500"))
 
-        cursor = connection.cursor()
-        now_ms = int(time.time() * 1000)
-        now_dt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+WORKOUT_COLUMNS = (
+    'id', 'user_id', 'session_id', 'exercise_name', 'exercise_type',
+    'weight', 'weight_unit', 'reps', 'sets', 'duration', 'duration_unit',
+    'distance', 'distance_unit', 'calories', 'notes', 'workout_date',
+    'create_time', 'create_date'
+)
 
-        for workout in workouts:
-            workout_id = uuid.uuid4().hex
-            insert_query = """
-            INSERT INTO workout_stats 
-            (id, user_id, session_id, exercise_name, exercise_type, 
-             weight, weight_unit, reps, sets, duration, duration_unit,
-             distance, distance_unit, calories, notes, workout_date, 
-             create_time, create_date)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
+WORKOUT_INSERT_QUERY = """
+INSERT INTO workout_stats 
+(id, user_id, session_id, exercise_name, exercise_type, 
+ weight, weight_unit, reps, sets, duration, duration_unit,
+ distance, distance_unit, calories, notes, workout_date, 
+ create_time, create_date)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
 
-            values = (
-                workout_id, user_id, session_id,
-                workout['exercise_name'], workout['exercise_type'],
-                workout['weight'], workout['weight_unit'],
-                workout['reps'], workout['sets'],
-                workout['duration'], workout['duration_unit'],
-                workout['distance'], workout['distance_unit'],
-                workout['calories'], workout['notes'],
-                workout_date, now_ms, now_dt
-            )
 
-            cursor.execute(insert_query, values)
+def workout_row(user_id, session_id, workout, workout_date, now_ms, now_dt, workout_id=None) -> tuple:
+    """Build the workout_stats INSERT parameters for one workout"""
+    return (
+        workout_id or uuid.uuid4().hex, user_id, session_id,
+        workout['exercise_name'], workout['exercise_type'],
+        workout['weight'], workout['weight_unit'],
+        workout['reps'], workout['sets'],
+        workout['duration'], workout['duration_unit'],
+        workout['distance'], workout['distance_unit'],
+        workout['calories'], workout['notes'],
+        workout_date, now_ms, now_dt
+    )
+
+
+def insert_workout_rows(cursor, rows, chunk_size: int = WORKOUT_INSERT_CHUNK,
+                        record_events: Optional[List] = None) -> int:
+    """Insert rows with executemany in chunks (one multi-row INSERT per chunk); rows may be a generator.
+
+    Each chunk is also folded into workout_daily_rollup, personal_record and the workout_change
+    log, and every user touched has its data version row locked. Callers commit, update the JSON
+    export and then call bump_data_versions. Broken personal records are appended to record_events
+    when it is given.
+    """
+    inserted = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            inserted += _insert_workout_chunk(cursor, chunk, record_events)
+            chunk = []
+    if chunk:
+        inserted += _insert_workout_chunk(cursor, chunk, record_events)
+    return inserted
+
+
+def _insert_workout_chunk(cursor, chunk, record_events: Optional[List]) -> int:
+    # Take the version row locks before any other row lock, so every writer locks in the same order
+    # (version rows, then workouts, rollups and records) and a user's change seqs commit in seq order
+    lock_data_versions(cursor, {row[1] for row in chunk})
+    cursor.executemany(WORKOUT_INSERT_QUERY, chunk)
+    update_daily_rollup(cursor, chunk)
+    log_workout_changes(cursor, "insert", [dict(zip(WORKOUT_COLUMNS, row)) for row in chunk])
+    events = update_personal_records(cursor, chunk)
+    if record_events is not None:
+        record_events.extend(events)
+    return len(chunk)
+
+
+WORKOUT_CHANGE_OPS = ("insert", "update", "delete")
+WORKOUT_CHANGES_PAGE = int(os.getenv("WORKOUT_CHANGES_PAGE", "500"))
+
+
+def log_workout_changes(cursor, op: str, workouts: List[Dict]):
+    """Append one workout_change row per workout; deletes only need user_id and id"""
+    if op not in WORKOUT_CHANGE_OPS:
+        raise ValueError(f"unknown change op: {op}")
+    if not workouts:
+        return
+    now_ms = int(time.time() * 1000)
+    cursor.executemany("""
+        INSERT INTO workout_change (user_id, workout_id, op, workout, create_time)
+        VALUES (%s, %s, %s, %s, %s)
+    """, [
+        (workout['user_id'], workout['id'], op,
+         None if op == "delete" else json.dumps(serialize_workout(dict(workout)), default=str), now_ms)
+        for workout in workouts
+    ])
+
+
+def lock_data_versions(cursor, user_ids):
+    """Lock each user's version row for the rest of the transaction (creating it at version 0)"""
+    if not user_ids:
+        return
+    cursor.executemany("""
+        INSERT INTO user_data_version (user_id, version, update_time) VALUES (%s, 0, %s)
+        ON DUPLICATE KEY UPDATE version = version
+    """, [(user_id, int(time.time() * 1000)) for user_id in sorted(user_ids)])
 
-        connection.commit()
-        cursor.close()
-        connection.close()
 
-        print(f"💪 Saved {len(workouts)} workout stats to MySQL")
-        export_workout_stats_to_json(user_id)
+def bump_data_versions(user_ids):
+    """Advance the data version of each user so cached stats responses stop validating.
 
+    Called once the write is committed *and* in the JSON export, so a new ETag never
+    goes out with a body that is missing the write.
+    """
+    if not user_ids:
+        return
+    now_ms = int(time.time() * 1000)
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return
+            cursor = connection.cursor()
+            cursor.executemany("""
+                INSERT INTO user_data_version (user_id, version, update_time) VALUES (%s, 1, %s)
+                ON DUPLICATE KEY UPDATE version = version + 1, update_time = VALUES(update_time)
+            """, [(user_id, now_ms) for user_id in sorted(user_ids)])
+            connection.commit()
+            cursor.close()
     except Exception as e:
-        print(f"Error saving workout stats: {e}")
+        print(f"Error bumping data versions: {e}")
 
 
-def export_workout_stats_to_json(user_id="default_user"):
-    """Export all workout stats for a user to a JSON file"""
-    try:
-        connection = get_mysql_connection()
-        if not connection:
-            return None
+def current_change_cursor(connection, user_id: str) -> int:
+    """Latest workout_change seq of a user (0 before the first change)"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM workout_change WHERE user_id = %s", (user_id,))
+    position = cursor.fetchone()[0]
+    cursor.close()
+    return position
 
-        cursor = connection.cursor(dictionary=True)
-        query = """
-        SELECT * FROM workout_stats 
-        WHERE user_id = %s 
-        ORDER BY workout_date DESC, create_time DESC
-        """
-        cursor.execute(query, (user_id,))
-        workouts = cursor.fetchall()
 
-        for workout in workouts:
-            if workout.get('weight'):
-                workout['weight'] = float(workout['weight'])
-            if workout.get('distance'):
-                workout['distance'] = float(workout['distance'])
-            if workout.get('workout_date'):
-                workout['workout_date'] = workout['workout_date'].strftime('%Y-%m-%d')
-            if workout.get('create_date'):
-                workout['create_date'] = workout['create_date'].strftime('%Y-%m-%d %H:%M:%S')
+def get_data_version(user_id: str) -> Optional[int]:
+    """Current data version of a user (0 before the first write), or None if MySQL is unavailable"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return None
+            cursor = connection.cursor()
+            cursor.execute("SELECT version FROM user_data_version WHERE user_id = %s", (user_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        return row[0] if row else 0
+    except Exception as e:
+        print(f"Error reading data version: {e}")
+        return None
+
+
+def conditional_stats_response(view):
+    """Give a read-only stats view a strong ETag and answer matching If-None-Match with 304"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = request.args.get("user_id", "default_user")
+        # Read before the view runs, so a concurrent write can only make the tag too old, never too new
+        version = get_data_version(user_id)
+        if version is None:
+            return view(*args, **kwargs)
+
+        # Windowed queries are relative to CURDATE(), so the day is part of the validator too
+        key = f"{request.path}|{sorted(request.args.items(multi=True))}|{version}|{date.today()}"
+        etag = hashlib.sha1(key.encode()).hexdigest()
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    return wrapper
+
+
+# Training volume is weight x reps x sets, where a missing set count means one set. Every
+# volume number (rollup, personal records, analytics) goes through these two definitions.
+WORKOUT_VOLUME_SQL = "COALESCE(sets, 1) * reps * weight"
+
+
+def workout_volume(weight, reps, sets):
+    """Volume of one workout, or of NumPy arrays of them (NaN sets count as 1); None without weight/reps"""
+    if isinstance(sets, np.ndarray):
+        return weight * reps * np.where(np.isnan(sets), 1.0, sets)
+    if weight is None or reps is None:
+        return None
+    return (sets if sets is not None else 1) * reps * weight
+
+
+# workout_daily_rollup: one row per (user, day, exercise type, exercise, weight unit)
+ROLLUP_KEY_COLUMNS = ('user_id', 'workout_date', 'exercise_type', 'exercise_name', 'weight_unit')
+ROLLUP_COUNT_COLUMNS = ('workout_count', 'set_count', 'weight_count')
+ROLLUP_SUM_COLUMNS = ('rep_total', 'weight_sum', 'volume', 'duration_total', 'distance_total')
+ROLLUP_COLUMNS = ROLLUP_KEY_COLUMNS + ROLLUP_COUNT_COLUMNS + ROLLUP_SUM_COLUMNS + ('max_weight',)
+
+ROLLUP_UPSERT_QUERY = """
+INSERT INTO workout_daily_rollup ({columns})
+VALUES ({placeholders})
+ON DUPLICATE KEY UPDATE
+{updates}
+""".format(
+    columns=", ".join(ROLLUP_COLUMNS),
+    placeholders=", ".join(["%s"] * len(ROLLUP_COLUMNS)),
+    updates=",\n".join(
+        [f"{c} = {c} + VALUES({c})" for c in ROLLUP_COUNT_COLUMNS] +
+        # NULL means "nothing recorded", so an all-NULL day keeps reporting NULL like SUM() does
+        [f"{c} = CASE WHEN VALUES({c}) IS NULL THEN {c} ELSE COALESCE({c}, 0) + VALUES({c}) END"
+         for c in ROLLUP_SUM_COLUMNS] +
+        ["max_weight = CASE WHEN max_weight IS NULL OR VALUES(max_weight) > max_weight "
+         "THEN VALUES(max_weight) ELSE max_weight END"]
+    )
+)
+
+ROLLUP_REBUILD_QUERY = """
+INSERT INTO workout_daily_rollup ({columns})
+SELECT user_id, workout_date, COALESCE(exercise_type, ''), exercise_name, COALESCE(weight_unit, ''),
+       COUNT(*), SUM(COALESCE(sets, 1)), COUNT(weight),
+       SUM(reps), SUM(weight), SUM({volume}), SUM(duration), SUM(distance),
+       MAX(weight)
+FROM workout_stats
+{where}
+GROUP BY user_id, workout_date, COALESCE(exercise_type, ''), exercise_name, COALESCE(weight_unit, '')
+"""
 
+
+def _add_nullable(totals: Dict, column: str, value):
+    if value is not None:
+        totals[column] = (totals[column] or 0) + value
+
+
+def rollup_deltas(rows) -> List[tuple]:
+    """Pre-aggregate workout_row tuples into one workout_daily_rollup delta per key"""
+    deltas = {}
+    for row in rows:
+        workout = dict(zip(WORKOUT_COLUMNS, row))
+        key = (
+            workout['user_id'], str(workout['workout_date'])[:10],
+            workout['exercise_type'] or '', workout['exercise_name'], workout['weight_unit'] or ''
+        )
+        totals = deltas.get(key)
+        if totals is None:
+            totals = deltas[key] = dict.fromkeys(ROLLUP_SUM_COLUMNS + ('max_weight',))
+            totals.update(dict.fromkeys(ROLLUP_COUNT_COLUMNS, 0))
+
+        sets, reps, weight = workout['sets'], workout['reps'], workout['weight']
+        totals['workout_count'] += 1
+        totals['set_count'] += sets if sets is not None else 1
+        _add_nullable(totals, 'rep_total', reps)
+        _add_nullable(totals, 'duration_total', workout['duration'])
+        _add_nullable(totals, 'distance_total', workout['distance'])
+        if weight is not None:
+            totals['weight_count'] += 1
+            _add_nullable(totals, 'weight_sum', weight)
+            if totals['max_weight'] is None or weight > totals['max_weight']:
+                totals['max_weight'] = weight
+            _add_nullable(totals, 'volume', workout_volume(weight, reps, sets))
+
+    return [key + tuple(totals[c] for c in ROLLUP_COLUMNS[len(key):]) for key, totals in deltas.items()]
+
+
+def update_daily_rollup(cursor, rows) -> int:
+    """Fold freshly inserted workout rows into workout_daily_rollup (same transaction as the insert)"""
+    deltas = rollup_deltas(rows)
+    if deltas:
+        cursor.executemany(ROLLUP_UPSERT_QUERY, deltas)
+    return len(deltas)
+
+
+def rebuild_daily_rollup(user_id: Optional[str] = None) -> int:
+    """Recompute workout_daily_rollup from workout_stats for one user, or everyone"""
+    with mysql_connection() as connection:
+        if not connection:
+            print("❌ No MySQL connection, skipping rollup rebuild")
+            return 0
+
+        cursor = connection.cursor()
+        if user_id:
+            cursor.execute("DELETE FROM workout_daily_rollup WHERE user_id = %s", (user_id,))
+            cursor.execute(ROLLUP_REBUILD_QUERY.format(
+                columns=", ".join(ROLLUP_COLUMNS), volume=WORKOUT_VOLUME_SQL, where="WHERE user_id = %s"),
+                (user_id,))
+        else:
+            cursor.execute("DELETE FROM workout_daily_rollup")
+            cursor.execute(ROLLUP_REBUILD_QUERY.format(
+                columns=", ".join(ROLLUP_COLUMNS), volume=WORKOUT_VOLUME_SQL, where=""))
+        rebuilt = cursor.rowcount
+        connection.commit()
         cursor.close()
-        connection.close()
 
-        json_file_path = os.path.join(STATS_DIR, f"{user_id}_workout_stats.json")
-        with open(json_file_path, 'w') as f:
-            json.dump({
+    print(f"📅 Rebuilt {rebuilt} daily rollup rows" + (f" for {user_id}" if user_id else ""))
+    return rebuilt
+
+
+# personal_record: best value per (user, exercise, record type, unit); pace is lower-is-better
+RECORD_TYPES = {
+    "max_weight": max,
+    "best_volume": max,
+    "longest_distance": max,
+    "fastest_pace": min
+}
+
+PERSONAL_RECORD_UPSERT_QUERY = """
+INSERT INTO personal_record
+(user_id, exercise_name, record_type, unit, record_value, workout_id, workout_date, update_time)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+previous_value = record_value,
+record_value = VALUES(record_value),
+workout_id = VALUES(workout_id),
+workout_date = VALUES(workout_date),
+update_time = VALUES(update_time)
+"""
+
+
+def record_candidates(workout: Dict):
+    """Yield (record_type, unit, value) for every record a single workout could set"""
+    weight, reps, sets = workout.get('weight'), workout.get('reps'), workout.get('sets')
+    distance, duration = workout.get('distance'), workout.get('duration')
+    weight_unit = workout.get('weight_unit') or ''
+
+    if weight:
+        yield "max_weight", weight_unit, float(weight)
+        if reps:
+            yield "best_volume", weight_unit, float(workout_volume(weight, reps, sets))
+    if distance:
+        yield "longest_distance", workout.get('distance_unit') or '', float(distance)
+        if duration:
+            pace_unit = f"{workout.get('duration_unit') or ''}/{workout.get('distance_unit') or ''}"
+            yield "fastest_pace", pace_unit, round(float(duration) / float(distance), 4)
+
+
+def _beats(record_type: str, value: float, current: float) -> bool:
+    return value != current and RECORD_TYPES[record_type](value, current) == value
+
+
+def update_personal_records(cursor, rows) -> List[Dict]:
+    """Compare freshly inserted workout rows with the stored records and upsert the ones they beat.
+
+    Returns one event per broken record; previous_value is None for an exercise's first record.
+    """
+    best = {}
+    for row in rows:
+        workout = dict(zip(WORKOUT_COLUMNS, row))
+        for record_type, unit, value in record_candidates(workout):
+            # exercise_name compares case-insensitively in MySQL, so match that here
+            key = (workout['user_id'], workout['exercise_name'].lower(), record_type, unit)
+            if key not in best or _beats(record_type, value, best[key][0]):
+                best[key] = (value, workout)
+    if not best:
+        return []
+
+    current = {}
+    for user_id in {key[0] for key in best}:
+        names = sorted({key[1] for key in best if key[0] == user_id})
+        cursor.execute(
+            "SELECT exercise_name, record_type, unit, record_value FROM personal_record "
+            f"WHERE user_id = %s AND exercise_name IN ({', '.join(['%s'] * len(names))}) FOR UPDATE",
+            (user_id, *names)
+        )
+        for name, record_type, unit, value in cursor.fetchall():
+            current[(user_id, name.lower(), record_type, unit)] = float(value)
+
+    events = []
+    upserts = []
+    for key, (value, workout) in best.items():
+        previous = current.get(key)
+        if previous is not None and not _beats(key[2], value, previous):
+            continue
+        workout_date = str(workout['workout_date'])[:10]
+        upserts.append((
+            workout['user_id'], workout['exercise_name'], key[2], key[3], value,
+            workout['id'], workout_date, workout['create_time']
+        ))
+        events.append({
+            "user_id": workout['user_id'],
+            "exercise_name": workout['exercise_name'],
+            "record_type": key[2],
+            "unit": key[3] or None,
+            "value": value,
+            "previous_value": previous,
+            "workout_date": workout_date
+        })
+
+    if upserts:
+        cursor.executemany(PERSONAL_RECORD_UPSERT_QUERY, upserts)
+    return events
+
+
+def rebuild_personal_records(user_id: Optional[str] = None) -> int:
+    """Recompute personal_record by replaying workout_stats in date order for one user, or everyone"""
+    with mysql_connection() as reader, mysql_connection() as writer:
+        if not reader or not writer:
+            print("❌ No MySQL connection, skipping personal record rebuild")
+            return 0
+
+        write_cursor = writer.cursor()
+        where = "WHERE user_id = %s" if user_id else ""
+        params = (user_id,) if user_id else ()
+        write_cursor.execute(f"DELETE FROM personal_record {where}", params)
+
+        # Unbuffered read on its own connection so writes can go out while rows stream in
+        read_cursor = reader.cursor(buffered=False)
+        read_cursor.execute(
+            f"SELECT {', '.join(WORKOUT_COLUMNS)} FROM workout_stats {where} "
+            "ORDER BY workout_date, create_time", params
+        )
+        records = 0
+        while True:
+            rows = read_cursor.fetchmany(WORKOUT_INSERT_CHUNK)
+            if not rows:
+                break
+            records += len(update_personal_records(write_cursor, rows))
+        read_cursor.close()
+
+        writer.commit()
+        write_cursor.close()
+
+    print(f"🏆 Rebuilt personal records ({records} record updates)" + (f" for {user_id}" if user_id else ""))
+    return records
+
+
+def parse_workout_date(value):
+    """Accept a date, a 'YYYY-MM-DD' string or nothing (today)"""
+    if not value:
+        return datetime.now().date()
+    if isinstance(value, str):
+        return datetime.strptime(value.strip()[:10], '%Y-%m-%d').date()
+    return value
+
+
+def workout_from_record(data: Dict) -> Dict:
+    """Build a workout dict from form, JSON or CSV fields, where numbers may arrive as strings"""
+    if not data.get('exercise_name'):
+        raise ValueError("exercise_name is required")
+
+    return {
+        'exercise_name': data.get('exercise_name'),
+        'exercise_type': data.get('exercise_type') or 'other',
+        'weight': float(data['weight']) if data.get('weight') else None,
+        'weight_unit': data.get('weight_unit') or None,
+        'reps': int(data['reps']) if data.get('reps') else None,
+        'sets': int(data['sets']) if data.get('sets') else None,
+        'duration': int(data['duration']) if data.get('duration') else None,
+        'duration_unit': data.get('duration_unit') or None,
+        'distance': float(data['distance']) if data.get('distance') else None,
+        'distance_unit': data.get('distance_unit') or None,
+        'calories': int(data['calories']) if data.get('calories') else None,
+        'notes': data.get('notes') or None
+    }
+
+
+def save_workout_stats(session_id, user_id, workouts, workout_date=None) -> List[Dict]:
+    """Save workout statistics to MySQL and JSON file; returns the personal records they broke"""
+    record_events = []
+    if not workouts:
+        return record_events
+
+    workout_date = parse_workout_date(workout_date)
+
+    export_barrier.begin(user_id)
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                print("❌ No MySQL connection for workout stats")
+                return record_events
+
+            cursor = connection.cursor()
+            now_ms = int(time.time() * 1000)
+            now_dt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+            rows = [
+                workout_row(user_id, session_id, workout, workout_date, now_ms, now_dt)
+                for workout in workouts
+            ]
+            insert_workout_rows(cursor, rows, record_events=record_events)
+
+            connection.commit()
+            cursor.close()
+
+        print(f"💪 Saved {len(workouts)} workout stats to MySQL")
+        event_broker.publish(user_id, "workouts_detected", {
+            "session_id": session_id,
+            "count": len(rows),
+            "workouts": [serialize_workout(dict(zip(WORKOUT_COLUMNS, row))) for row in rows]
+        })
+        for event in record_events:
+            print(f"🏆 New {event['record_type']} PR for {event['exercise_name']}: {event['value']} {event['unit'] or ''}")
+            event_broker.publish(user_id, "pr_broken", event)
+        try:
+            if WORKOUT_EXPORT_MODE == "incremental":
+                append_workouts_to_export(user_id, [dict(zip(WORKOUT_COLUMNS, row)) for row in rows])
+            else:
+                export_workout_stats_to_json(user_id)
+        finally:
+            bump_data_versions({user_id})
+        return record_events
+
+    except Exception as e:
+        print(f"Error saving workout stats: {e}")
+        return []
+    finally:
+        export_barrier.end(user_id)
+
+
+def serialize_workout(workout: Dict) -> Dict:
+    """Convert DECIMAL/DATE/DATETIME values of a workout row to JSON-friendly types"""
+    if workout.get('weight'):
+        workout['weight'] = float(workout['weight'])
+    if workout.get('distance'):
+        workout['distance'] = float(workout['distance'])
+    if workout.get('workout_date') and not isinstance(workout['workout_date'], str):
+        workout['workout_date'] = workout['workout_date'].strftime('%Y-%m-%d')
+    if workout.get('create_date') and not isinstance(workout['create_date'], str):
+        workout['create_date'] = workout['create_date'].strftime('%Y-%m-%d %H:%M:%S')
+    return workout
+
+
+def workout_export_paths(user_id: str):
+    """Return (snapshot, delta) paths of a user's JSON export"""
+    base = os.path.join(STATS_DIR, f"{user_id}_workout_stats")
+    return f"{base}.json", f"{base}.delta.jsonl"
+
+
+_export_locks = {}
+_export_locks_guard = threading.Lock()
+_delta_rows = {}  # user_id -> rows waiting in the delta file
+_compactor_started = False
+
+
+class ExportBarrier:
+    """Per-user count of workout writes that are committing or committed but not yet exported.
+
+    Readers that pair the export with a change cursor do it inside settled(), so the cursor
+    never points past a row the export is still missing.
+    """
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._pending = {}
+
+    def begin(self, user_id: str):
+        with self._cond:
+            self._pending[user_id] = self._pending.get(user_id, 0) + 1
+
+    def end(self, user_id: str):
+        with self._cond:
+            self._pending[user_id] -= 1
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+                self._cond.notify_all()
+
+    @contextmanager
+    def settled(self, user_id: str):
+        """Hold off new writes for user_id once its in-flight ones are exported (or the timeout passes)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: user_id not in self._pending, self.timeout):
+                print(f"⚠️ Export for {user_id} still has pending writes, serving it anyway")
+            yield
+
+
+export_barrier = ExportBarrier()
+
+
+def _export_lock(user_id: str) -> threading.Lock:
+    with _export_locks_guard:
+        return _export_locks.setdefault(user_id, threading.Lock())
+
+
+def _write_json_atomic(path: str, payload: Dict):
+    """Write to a temp file and rename it over `path`, so readers never see a partial file"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_delta(delta_path: str) -> List[Dict]:
+    if not os.path.exists(delta_path):
+        return []
+    workouts = []
+    with open(delta_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    workouts.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # a torn last line from a crash mid-append
+    return workouts
+
+
+def _merged_export(user_id: str) -> Dict:
+    """Snapshot + delta merged into the export document (caller holds the user's export lock)"""
+    snapshot_path, delta_path = workout_export_paths(user_id)
+    snapshot = {}
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+
+    delta = _read_delta(delta_path)
+    workouts = snapshot.get('workouts', [])
+    last_updated = snapshot.get('last_updated')
+    if delta:
+        by_id = {w.get('id'): w for w in workouts}
+        by_id.update((w.get('id'), w) for w in delta)
+        workouts = sorted(
+            by_id.values(),
+            key=lambda w: (w.get('workout_date') or '', w.get('create_time') or 0),
+            reverse=True
+        )
+        last_updated = datetime.fromtimestamp(os.path.getmtime(delta_path)).strftime('%Y-%m-%d %H:%M:%S')
+
+    return {
+        'user_id': user_id,
+        'total_workouts': len(workouts),
+        'last_updated': last_updated or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'workouts': workouts
+    }
+
+
+def read_workout_export(user_id: str) -> Dict:
+    """Merged view of a user's exported workouts, without touching MySQL"""
+    with _export_lock(user_id):
+        return _merged_export(user_id)
+
+
+def append_workouts_to_export(user_id: str, workouts: List[Dict]):
+    """Append newly saved workouts to the user's delta file instead of re-exporting everything"""
+    snapshot_path, delta_path = workout_export_paths(user_id)
+    if not os.path.exists(snapshot_path):
+        # First export for this user: seed the snapshot from MySQL (includes the new rows)
+        export_workout_stats_to_json(user_id)
+        return
+
+    lines = "".join(json.dumps(serialize_workout(dict(w)), default=str) + "\n" for w in workouts)
+    with _export_lock(user_id):
+        if user_id not in _delta_rows:
+            _delta_rows[user_id] = len(_read_delta(delta_path))
+        with open(delta_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+        _delta_rows[user_id] += len(workouts)
+        pending = _delta_rows[user_id]
+
+    print(f"📊 Appended {len(workouts)} workouts to {delta_path}")
+    event_broker.publish(user_id, "export_ready", {"workouts_added": len(workouts)})
+    _start_export_compactor()
+    if pending >= WORKOUT_EXPORT_COMPACT_ROWS:
+        background_jobs.submit("compact_workout_export", compact_workout_export, user_id)
+
+
+def compact_workout_export(user_id: str):
+    """Fold the delta file into the snapshot (atomic rename) and clear it"""
+    snapshot_path, delta_path = workout_export_paths(user_id)
+    with _export_lock(user_id):
+        if not os.path.exists(delta_path):
+            return
+        data = _merged_export(user_id)
+        data['last_updated'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _write_json_atomic(snapshot_path, data)
+        os.remove(delta_path)
+        _delta_rows[user_id] = 0
+    print(f"📊 Compacted workout export for {user_id} ({data['total_workouts']} workouts)")
+
+
+def _export_compactor_loop():
+    while True:
+        time.sleep(WORKOUT_EXPORT_COMPACT_INTERVAL)
+        for name in os.listdir(STATS_DIR):
+            if name.endswith("_workout_stats.delta.jsonl"):
+                user_id = name[:-len("_workout_stats.delta.jsonl")]
+                try:
+                    compact_workout_export(user_id)
+                except Exception as e:
+                    print(f"Error compacting workout export for {user_id}: {e}")
+
+
+def _start_export_compactor():
+    global _compactor_started
+    with _export_locks_guard:
+        if _compactor_started:
+            return
+        _compactor_started = True
+    threading.Thread(target=_export_compactor_loop, name="export-compactor", daemon=True).start()
+
+
+def export_workout_stats_to_json(user_id="default_user"):
+    """Export all workout stats for a user to a JSON file (full rewrite from MySQL)"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return None
+
+            cursor = connection.cursor(dictionary=True)
+            query = """
+            SELECT * FROM workout_stats 
+            WHERE user_id = %s 
+            ORDER BY workout_date DESC, create_time DESC
+            """
+            cursor.execute(query, (user_id,))
+            workouts = cursor.fetchall()
+            cursor.close()
+
+        for workout in workouts:
+            serialize_workout(workout)
+
+        json_file_path, delta_path = workout_export_paths(user_id)
+        with _export_lock(user_id):
+            _write_json_atomic(json_file_path, {
                 'user_id': user_id,
                 'total_workouts': len(workouts),
                 'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'workouts': workouts
-            }, f, indent=2)
+            })
+            # Keep delta rows appended after our SELECT; drop the ones now in the snapshot
+            exported_ids = {w['id'] for w in workouts}
+            remaining = [w for w in _read_delta(delta_path) if w.get('id') not in exported_ids]
+            if remaining:
+                tmp_path = f"{delta_path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write("".join(json.dumps(w) + "\n" for w in remaining))
+                os.replace(tmp_path, delta_path)
+            elif os.path.exists(delta_path):
+                os.remove(delta_path)
+            _delta_rows[user_id] = len(remaining)
 
         print(f"📊 Exported {len(workouts)} workouts to {json_file_path}")
+        event_broker.publish(user_id, "export_ready", {"total_workouts": len(workouts)})
         return json_file_path
 
     except Exception as e:
@@ -399,52 +2636,250 @@ def export_workout_stats_to_json(user_id="default_user"):
         return None
 
 
-def save_to_mysql(session_id: str, question: str, answer: str):
-    """Save Q&A into MySQL conversation table and extract workout stats with AI"""
-    try:
-        connection = get_mysql_connection()
-        if not connection:
-            print("❌ No MySQL connection, skipping save")
-            return
+def parse_message_blob(message_json) -> List[Dict]:
+    """Parse a legacy conversation.message JSON blob into role/content dicts"""
+    if isinstance(message_json, str):
+        try:
+            message_json = json.loads(message_json)
+        except json.JSONDecodeError as je:
+            print(f"Error parsing message JSON: {je}")
+            return []
 
-        cursor = connection.cursor()
-        cursor.execute("SELECT message FROM conversation WHERE dialog_id = %s", (session_id,))
-        row = cursor.fetchone()
-        messages = []
-        if row and row[0]:
-            try:
-                messages = json.loads(row[0])
-            except Exception as je:
-                print(f"JSON parse error: {je}")
+    messages = []
+    if isinstance(message_json, list):
+        for msg in message_json:
+            if isinstance(msg, dict):
+                content = msg.get('content')
+                role = msg.get('role', 'assistant')
+                if content:
+                    messages.append({"role": role, "content": content})
+    return messages
+
+
+def _explode_message_blob(cursor, dialog_id: str, message_json, create_time, create_date,
+                          pending_turn: Optional[tuple] = None) -> int:
+    """Insert the messages of a legacy blob as conversation_message rows starting at seq 1.
+
+    RAGFlow writes each streamed turn into the blob itself, so the turn being saved
+    (`pending_turn`, a (question, answer) pair) may already be its tail. Only that exact copy is
+    left out: the question as the last message, or the question followed by the same answer.
+    A repeated or regenerated question that already has a different reply is a real turn.
+    """
+    messages = parse_message_blob(message_json)
+    if pending_turn is not None:
+        question, answer = pending_turn
+        asked = {"role": "user", "content": question}
+        if messages[-1:] == [asked]:
+            messages = messages[:-1]
+        elif messages[-2:] == [asked, {"role": "assistant", "content": answer}]:
+            messages = messages[:-2]
+    if not messages:
+        return 0
+
+    cursor.executemany(
+        """INSERT INTO conversation_message
+        (dialog_id, seq, role, content, create_time, create_date)
+        VALUES (%s, %s, %s, %s, %s, %s)""",
+        [
+            (dialog_id, seq, msg['role'], msg['content'], create_time, create_date)
+            for seq, msg in enumerate(messages, start=1)
+        ]
+    )
+    return len(messages)
+
+
+def append_conversation_messages(cursor, session_id: str, question: str, answer: str) -> List[Dict]:
+    """Append one Q&A turn as conversation_message rows and return the recent history"""
+    now_ms = int(time.time() * 1000)
+    now_dt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Locking the parent row serializes overlapping turns for the same session
+    cursor.execute(
+        "SELECT message, create_time, create_date FROM conversation WHERE dialog_id = %s LIMIT 1 FOR UPDATE",
+        (session_id,)
+    )
+    row = cursor.fetchone()
+
+    if row:
+        cursor.execute(
+            "UPDATE conversation SET update_time=%s, update_date=%s WHERE dialog_id=%s",
+            (now_ms, now_dt, session_id)
+        )
+    else:
+        cursor.execute(
+            """INSERT INTO conversation 
+            (id, create_time, create_date, update_time, update_date, dialog_id, name, message, reference, user_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+            (uuid.uuid4().hex, now_ms, now_dt, now_ms, now_dt, session_id, question[:255], "[]", "[]", "default_user")
+        )
 
-        messages.append({"role": "user", "content": question})
-        messages.append({"role": "assistant", "content": answer})
+    # A brand-new dialog has no parent row to lock yet; a racing first turn shows up as a
+    # duplicate (dialog_id, seq) or a deadlock here, and save_to_mysql retries it
+    cursor.execute(
+        "SELECT COALESCE(MAX(seq), 0) FROM conversation_message WHERE dialog_id = %s FOR UPDATE",
+        (session_id,)
+    )
+    last_seq = cursor.fetchone()[0]
+
+    # Sessions written before the migration still carry their history in the blob
+    if last_seq == 0 and row and row[0]:
+        last_seq = _explode_message_blob(cursor, session_id, row[0], row[1], row[2],
+                                         pending_turn=(question, answer))
+
+    cursor.executemany(
+        """INSERT INTO conversation_message
+        (dialog_id, seq, role, content, create_time, create_date)
+        VALUES (%s, %s, %s, %s, %s, %s)""",
+        [
+            (session_id, last_seq + 1, "user", question, now_ms, now_dt),
+            (session_id, last_seq + 2, "assistant", answer, now_ms, now_dt)
+        ]
+    )
+
+    cursor.execute(
+        "SELECT role, content FROM conversation_message WHERE dialog_id = %s ORDER BY seq DESC LIMIT 6",
+        (session_id,)
+    )
+    return [{"role": role, "content": content} for role, content in reversed(cursor.fetchall())]
+
+
+def rewrite_conversation_blob(cursor, session_id: str, question: str, answer: str) -> List[Dict]:
+    """Legacy mode: append the turn to the conversation.message JSON blob"""
+    cursor.execute("SELECT message FROM conversation WHERE dialog_id = %s", (session_id,))
+    row = cursor.fetchone()
+    messages = []
+    if row and row[0]:
+        try:
+            messages = json.loads(row[0])
+        except Exception as je:
+            print(f"JSON parse error: {je}")
+
+    messages.append({"role": "user", "content": question})
+    messages.append({"role": "assistant", "content": answer})
+
+    now_ms = int(time.time() * 1000)
+    now_dt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    if row:
+        cursor.execute(
+            "UPDATE conversation SET message=%s, update_time=%s, update_date=%s WHERE dialog_id=%s",
+            (json.dumps(messages), now_ms, now_dt, session_id)
+        )
+    else:
+        cursor.execute(
+            """INSERT INTO conversation 
+            (id, create_time, create_date, update_time, update_date, dialog_id, name, message, reference, user_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+            (uuid.uuid4().hex, now_ms, now_dt, now_ms, now_dt, session_id, question[:255], json.dumps(messages), "[]", "default_user")
+        )
+    return messages[-6:]
 
-        now_ms = int(time.time() * 1000)
-        now_dt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        if row:
+def load_conversation(connection, dialog_id: str):
+    """Return (session_name, messages) for a dialog; session_name is None if it is unknown"""
+    cursor = connection.cursor(dictionary=True, buffered=True)
+    cursor.execute(
+        """
+        SELECT message, name, create_date 
+        FROM conversation 
+        WHERE dialog_id = %s 
+        ORDER BY create_date ASC
+        LIMIT 1
+        """,
+        (dialog_id,)
+    )
+    row = cursor.fetchone()
+
+    session_name = None
+    messages = []
+    if row:
+        session_name = row.get('name', 'Unnamed Session')
+        if MESSAGE_STORAGE == "rows":
             cursor.execute(
-                "UPDATE conversation SET message=%s, update_time=%s, update_date=%s WHERE dialog_id=%s",
-                (json.dumps(messages), now_ms, now_dt, session_id)
+                "SELECT role, content FROM conversation_message WHERE dialog_id = %s ORDER BY seq",
+                (dialog_id,)
             )
-        else:
+            messages = [
+                {"role": r['role'], "content": r['content']}
+                for r in cursor.fetchall() if r['content']
+            ]
+        if not messages:
+            messages = parse_message_blob(row.get('message', '[]'))
+
+    cursor.close()
+    return session_name, messages
+
+
+def migrate_conversation_messages() -> int:
+    """One-shot migration exploding conversation.message blobs into conversation_message rows"""
+    migrated = 0
+    with mysql_connection() as connection:
+        if not connection:
+            print("❌ No MySQL connection, skipping message migration")
+            return 0
+
+        cursor = connection.cursor(buffered=True)
+        cursor.execute("""
+            SELECT c.dialog_id FROM conversation c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM conversation_message m WHERE m.dialog_id = c.dialog_id
+            )
+        """)
+        dialog_ids = [r[0] for r in cursor.fetchall()]
+
+        for dialog_id in dialog_ids:
             cursor.execute(
-                """INSERT INTO conversation 
-                (id, create_time, create_date, update_time, update_date, dialog_id, name, message, reference, user_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                (uuid.uuid4().hex, now_ms, now_dt, now_ms, now_dt, session_id, question[:255], json.dumps(messages), "[]", "default_user")
+                "SELECT message, create_time, create_date FROM conversation WHERE dialog_id = %s LIMIT 1",
+                (dialog_id,)
             )
+            row = cursor.fetchone()
+            if row:
+                migrated += _explode_message_blob(cursor, dialog_id, row[0], row[1], row[2])
+                connection.commit()
 
-        connection.commit()
         cursor.close()
-        connection.close()
+
+    print(f"🗂️ Migrated {migrated} messages from {len(dialog_ids)} conversations")
+    return migrated
+
+
+# Duplicate key and deadlock: two turns of one session raced, running the turn again is safe
+MYSQL_RETRYABLE_ERRNOS = (1062, 1213)
+MYSQL_SAVE_ATTEMPTS = 3
+
+
+def save_to_mysql(session_id: str, question: str, answer: str):
+    """Save Q&A into MySQL conversation storage and extract workout stats with AI"""
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                print("❌ No MySQL connection, skipping save")
+                return
+
+            for attempt in range(MYSQL_SAVE_ATTEMPTS):
+                cursor = connection.cursor(buffered=True)
+                try:
+                    if MESSAGE_STORAGE == "rows":
+                        history = append_conversation_messages(cursor, session_id, question, answer)
+                    else:
+                        history = rewrite_conversation_blob(cursor, session_id, question, answer)
+                    connection.commit()
+                    break
+                except Error as e:
+                    connection.rollback()
+                    if e.errno not in MYSQL_RETRYABLE_ERRNOS or attempt == MYSQL_SAVE_ATTEMPTS - 1:
+                        raise
+                    print(f"🔁 Conversation save conflict ({e.errno}), retrying")
+                finally:
+                    cursor.close()
         print(f"💾 Saved conversation to MySQL")
 
-        workouts = extract_workout_data_with_ai(question, messages[-6:-1])
+        workouts = extract_workout_data_with_ai(question, history[:-1])
         if workouts:
             print(f"🏋️ AI detected {len(workouts)} workout(s)")
-            save_workout_stats(session_id, "default_user", workouts)
+            records = save_workout_stats(session_id, "default_user", workouts)
+            if records:
+                print(f"🏆 {len(records)} personal record(s) broken in this turn")
 
     except Exception as e:
         print(f"MySQL save error: {e}")
@@ -455,147 +2890,493 @@ def get_or_create_default_session():
     try:
         if not assistant:
             return None
-        sessions = assistant.list_sessions(page=1, page_size=1)
+        sessions = ragflow_breaker.call(assistant.list_sessions, page=1, page_size=1)
         if sessions and len(sessions) > 0:
             return sessions[0].id
         else:
-            new_session = assistant.create_session(name="Chat Session")
+            new_session = ragflow_breaker.call(assistant.create_session, name="Chat Session")
             return new_session.id
     except Exception as e:
         print(f"Error in get_or_create_default_session: {e}")
         return None
 
 
-def save_conversation_to_ragflow(session_id: str, question: str, answer: str):
-    """Save the complete Q&A to RAGFlow using REST API"""
+# How /ask generations end; a cancelled one is upstream work stopped because the client went away
+TRUNCATED_ANSWER_MARKER = "\n\n[truncated]"
+
+
+class GenerationStats:
+    """Per-backend outcome counters for /ask generations (completed / cancelled / failed)"""
+
+    OUTCOMES = ("completed", "cancelled", "failed", "hedge_lost")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_backend = {}
+
+    def record(self, backend: str, outcome: str, chars: int, seconds: float):
+        with self._lock:
+            stats = self._by_backend.setdefault(backend, {
+                **dict.fromkeys(self.OUTCOMES, 0),
+                'completed_chars': 0, 'completed_seconds': 0.0,
+                'cancelled_chars': 0, 'cancelled_seconds': 0.0
+            })
+            stats[outcome] += 1
+            if f'{outcome}_chars' in stats:
+                stats[f'{outcome}_chars'] += chars
+                stats[f'{outcome}_seconds'] += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            result = {}
+            for backend, stats in self._by_backend.items():
+                stats = dict(stats)
+                # Savings estimate: a cancelled answer would have run as long as an average completed one
+                avg_seconds = stats['completed_seconds'] / stats['completed'] if stats['completed'] else 0.0
+                stats['estimated_seconds_saved'] = max(
+                    0.0, avg_seconds * stats['cancelled'] - stats['cancelled_seconds'])
+                result[backend] = stats
+            return result
+
+
+generation_stats = GenerationStats()
+
+
+def cancel_generation(backend: str, session_id: Optional[str], question: str, answer: str, started: float,
+                      leg: Optional["HedgeLeg"] = None):
+    """Record a generation the client abandoned and persist whatever was streamed, marked as truncated"""
+    if leg is not None and leg.abandoned:
+        # Lost a hedged race: the client never saw this answer, so there is nothing to keep
+        generation_stats.record(backend, "hedge_lost", len(answer), time.monotonic() - started)
+        return
+    generation_stats.record(backend, "cancelled", len(answer), time.monotonic() - started)
+    print(f"✂️ {backend} generation cancelled by the client after {len(answer)} chars")
+    if answer and session_id:
+        background_jobs.submit("save_to_mysql", save_to_mysql, session_id, question,
+                               answer + TRUNCATED_ANSWER_MARKER)
+
+
+# /ask answer frames: deltas are batched into one SSE event per window or size limit; 0 ms sends every delta
+SSE_COALESCE_MS = int(os.getenv("SSE_COALESCE_MS", "50"))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "1024"))
+
+
+class SSEFrameCoalescer:
+    """Batches content deltas into one `data: {"content": ...}` frame per window_ms or max_bytes.
+
+    The first delta always goes out on its own, so time-to-first-token is unchanged. A held delta is
+    sent with a later one, or by flush() once time_left() runs out (the line readers below wake the
+    generator for that even while the upstream is stalled) and before done/error.
+    """
+
+    def __init__(self, window_ms: int = SSE_COALESCE_MS, max_bytes: int = SSE_COALESCE_BYTES):
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self._parts = []
+        self._size = 0
+        self._last_flush = None
+
+    def add(self, content: str) -> str:
+        """Buffer a delta; returns the frame to send now, or "" while the window is still open"""
+        self._parts.append(content)
+        self._size += len(content.encode('utf-8'))
+        now = time.monotonic()
+        if (self._last_flush is None or now - self._last_flush >= self.window
+                or (self.max_bytes and self._size >= self.max_bytes)):
+            return self.flush(now)
+        return ""
+
+    def time_left(self) -> Optional[float]:
+        """Seconds until the held delta is due (0 if overdue), or None when nothing is held"""
+        if not self._parts:
+            return None
+        return max(0.0, self._last_flush + self.window - time.monotonic())
+
+    def copy(self) -> "SSEFrameCoalescer":
+        """Fresh coalescer with the same settings (one per generator)"""
+        return SSEFrameCoalescer(int(self.window * 1000), self.max_bytes)
+
+    def flush(self, now: float = None) -> str:
+        """Frame for whatever is buffered ("" if nothing is)"""
+        if not self._parts:
+            return ""
+        content = "".join(self._parts)
+        self._parts, self._size = [], 0
+        self._last_flush = now or time.monotonic()
+        return f"data: {json.dumps({'content': content})}\n\n"
+
+
+def iter_upstream_lines(response, coalescer: SSEFrameCoalescer):
+    """response.iter_lines(), plus None whenever a held delta falls due before the next line.
+
+    A blocking read cannot time out without breaking the stream, so with a coalescing window the
+    lines are read on a helper thread; closing the response (disconnect, hedge loss) ends it.
+    """
+    if coalescer.window <= 0:
+        yield from response.iter_lines()
+        return
+
+    lines = queue.Queue()
+
+    def read():
+        try:
+            for line in response.iter_lines():
+                lines.put(line)
+            lines.put(None)
+        except Exception as e:
+            lines.put(e)
+
+    threading.Thread(target=read, name="upstream-lines", daemon=True).start()
+    while True:
+        try:
+            line = lines.get(timeout=coalescer.time_left())
+        except queue.Empty:
+            yield None
+            continue
+        if line is None:
+            return
+        if isinstance(line, Exception):
+            raise line
+        yield line
+
+
+def coalescer_from_args(args) -> SSEFrameCoalescer:
+    """Per-request override: /ask?coalesce_ms=&coalesce_bytes="""
+    def bounded(name, default, upper):
+        try:
+            return max(0, min(int(args.get(name, default)), upper))
+        except (TypeError, ValueError):
+            return default
+    return SSEFrameCoalescer(bounded("coalesce_ms", SSE_COALESCE_MS, 1000),
+                             bounded("coalesce_bytes", SSE_COALESCE_BYTES, 65536))
+
+
+# /ask routing: "static" = greeting list + circuit breaker, "adaptive" also skips RAGFlow while its rolling
+# time-to-first-token is above ROUTER_RAGFLOW_SLOW_MS, "hedged" also races direct Ollama after the budget
+ROUTER_MODE = os.getenv("ROUTER_MODE", "static")
+ROUTER_HEDGE_BUDGET_MS = int(os.getenv("ROUTER_HEDGE_BUDGET_MS", "2500"))
+ROUTER_RAGFLOW_SLOW_MS = int(os.getenv("ROUTER_RAGFLOW_SLOW_MS", "8000"))
+ROUTER_PROBE_EVERY = int(os.getenv("ROUTER_PROBE_EVERY", "10"))
+ROUTER_TTFT_WINDOW = int(os.getenv("ROUTER_TTFT_WINDOW", "50"))
+
+
+class LatencyRouter:
+    """Picks RAGFlow or direct Ollama for /ask from rolling time-to-first-token, and counts hedges"""
+
+    ROUTES = ("ragflow", "ollama", "hedged")
+
+    def __init__(self, mode: str = "static", window: int = 50, ragflow_slow_ms: int = 8000,
+                 probe_every: int = 10, hedge_budget_ms: int = 2500):
+        self.mode = mode
+        self.ragflow_slow = ragflow_slow_ms / 1000
+        self.probe_every = probe_every
+        self.hedge_budget = hedge_budget_ms / 1000
+        self._lock = threading.Lock()
+        self._ttft = {'ragflow': deque(maxlen=window), 'ollama': deque(maxlen=window)}
+        self._censored = {'ragflow': 0, 'ollama': 0}
+        self._slow_skips = 0
+        self._stats = {
+            'ragflow': 0, 'ollama_simple': 0, 'ollama_breaker_open': 0, 'ollama_ragflow_slow': 0,
+            'ragflow_probes': 0, 'hedged': 0, 'hedges_fired': 0, 'hedge_won_ragflow': 0,
+            'hedge_won_ollama': 0, 'hedge_fallbacks': 0
+        }
+
+    def record_ttft(self, backend: str, seconds: float):
+        with self._lock:
+            self._ttft[backend].append(seconds)
+
+    def record_censored(self, backend: str):
+        """A leg abandoned before its first token: only a lower bound, so it stays out of the median"""
+        with self._lock:
+            self._censored[backend] += 1
+
+    def count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _median_ttft(self, backend: str) -> Optional[float]:
+        samples = sorted(self._ttft[backend])
+        return samples[len(samples) // 2] if len(samples) >= 3 else None
+
+    def route(self, question: str) -> str:
+        """"ragflow", "ollama" or "hedged" for this question"""
+        if not needs_knowledge_base(question):
+            self.count('ollama_simple')
+            return "ollama"
+        if ragflow_breaker.is_open():
+            self.count('ollama_breaker_open')
+            return "ollama"
+        with self._lock:
+            ragflow_ttft = self._median_ttft('ragflow')
+            if self.mode != "static" and ragflow_ttft is not None and ragflow_ttft > self.ragflow_slow:
+                # Every Nth skipped question still goes to RAGFlow so the estimate can recover
+                self._slow_skips += 1
+                if not self.probe_every or self._slow_skips % self.probe_every:
+                    self._stats['ollama_ragflow_slow'] += 1
+                    return "ollama"
+                self._stats['ragflow_probes'] += 1
+            route = "hedged" if self.mode == "hedged" else "ragflow"
+            self._stats[route] += 1
+            return route
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            for backend, samples in self._ttft.items():
+                ordered = sorted(samples)
+                stats[f'{backend}_ttft_p50_ms'] = 1000 * ordered[len(ordered) // 2] if ordered else None
+                stats[f'{backend}_ttft_p95_ms'] = 1000 * ordered[int(len(ordered) * 0.95)] if ordered else None
+                stats[f'{backend}_ttft_censored'] = self._censored[backend]
+        stats['mode'] = self.mode
+        stats['hedge_budget_ms'] = self.hedge_budget * 1000
+        stats['hedge_rate'] = stats['hedges_fired'] / stats['hedged'] if stats['hedged'] else 0.0
+        return stats
+
+
+latency_router = LatencyRouter(
+    mode=ROUTER_MODE,
+    window=ROUTER_TTFT_WINDOW,
+    ragflow_slow_ms=ROUTER_RAGFLOW_SLOW_MS,
+    probe_every=ROUTER_PROBE_EVERY,
+    hedge_budget_ms=ROUTER_HEDGE_BUDGET_MS
+)
+
+
+def close_upstream(response):
+    """Close a streamed upstream response, waking a thread blocked reading it (requests or aiohttp)"""
+    raw = getattr(response, "raw", None)
+    if raw is not None and hasattr(raw, "shutdown"):
+        try:
+            raw.shutdown()  # urllib3 >= 2.3; closing the socket alone does not interrupt a pending recv
+        except (ValueError, RuntimeError, OSError):
+            pass
+    response.close()
+
+
+class HedgeLeg:
+    """One backend's generator in a hedged /ask"""
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.started = time.monotonic()
+        self.stopped = False    # the driver should stop pulling frames
+        self.abandoned = False  # lost the race: drop the partial answer instead of saving it
+        self.cancel = None      # asyncio driver: cancels the leg's task as well
+        self.response = None    # the leg's upstream response once it has headers
+        self._lock = threading.Lock()
+
+    def attach(self, response):
+        """Called by the generator once its upstream responded; a leg stopped meanwhile closes it at once"""
+        with self._lock:
+            self.response = response
+            stopped = self.stopped
+        if stopped:
+            close_upstream(response)
+
+    def stop(self, abandon: bool):
+        with self._lock:
+            self.stopped = True
+            self.abandoned = abandon
+            response = self.response
+        if self.cancel:
+            self.cancel()
+        if response is not None:
+            close_upstream(response)
+
+
+def generate_response(question: str, session_id: str, coalescer: Optional[SSEFrameCoalescer] = None,
+                      leg: Optional["HedgeLeg"] = None):
+    """Generator that yields assistant text chunks.
+
+    Streams from RAGFlow's session completions endpoint, which records the Q&A in the session
+    as part of the same call, so the answer never has to be regenerated just to persist it.
+    If the client disconnects, closing the generator closes the upstream stream so RAGFlow stops
+    generating, and the partial answer is saved with a truncated marker.
+    """
+    full_response = ""
+    response = None
+    coalescer = coalescer or SSEFrameCoalescer()
+    started = time.monotonic()
+    finished = False
     try:
         headers = {
             'Authorization': f'Bearer {API_KEY}',
             'Content-Type': 'application/json'
         }
-        url = f"{BASE_URL}/api/v1/chats/{CHAT_ID}/completions"
-        payload = {
-            "question": question,
-            "session_id": session_id,
-            "stream": False
-        }
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
-        if response.status_code == 200:
-            print(f"✓ Conversation saved to session {session_id}")
-        else:
-            print(f"✗ Error saving to RAGFlow: {response.status_code}")
-    except requests.exceptions.Timeout:
-        print(f"✗ RAGFlow save timed out for session {session_id}")
-    except Exception as e:
-        print(f"✗ Error saving to RAGFlow: {e}")
+        with ragflow_breaker.guard() as outcome:
+            response = outbound_http.post(
+                f"{BASE_URL}/api/v1/chats/{CHAT_ID}/completions",
+                headers=headers,
+                json={
+                    "question": question,
+                    "session_id": session_id,
+                    "stream": True
+                },
+                stream=True,
+                timeout=(RAGFLOW_CONNECT_TIMEOUT, RAGFLOW_READ_TIMEOUT)
+            )
+            if response.status_code >= 500:
+                outcome.fail()
+        if leg:
+            leg.attach(response)
 
+        if response.status_code != 200:
+            finished = True
+            generation_stats.record("ragflow", "failed", 0, time.monotonic() - started)
+            yield f"data: {json.dumps({'error': f'RAGFlow error: {response.status_code}'})}\n\n"
+            yield f"data: {json.dumps({'done': True})}\n\n"
+            return
 
-def generate_response(question: str, session_id: str,
-                      system_prompt: str = "You are a helpful fitness and health assistant."):
-    """Generator that yields assistant text chunks"""
-    full_response = ""
-    try:
-        completion = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ],
-            stream=True,
-            extra_body={
-                "reference": True,
-                "session_id": session_id
-            }
-        )
-        for chunk in completion:
-            delta = chunk.choices[0].delta
-            if hasattr(delta, "content") and delta.content:
-                content = delta.content
+        for line in iter_upstream_lines(response, coalescer):
+            if line is None:
+                yield coalescer.flush()
+                continue
+            if not line:
+                continue
+            line = line.decode('utf-8')
+            if not line.startswith("data:"):
+                continue
+            try:
+                event = json.loads(line[5:])
+            except json.JSONDecodeError:
+                continue
+
+            if event.get("code", 0) != 0:
+                yield coalescer.flush() + f"data: {json.dumps({'error': event.get('message', 'RAGFlow error')})}\n\n"
+                break
+            data = event.get("data")
+            if not isinstance(data, dict):
+                break  # RAGFlow ends the stream with "data": true
+
+            # RAGFlow sends the cumulative answer; only forward the new part
+            answer = data.get("answer") or ""
+            content = answer[len(full_response):] if answer.startswith(full_response) else answer
+            if content:
+                if not full_response and not (leg and leg.stopped):
+                    latency_router.record_ttft("ragflow", time.monotonic() - started)
                 full_response += content
-                yield f"data: {json.dumps({'content': content})}\n\n"
+                frame = coalescer.add(content)
+                if frame:
+                    yield frame
 
-        if full_response:
+        finished = True
+        generation_stats.record("ragflow", "completed", len(full_response), time.monotonic() - started)
+        if full_response and not (leg and leg.abandoned):
             # Save to MySQL (which also extracts workout stats)
-            thread = threading.Thread(
-                target=save_to_mysql,
-                args=(session_id, question, full_response)
-            )
-            thread.daemon = True
-            thread.start()
-
-            # (Optional) Save to RAGFlow too
-            thread2 = threading.Thread(
-                target=save_conversation_to_ragflow,
-                args=(session_id, question, full_response)
-            )
-            thread2.daemon = True
-            thread2.start()
-
-        yield f"data: {json.dumps({'done': True})}\n\n"
+            background_jobs.submit("save_to_mysql", save_to_mysql, session_id, question, full_response)
+
+        yield coalescer.flush() + f"data: {json.dumps({'done': True})}\n\n"
+    except GeneratorExit:
+        # The server closes the generator when a write to the client fails (tab closed, regenerate)
+        if not finished:
+            cancel_generation("ragflow", session_id, question, full_response, started, leg)
+        raise
     except Exception as e:
+        finished = True
+        if leg and leg.stopped:
+            # The hedge race closed our upstream under us; this is a cancellation, not a backend failure
+            cancel_generation("ragflow", session_id, question, full_response, started, leg)
+            return
+        generation_stats.record("ragflow", "failed", len(full_response), time.monotonic() - started)
         print(f"Error in generate_response: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield coalescer.flush() + f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        if response is not None:
+            # Mid-stream this drops the upstream connection, which is what makes the backend stop
+            response.close()
 
 
-def generate_response_direct(question: str, session_id: str = None):
+DIRECT_SYSTEM_PROMPT = """You are FitCoach, a helpful and friendly fitness assistant. 
+You help users with workout plans, nutrition advice, and fitness goals.
+Be concise, encouraging, and practical."""
+
+
+def direct_chat_payload(question: str) -> Dict:
+    """Ollama /api/chat request body for the direct (no knowledge base) path"""
+    return {
+        "model": os.getenv("MODEL", "llama3.2:latest"),
+        "messages": [
+            {"role": "system", "content": DIRECT_SYSTEM_PROMPT},
+            {"role": "user", "content": question}
+        ],
+        "stream": True
+    }
+
+
+def generate_response_direct(question: str, session_id: str = None,
+                             coalescer: Optional[SSEFrameCoalescer] = None, leg: Optional["HedgeLeg"] = None):
     """Direct Ollama response - for simple questions that don't need knowledge base"""
     full_response = ""
+    response = None
+    coalescer = coalescer or SSEFrameCoalescer()
+    started = time.monotonic()
+    finished = False
     
     ollama_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    model = os.getenv("MODEL", "llama3.2:latest")
-    
-    system_prompt = """You are FitCoach, a helpful and friendly fitness assistant. 
-You help users with workout plans, nutrition advice, and fitness goals.
-Be concise, encouraging, and practical."""
     
     try:
-        response = requests.post(
-            f"{ollama_url}/api/chat",
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ],
-                "stream": True
-            },
-            stream=True,
-            timeout=120
-        )
+        with ollama_breaker.guard() as outcome:
+            response = outbound_http.post(
+                f"{ollama_url}/api/chat",
+                json=direct_chat_payload(question),
+                stream=True,
+                timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+            )
+            if response.status_code >= 500:
+                outcome.fail()
+        if leg:
+            leg.attach(response)
         
         if response.status_code != 200:
+            finished = True
+            generation_stats.record("ollama", "failed", 0, time.monotonic() - started)
             yield f"data: {json.dumps({'error': f'Ollama error: {response.status_code}'})}\n\n"
             yield f"data: {json.dumps({'done': True})}\n\n"
             return
         
-        for line in response.iter_lines():
-            if line:
+        for line in iter_upstream_lines(response, coalescer):
+            if line is None:
+                yield coalescer.flush()
+            elif line:
                 try:
                     data = json.loads(line)
-                    if "message" in data and "content" in data["message"]:
+                    if data.get("message", {}).get("content"):
                         content = data["message"]["content"]
+                        if not full_response and not (leg and leg.stopped):
+                            latency_router.record_ttft("ollama", time.monotonic() - started)
                         full_response += content
-                        yield f"data: {json.dumps({'content': content})}\n\n"
+                        frame = coalescer.add(content)
+                        if frame:
+                            yield frame
                     if data.get("done"):
                         break
                 except json.JSONDecodeError:
                     continue
         
+        finished = True
+        generation_stats.record("ollama", "completed", len(full_response), time.monotonic() - started)
         # Save to MySQL in background
-        if full_response and session_id:
-            thread = threading.Thread(
-                target=save_to_mysql,
-                args=(session_id, question, full_response)
-            )
-            thread.daemon = True
-            thread.start()
+        if full_response and session_id and not (leg and leg.abandoned):
+            background_jobs.submit("save_to_mysql", save_to_mysql, session_id, question, full_response)
         
-        yield f"data: {json.dumps({'done': True})}\n\n"
+        yield coalescer.flush() + f"data: {json.dumps({'done': True})}\n\n"
         
+    except GeneratorExit:
+        if not finished:
+            cancel_generation("ollama", session_id, question, full_response, started, leg)
+        raise
     except Exception as e:
+        finished = True
+        if leg and leg.stopped:
+            cancel_generation("ollama", session_id, question, full_response, started, leg)
+            return
+        generation_stats.record("ollama", "failed", len(full_response), time.monotonic() - started)
         print(f"Error in direct response: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield coalescer.flush() + f"data: {json.dumps({'error': str(e)})}\n\n"
         yield f"data: {json.dumps({'done': True})}\n\n"
+    finally:
+        if response is not None:
+            response.close()
 
 
 def needs_knowledge_base(question: str) -> bool:
@@ -622,10 +3403,122 @@ def needs_knowledge_base(question: str) -> bool:
     return True
 
 
+class HedgeRace:
+    """Decisions for one hedged /ask, shared by the threaded and the asyncio drivers.
+
+    RAGFlow starts first; direct Ollama joins once the budget passes without a RAGFlow token, or at
+    once if RAGFlow ends without any content. The first leg to send content wins and the other is
+    abandoned. A leg's frames are held back until it wins.
+    """
+
+    def __init__(self, budget: float):
+        self.legs = {}
+        self.held = {}
+        self.running = set()
+        self.winner = None
+        self.last_ended = None
+        self.hedge_at = time.monotonic() + budget
+
+    def add(self, backend: str) -> HedgeLeg:
+        leg = self.legs[backend] = HedgeLeg(backend)
+        self.held[backend] = []
+        self.running.add(backend)
+        return leg
+
+    def timeout(self) -> Optional[float]:
+        """How long the driver may wait for the next frame before Ollama is due (None = no deadline)"""
+        if self.winner or "ollama" in self.legs:
+            return None
+        return max(0.0, self.hedge_at - time.monotonic())
+
+    def on_frame(self, backend: str, frame: str) -> str:
+        """Text to send to the client for a frame from one leg ("" when it is held or dropped)"""
+        if self.winner is None:
+            if not frame.startswith('data: {"content"'):
+                self.held[backend].append(frame)
+                return ""
+            self.winner = backend
+            if "ollama" in self.legs and "ragflow" in self.legs:
+                latency_router.count(f'hedge_won_{backend}')
+            for name, leg in self.legs.items():
+                if name != backend:
+                    if name in self.running:
+                        latency_router.record_censored(name)
+                    leg.stop(abandon=True)
+            return "".join(self.held[backend]) + frame
+        return frame if backend == self.winner else ""
+
+    def on_end(self, backend: str) -> bool:
+        """A leg's generator finished; True when direct Ollama should start now as a fallback"""
+        self.running.discard(backend)
+        self.last_ended = backend
+        if self.winner is None and "ollama" not in self.legs:
+            latency_router.count('hedge_fallbacks')
+            return True
+        return False
+
+    def finished(self) -> bool:
+        return not self.running or (self.winner is not None and self.winner not in self.running)
+
+    def leftovers(self) -> str:
+        """Error/done frames of the last leg when no leg ever produced content"""
+        return "" if self.winner else "".join(self.held.get(self.last_ended, []))
+
+    def close(self):
+        """The client went away: the winner saves its partial answer, everyone else is abandoned"""
+        for name, leg in self.legs.items():
+            leg.stop(abandon=name != self.winner)
+
+
+def _pump_hedge_leg(leg: HedgeLeg, frames, out: queue.Queue):
+    """Thread body for one leg of generate_hedged; stop() closes the leg's upstream, ending a blocked read"""
+    try:
+        for frame in frames:
+            if leg.stopped:
+                break
+            out.put((leg.backend, frame))
+    finally:
+        frames.close()
+        out.put((leg.backend, None))
+
+
+def generate_hedged(question: str, session_id: str, coalescer: SSEFrameCoalescer):
+    """RAGFlow with a direct-Ollama hedge after ROUTER_HEDGE_BUDGET_MS; streams whichever answers first"""
+    race = HedgeRace(latency_router.hedge_budget)
+    out = queue.Queue()
+
+    def start(backend: str):
+        leg = race.add(backend)
+        generator = generate_response if backend == "ragflow" else generate_response_direct
+        threading.Thread(target=_pump_hedge_leg, name=f"hedge-{backend}", daemon=True,
+                         args=(leg, generator(question, session_id, coalescer.copy(), leg), out)).start()
+
+    start("ragflow")
+    try:
+        while not race.finished():
+            try:
+                backend, frame = out.get(timeout=race.timeout())
+            except queue.Empty:
+                latency_router.count('hedges_fired')
+                start("ollama")
+                continue
+            if frame is None:
+                if race.on_end(backend):
+                    start("ollama")
+                continue
+            text = race.on_frame(backend, frame)
+            if text:
+                yield text
+        if race.leftovers():
+            yield race.leftovers()
+    finally:
+        race.close()
+
+
 @app.route("/")
 def index():
     # Create workout stats table on startup
-    create_workout_stats_table()
+    create_tables()
 
     # Ensure there's always an active session
     if "active_session_id" not in session:
@@ -654,183 +3547,486 @@ def ask():
 
     session["active_session_id"] = session_id
     
-    # Hybrid: use direct Ollama for simple questions, RAGFlow for fitness questions
-    if needs_knowledge_base(question):
-        print(f"[HYBRID] Using RAGFlow for: {question[:50]}...")
-        return Response(generate_response(question, session_id), mimetype="text/event-stream")
-    else:
-        print(f"[HYBRID] Using Direct Ollama for: {question[:50]}...")
-        return Response(generate_response_direct(question, session_id), mimetype="text/event-stream")
+    # Hybrid: direct Ollama for simple questions (and while RAGFlow is down or slow), RAGFlow for
+    # fitness questions, optionally hedged with direct Ollama (see ROUTER_MODE)
+    route = latency_router.route(question)
+    coalescer = coalescer_from_args(request.args)
+    print(f"[HYBRID] Using {route} for: {question[:50]}...")
+    if route == "hedged":
+        return Response(generate_hedged(question, session_id, coalescer), mimetype="text/event-stream")
+    if route == "ragflow":
+        return Response(generate_response(question, session_id, coalescer), mimetype="text/event-stream")
+    return Response(generate_response_direct(question, session_id, coalescer), mimetype="text/event-stream")
+
+
+def format_sse_event(event: Dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+def format_sse_batch(events: List[Dict], missed: bool) -> str:
+    """One write for an /events wake-up: resync marker, the events, or a heartbeat comment"""
+    frames = []
+    if missed:
+        # Ring overflowed or the server restarted: the client should re-sync from the change feed
+        frames.append("event: resync\ndata: {}\n\n")
+    frames.extend(format_sse_event(e) for e in events)
+    # Heartbeat comment when there is nothing else; a failed write is how a closed tab is noticed
+    return "".join(frames) or ": keepalive\n\n"
+
+
+@app.route("/events", methods=["GET"])
+def stats_events():
+    """Server-sent stats events for a user: workouts_detected, pr_broken, export_ready (and resync).
+
+    Each open stream holds one server thread while it waits; serve-async routes /events to
+    events_async instead, which does not.
+    """
+    user_id = request.args.get("user_id", "default_user")
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+
+    try:
+        cursor, missed = event_broker.subscribe(user_id, last_event_id)
+    except OverflowError as e:
+        return jsonify({"error": str(e)}), 503
+
+    def stream(cursor, missed):
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        events = []
+        while True:
+            yield format_sse_batch(events, missed)
+            events, missed, cursor = event_broker.wait(user_id, cursor, EVENTS_HEARTBEAT)
+
+    response = Response(stream(cursor, missed), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    # Runs whether or not the stream ever started, so the subscriber slot is always returned
+    response.call_on_close(lambda: event_broker.unsubscribe(user_id))
+    return response
+
+
+WORKOUT_PAGE_DEFAULT = int(os.getenv("WORKOUT_PAGE_DEFAULT", "200"))
+WORKOUT_PAGE_MAX = int(os.getenv("WORKOUT_PAGE_MAX", "1000"))
+WORKOUT_KEYSET_COLUMNS = ('workout_date', 'create_time', 'id')
+
+
+def encode_page_cursor(workout: Dict) -> str:
+    """Opaque cursor pointing just past a workout in (workout_date, create_time, id) DESC order"""
+    key = f"{workout['workout_date']}|{workout['create_time'] or 0}|{workout['id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def decode_page_cursor(cursor_value: str) -> tuple:
+    try:
+        padded = cursor_value + "=" * (-len(cursor_value) % 4)
+        workout_date, create_time, workout_id = base64.urlsafe_b64decode(padded).decode().split("|", 2)
+        return parse_workout_date(workout_date), int(create_time), workout_id
+    except Exception:
+        raise ValueError("invalid 'after' cursor")
+
+
+def parse_page_args(args) -> tuple:
+    """Read limit/after/fields query params into (limit, after key or None, columns or None)"""
+    limit = args.get("limit", WORKOUT_PAGE_DEFAULT, type=int)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    limit = min(limit, WORKOUT_PAGE_MAX)
+
+    after = decode_page_cursor(args["after"]) if args.get("after") else None
+
+    fields = None
+    if args.get("fields"):
+        fields = [f.strip() for f in args["fields"].split(",") if f.strip()]
+        unknown = [f for f in fields if f not in WORKOUT_COLUMNS]
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return limit, after, fields
+
+
+def fetch_workout_page(cursor, where: str, params: list, limit: int,
+                       after: Optional[tuple] = None, fields: Optional[List[str]] = None) -> tuple:
+    """Run one keyset page of a workout_stats listing; returns (workouts, next_cursor or None)"""
+    columns = list(dict.fromkeys((fields or list(WORKOUT_COLUMNS)) + list(WORKOUT_KEYSET_COLUMNS)))
+    query = f"SELECT {', '.join(columns)} FROM workout_stats WHERE {where}"
+    params = list(params)
+    if after:
+        query += " AND (workout_date, create_time, id) < (%s, %s, %s)"
+        params.extend(after)
+    # One extra row tells us whether another page exists
+    query += " ORDER BY workout_date DESC, create_time DESC, id DESC LIMIT %s"
+    params.append(limit + 1)
+
+    cursor.execute(query, params)
+    workouts = cursor.fetchall()
+
+    next_cursor = None
+    if len(workouts) > limit:
+        workouts = workouts[:limit]
+        next_cursor = encode_page_cursor(workouts[-1])
+
+    for workout in workouts:
+        serialize_workout(workout)
+        if fields:
+            for column in WORKOUT_KEYSET_COLUMNS:
+                if column not in fields:
+                    workout.pop(column)
+    return workouts, next_cursor
 
 
 @app.route("/workout-stats", methods=["GET"])
+@conditional_stats_response
 def get_workout_stats():
-    """Get workout statistics for a user"""
+    """Get workout statistics for a user, one keyset page at a time (?limit=&after=&fields=)"""
+    user_id = request.args.get("user_id", "default_user")
+    days = request.args.get("days", 30, type=int)
+    exercise_type = request.args.get("type")  # strength, cardio, other
+
+    try:
+        limit, after, fields = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            cursor = connection.cursor(dictionary=True)
+
+            # Build query based on filters
+            where = "user_id = %s AND workout_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)"
+            params = [user_id, days]
+
+            if exercise_type:
+                where += " AND exercise_type = %s"
+                params.append(exercise_type)
+
+            workouts, next_cursor = fetch_workout_page(cursor, where, params, limit, after, fields)
+            cursor.close()
+
+        return jsonify({
+            "count": len(workouts),
+            "workouts": workouts,
+            "next_cursor": next_cursor
+        })
+
+    except Exception as e:
+        print(f"Error getting workout stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/workout-stats/summary", methods=["GET"])
+@conditional_stats_response
+def get_workout_summary():
+    """Get summary statistics for workouts"""
+    user_id = request.args.get("user_id", "default_user")
+    days = request.args.get("days", 30, type=int)
+
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            cursor = connection.cursor(dictionary=True)
+
+            # Get summary by exercise type from the daily rollup (one row per day and exercise)
+            query = """
+            SELECT 
+                NULLIF(exercise_type, '') as exercise_type,
+                SUM(workout_count) as workout_count,
+                COUNT(DISTINCT workout_date) as days_worked_out,
+                SUM(set_count) as total_sets,
+                SUM(rep_total) as total_reps,
+                SUM(weight_sum) / NULLIF(SUM(weight_count), 0) as avg_weight,
+                MAX(max_weight) as max_weight,
+                SUM(volume) as total_volume,
+                SUM(duration_total) as total_duration,
+                SUM(distance_total) as total_distance
+            FROM workout_daily_rollup
+            WHERE user_id = %s 
+            AND workout_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+            GROUP BY exercise_type
+            """
+
+            cursor.execute(query, (user_id, days))
+            summary_by_type = cursor.fetchall()
+
+            # Convert decimals to float
+            for row in summary_by_type:
+                if row.get('avg_weight'):
+                    row['avg_weight'] = float(row['avg_weight'])
+                if row.get('max_weight'):
+                    row['max_weight'] = float(row['max_weight'])
+                if row.get('total_distance'):
+                    row['total_distance'] = float(row['total_distance'])
+                if row.get('total_volume'):
+                    row['total_volume'] = float(row['total_volume'])
+
+            # Get personal records (maintained on write, one row per exercise and unit)
+            pr_query = """
+            SELECT exercise_name, record_value as max_weight, NULLIF(unit, '') as weight_unit
+            FROM personal_record
+            WHERE user_id = %s AND record_type = 'max_weight'
+            ORDER BY record_value DESC
+            LIMIT 10
+            """
+
+            cursor.execute(pr_query, (user_id,))
+            personal_records = cursor.fetchall()
+
+            for pr in personal_records:
+                if pr.get('max_weight'):
+                    pr['max_weight'] = float(pr['max_weight'])
+
+            cursor.close()
+
+        return jsonify({
+            "summary_by_type": summary_by_type,
+            "personal_records": personal_records,
+            "period_days": days
+        })
+
+    except Exception as e:
+        print(f"Error getting workout summary: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/workout-stats/records", methods=["GET"])
+@conditional_stats_response
+def get_personal_records():
+    """Get every personal record of a user (max weight, best volume, longest distance, fastest pace)"""
     user_id = request.args.get("user_id", "default_user")
-    days = request.args.get("days", 30, type=int)
-    exercise_type = request.args.get("type")  # strength, cardio, other
 
     try:
-        connection = get_mysql_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
+        with mysql_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
 
-        cursor = connection.cursor(dictionary=True)
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT exercise_name, record_type, NULLIF(unit, '') as unit,
+                       record_value, previous_value, workout_date
+                FROM personal_record
+                WHERE user_id = %s
+                ORDER BY exercise_name, record_type
+            """, (user_id,))
+            records = cursor.fetchall()
+            cursor.close()
 
-        # Build query based on filters
-        query = """
-        SELECT * FROM workout_stats 
-        WHERE user_id = %s 
-        AND workout_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
-        """
-        params = [user_id, days]
+        for record in records:
+            record['record_value'] = float(record['record_value'])
+            if record.get('previous_value') is not None:
+                record['previous_value'] = float(record['previous_value'])
+            if record.get('workout_date'):
+                record['workout_date'] = record['workout_date'].strftime('%Y-%m-%d')
 
-        if exercise_type:
-            query += " AND exercise_type = %s"
-            params.append(exercise_type)
+        return jsonify({"user_id": user_id, "records": records})
 
-        query += " ORDER BY workout_date DESC, create_time DESC"
+    except Exception as e:
+        print(f"Error getting personal records: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        cursor.execute(query, params)
-        workouts = cursor.fetchall()
 
-        # Convert to JSON-serializable format
-        for workout in workouts:
-            if workout.get('weight'):
-                workout['weight'] = float(workout['weight'])
-            if workout.get('distance'):
-                workout['distance'] = float(workout['distance'])
-            if workout.get('workout_date'):
-                workout['workout_date'] = workout['workout_date'].strftime('%Y-%m-%d')
-            if workout.get('create_date'):
-                workout['create_date'] = workout['create_date'].strftime('%Y-%m-%d %H:%M:%S')
+# /workout-stats/series: metric -> aggregate over workout_daily_rollup rows in a bucket
+SERIES_METRICS = {
+    "count": "SUM(workout_count)",
+    "sets": "SUM(set_count)",
+    "reps": "SUM(rep_total)",
+    "volume": "SUM(volume)",
+    "max_weight": "MAX(max_weight)",
+    "avg_weight": "SUM(weight_sum) / NULLIF(SUM(weight_count), 0)",
+    "duration": "SUM(duration_total)",
+    "distance": "SUM(distance_total)"
+}
+SERIES_BUCKETS = {
+    "day": "workout_date",
+    "week": "DATE_SUB(workout_date, INTERVAL WEEKDAY(workout_date) DAY)",
+    "month": "DATE_SUB(workout_date, INTERVAL DAYOFMONTH(workout_date) - 1 DAY)"
+}
+SERIES_DEFAULT_POINTS = int(os.getenv("SERIES_DEFAULT_POINTS", "200"))
+SERIES_MAX_POINTS = int(os.getenv("SERIES_MAX_POINTS", "1000"))
+
+
+def lttb_indices(xs: List[float], ys: List[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the series' visual shape"""
+    n = len(xs)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        # No middle buckets to choose from; the end points are all that fits
+        return [0, n - 1][-max(threshold, 1):]
+
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(ys[avg_start:avg_end]) / (avg_end - avg_start)
+
+        best_area = -1.0
+        best = int(i * every) + 1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best_area = area
+                best = j
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+@app.route("/workout-stats/series", methods=["GET"])
+@conditional_stats_response
+def get_workout_series():
+    """Column-oriented time series of one metric (?metric=&bucket=day|week|month&points=&exercise=&type=)"""
+    user_id = request.args.get("user_id", "default_user")
+    metric = request.args.get("metric", "count")
+    bucket = request.args.get("bucket", "day")
+    days = request.args.get("days", 365, type=int)  # 0 = whole history
+    points = min(request.args.get("points", SERIES_DEFAULT_POINTS, type=int), SERIES_MAX_POINTS)
+    exercise_name = request.args.get("exercise")
+    exercise_type = request.args.get("type")
+
+    if metric not in SERIES_METRICS:
+        return jsonify({"error": f"metric must be one of: {', '.join(SERIES_METRICS)}"}), 400
+    if bucket not in SERIES_BUCKETS:
+        return jsonify({"error": f"bucket must be one of: {', '.join(SERIES_BUCKETS)}"}), 400
+    if points < 3:
+        return jsonify({"error": "points must be at least 3"}), 400
 
-        cursor.close()
-        connection.close()
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            cursor = connection.cursor()
+
+            # Read from the daily rollup, so the scan is bounded by days x exercises, not raw rows
+            where = "user_id = %s"
+            params = [user_id]
+            if days > 0:
+                where += " AND workout_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)"
+                params.append(days)
+            if exercise_name:
+                where += " AND exercise_name = %s"
+                params.append(exercise_name)
+            if exercise_type:
+                where += " AND exercise_type = %s"
+                params.append(exercise_type)
+
+            cursor.execute(f"""
+                SELECT DATE({SERIES_BUCKETS[bucket]}) AS bucket_date, {SERIES_METRICS[metric]} AS value
+                FROM workout_daily_rollup
+                WHERE {where}
+                GROUP BY bucket_date
+                HAVING value IS NOT NULL
+                ORDER BY bucket_date
+            """, params)
+            rows = cursor.fetchall()
+            cursor.close()
+
+        xs = [float(row[0].toordinal()) for row in rows]
+        ys = [float(row[1]) for row in rows]
+        keep = lttb_indices(xs, ys, points)
 
         return jsonify({
-            "total": len(workouts),
-            "workouts": workouts
+            "metric": metric,
+            "bucket": bucket,
+            "exercise": exercise_name,
+            "type": exercise_type,
+            "dates": [rows[i][0].strftime('%Y-%m-%d') for i in keep],
+            "values": [ys[i] for i in keep],
+            "raw_points": len(rows),
+            "downsampled": len(keep) < len(rows)
         })
 
     except Exception as e:
-        print(f"Error getting workout stats: {e}")
+        print(f"Error getting workout series: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/workout-stats/summary", methods=["GET"])
-def get_workout_summary():
-    """Get summary statistics for workouts"""
+@app.route("/workout-stats/changes", methods=["GET"])
+@conditional_stats_response
+def get_workout_changes():
+    """Get workout inserts/updates/deletes after a change cursor (?since=&limit=)"""
     user_id = request.args.get("user_id", "default_user")
-    days = request.args.get("days", 30, type=int)
+    since = request.args.get("since", type=int)
+    limit = min(request.args.get("limit", WORKOUT_CHANGES_PAGE, type=int), WORKOUT_CHANGES_PAGE)
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
 
     try:
-        connection = get_mysql_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        cursor = connection.cursor(dictionary=True)
-
-        # Get summary by exercise type
-        query = """
-        SELECT 
-            exercise_type,
-            COUNT(*) as workout_count,
-            COUNT(DISTINCT workout_date) as days_worked_out,
-            SUM(CASE WHEN sets IS NOT NULL THEN sets ELSE 1 END) as total_sets,
-            SUM(reps) as total_reps,
-            AVG(weight) as avg_weight,
-            MAX(weight) as max_weight,
-            SUM(duration) as total_duration,
-            SUM(distance) as total_distance
-        FROM workout_stats
-        WHERE user_id = %s 
-        AND workout_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
-        GROUP BY exercise_type
-        """
-
-        cursor.execute(query, (user_id, days))
-        summary_by_type = cursor.fetchall()
-
-        # Convert decimals to float
-        for row in summary_by_type:
-            if row.get('avg_weight'):
-                row['avg_weight'] = float(row['avg_weight'])
-            if row.get('max_weight'):
-                row['max_weight'] = float(row['max_weight'])
-            if row.get('total_distance'):
-                row['total_distance'] = float(row['total_distance'])
-
-        # Get personal records
-        pr_query = """
-        SELECT exercise_name, MAX(weight) as max_weight, weight_unit
-        FROM workout_stats
-        WHERE user_id = %s AND weight IS NOT NULL
-        GROUP BY exercise_name, weight_unit
-        ORDER BY max_weight DESC
-        LIMIT 10
-        """
+        with mysql_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
 
-        cursor.execute(pr_query, (user_id,))
-        personal_records = cursor.fetchall()
+            # No cursor yet: hand out the current position (load-json returns one that matches its snapshot)
+            if since is None:
+                position = current_change_cursor(connection, user_id)
+                return jsonify({"changes": [], "cursor": position, "has_more": False, "reset": True})
 
-        for pr in personal_records:
-            if pr.get('max_weight'):
-                pr['max_weight'] = float(pr['max_weight'])
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT seq, op, workout_id, workout FROM workout_change
+                WHERE user_id = %s AND seq > %s
+                ORDER BY seq
+                LIMIT %s
+            """, (user_id, since, limit + 1))
+            rows = cursor.fetchall()
+            cursor.close()
 
-        cursor.close()
-        connection.close()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        changes = [{
+            "seq": row['seq'],
+            "op": row['op'],
+            "id": row['workout_id'],
+            "workout": json.loads(row['workout']) if row['workout'] else None
+        } for row in rows]
 
         return jsonify({
-            "summary_by_type": summary_by_type,
-            "personal_records": personal_records,
-            "period_days": days
+            "changes": changes,
+            "cursor": rows[-1]['seq'] if rows else since,
+            "has_more": has_more,
+            "reset": False
         })
 
     except Exception as e:
-        print(f"Error getting workout summary: {e}")
+        print(f"Error getting workout changes: {e}")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/workout-stats/exercise/<exercise_name>", methods=["GET"])
+@conditional_stats_response
 def get_exercise_history(exercise_name):
-    """Get history for a specific exercise"""
+    """Get history for a specific exercise, one keyset page at a time (?limit=&after=&fields=)"""
     user_id = request.args.get("user_id", "default_user")
 
     try:
-        connection = get_mysql_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        cursor = connection.cursor(dictionary=True)
-
-        query = """
-        SELECT * FROM workout_stats
-        WHERE user_id = %s AND exercise_name = %s
-        ORDER BY workout_date DESC, create_time DESC
-        """
-
-        cursor.execute(query, (user_id, exercise_name))
-        history = cursor.fetchall()
+        limit, after, fields = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Convert to JSON-serializable format
-        for workout in history:
-            if workout.get('weight'):
-                workout['weight'] = float(workout['weight'])
-            if workout.get('distance'):
-                workout['distance'] = float(workout['distance'])
-            if workout.get('workout_date'):
-                workout['workout_date'] = workout['workout_date'].strftime('%Y-%m-%d')
-            if workout.get('create_date'):
-                workout['create_date'] = workout['create_date'].strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
 
-        cursor.close()
-        connection.close()
+            cursor = connection.cursor(dictionary=True)
+            history, next_cursor = fetch_workout_page(
+                cursor, "user_id = %s AND exercise_name = %s", [user_id, exercise_name],
+                limit, after, fields
+            )
+            cursor.close()
 
         return jsonify({
             "exercise": exercise_name,
-            "total_sessions": len(history),
-            "history": history
+            "count": len(history),
+            "history": history,
+            "next_cursor": next_cursor
         })
 
     except Exception as e:
@@ -838,24 +4034,80 @@ def get_exercise_history(exercise_name):
         return jsonify({"error": str(e)}), 500
 
 
+EXPORT_MIMETYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+
+def stream_workout_export(connection, user_id: str, fmt: str = "json",
+                          fetch_size: int = WORKOUT_EXPORT_FETCH_SIZE):
+    """Yield a user's full workout history as JSON, NDJSON or CSV text, one fetch batch at a time"""
+    try:
+        # Unbuffered cursor: rows stay on the server until fetchmany() pulls them
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        cursor.execute("""
+            SELECT * FROM workout_stats 
+            WHERE user_id = %s 
+            ORDER BY workout_date DESC, create_time DESC
+        """, (user_id,))
+
+        if fmt == "json":
+            yield '{"user_id": %s, "last_updated": %s, "workouts": [' % (
+                json.dumps(user_id), json.dumps(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+        elif fmt == "csv":
+            yield ",".join(cursor.column_names) + "\r\n"
+
+        total = 0
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows([serialize_workout(row)[col] for col in cursor.column_names] for row in rows)
+                chunk = buffer.getvalue()
+            else:
+                separator = ",\n" if fmt == "json" else "\n"
+                chunk = separator.join(json.dumps(serialize_workout(row), default=str) for row in rows)
+                if fmt == "json" and total:
+                    chunk = ",\n" + chunk
+                elif fmt == "ndjson":
+                    chunk += "\n"
+            total += len(rows)
+            yield chunk
+
+        if fmt == "json":
+            yield '], "total_workouts": %d}' % total
+        cursor.close()
+        print(f"📊 Streamed {total} workouts for {user_id} as {fmt}")
+    finally:
+        connection.close()
+
+
 @app.route("/workout-stats/export", methods=["GET"])
+@conditional_stats_response
 def export_stats():
-    """Export workout stats to JSON file"""
+    """Stream all workout stats for a user as JSON (or NDJSON / CSV with ?format=)"""
     user_id = request.args.get("user_id", "default_user")
+    fmt = request.args.get("format", "json")
 
-    try:
-        json_file_path = export_workout_stats_to_json(user_id)
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({"error": "format must be one of: json, ndjson, csv"}), 400
 
-        if json_file_path and os.path.exists(json_file_path):
-            with open(json_file_path, 'r') as f:
-                data = json.load(f)
-            return jsonify(data)
-        else:
-            return jsonify({"error": "Failed to export stats"}), 500
+    connection = get_mysql_connection()
+    if not connection:
+        return jsonify({"error": "Failed to export stats"}), 500
 
-    except Exception as e:
-        print(f"Error exporting stats: {e}")
-        return jsonify({"error": str(e)}), 500
+    response = Response(stream_workout_export(connection, user_id, fmt), mimetype=EXPORT_MIMETYPES[fmt])
+    # Returns the connection even if the client disconnects before the stream starts
+    response.call_on_close(connection.close)
+    if fmt == "csv":
+        response.headers["Content-Disposition"] = f'attachment; filename="{user_id}_workout_stats.csv"'
+    return response
 
 
 @app.route("/workout-stats", methods=["POST"])
@@ -870,42 +4122,114 @@ def manual_add_workout():
         user_id = data.get("user_id", "default_user")
         session_id = session.get("active_session_id", "manual_entry")
 
-        workout = {
-            'exercise_name': data.get('exercise_name'),
-            'exercise_type': data.get('exercise_type', 'other'),
-            'weight': float(data['weight']) if data.get('weight') else None,
-            'weight_unit': data.get('weight_unit'),
-            'reps': int(data['reps']) if data.get('reps') else None,
-            'sets': int(data['sets']) if data.get('sets') else None,
-            'duration': int(data['duration']) if data.get('duration') else None,
-            'duration_unit': data.get('duration_unit'),
-            'distance': float(data['distance']) if data.get('distance') else None,
-            'distance_unit': data.get('distance_unit'),
-            'calories': int(data['calories']) if data.get('calories') else None,
-            'notes': data.get('notes')
-        }
-
-        workout_date = data.get('workout_date')
-        if not workout_date:
-            workout_date = datetime.now().date()
+        workout = workout_from_record(data)
+        workout_date = parse_workout_date(data.get('workout_date'))
 
-        save_workout_stats(session_id, user_id, [workout], workout_date)
+        records = save_workout_stats(session_id, user_id, [workout], workout_date)
 
         return jsonify({
             "success": True,
-            "message": "Workout added successfully"
+            "message": "Workout added successfully",
+            "records": records
         })
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error manually adding workout: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/workout-stats/bulk", methods=["POST"])
+def bulk_add_workouts():
+    """Bulk-insert workouts streamed as JSON Lines or CSV in the request body (one transaction)"""
+    default_user = request.args.get("user_id", "default_user")
+    default_session = request.args.get("session_id", "bulk_import")
+    fmt = request.args.get("format")
+    if not fmt:
+        fmt = "csv" if "csv" in (request.content_type or "") else "jsonl"
+    if fmt not in ("jsonl", "csv"):
+        return jsonify({"error": "format must be 'jsonl' or 'csv'"}), 400
+
+    now_ms = int(time.time() * 1000)
+    now_dt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    errors = []
+    rejected = 0
+    users = set()
+    record_events = []
+
+    # The body is read record by record, so the upload is never held in memory as a whole
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    if fmt == "csv":
+        records = csv.DictReader(stream)
+    else:
+        records = (line for line in stream if line.strip())
+
+    def rows():
+        nonlocal rejected
+        for record_no, record in enumerate(records, start=1):
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                    if not isinstance(record, dict):
+                        raise ValueError("expected a JSON object")
+                user_id = record.get('user_id') or default_user
+                row = workout_row(
+                    user_id, record.get('session_id') or default_session,
+                    workout_from_record(record), parse_workout_date(record.get('workout_date')),
+                    now_ms, now_dt, record.get('id') or None
+                )
+            except (ValueError, TypeError) as e:
+                rejected += 1
+                if len(errors) < 20:
+                    errors.append({"record": record_no, "error": str(e)})
+                continue
+            if user_id not in users:
+                export_barrier.begin(user_id)
+                users.add(user_id)
+            yield row
+
+    try:
+        with mysql_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            cursor = connection.cursor()
+            try:
+                inserted = insert_workout_rows(cursor, rows(), record_events=record_events)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        print(f"💪 Bulk inserted {inserted} workout stats ({rejected} rejected)")
+        for user_id in users:
+            export_workout_stats_to_json(user_id)
+        bump_data_versions(users)
+
+        return jsonify({
+            "success": True,
+            "inserted": inserted,
+            "rejected": rejected,
+            "records_broken": len(record_events),
+            "errors": errors
+        })
+
+    except Exception as e:
+        print(f"Error bulk adding workouts: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        for user_id in users:
+            export_barrier.end(user_id)
+
+
 @app.route("/sessions", methods=["GET"])
 def list_sessions():
     """List all chat sessions"""
     try:
-        sessions = assistant.list_sessions(page=1, page_size=50)
+        sessions = ragflow_breaker.call(assistant.list_sessions, page=1, page_size=50)
         session_list = []
         for s in sessions:
             msg_count = 0
@@ -937,7 +4261,7 @@ def create_session():
         if not session_name.strip():
             session_name = f"Workout Session {datetime.now().strftime('%Y-%m-%d')}"
 
-        new_session = assistant.create_session(name=session_name)
+        new_session = ragflow_breaker.call(assistant.create_session, name=session_name)
         session["active_session_id"] = new_session.id
 
         return jsonify({
@@ -963,60 +4287,18 @@ def activate_session(session_id):
 def get_session_messages(session_id):
     """Get all messages from a session"""
     try:
-        connection = get_mysql_connection()
-
-        if not connection:
-            return get_session_messages_sdk(session_id)
-
-        cursor = connection.cursor(dictionary=True)
-
-        query = """
-            SELECT message, name, create_date 
-            FROM conversation 
-            WHERE dialog_id = %s 
-            ORDER BY create_date ASC
-            LIMIT 1
-        """
-
-        cursor.execute(query, (session_id,))
-        row = cursor.fetchone()
-
-        messages = []
-        session_name = "Unnamed Session"
-
-        if row:
-            session_name = row.get('name', 'Unnamed Session')
-            message_json = row.get('message', '[]')
-
-            if isinstance(message_json, str):
-                try:
-                    messages_array = json.loads(message_json)
-                    if isinstance(messages_array, list):
-                        for msg in messages_array:
-                            if isinstance(msg, dict):
-                                content = msg.get('content')
-                                role = msg.get('role', 'assistant')
-                                if content:
-                                    messages.append({"role": role, "content": content})
-                except json.JSONDecodeError as je:
-                    print(f"Error parsing message JSON: {je}")
-            elif isinstance(message_json, list):
-                for msg in message_json:
-                    if isinstance(msg, dict):
-                        content = msg.get('content')
-                        role = msg.get('role', 'assistant')
-                        if content:
-                            messages.append({"role": role, "content": content})
+        with mysql_connection() as connection:
+            if not connection:
+                return get_session_messages_sdk(session_id)
 
-        cursor.close()
-        connection.close()
+            session_name, messages = load_conversation(connection, session_id)
 
         print(f"Retrieved {len(messages)} messages from MySQL for session {session_id}")
 
         return jsonify({
             "messages": messages,
             "session_id": session_id,
-            "session_name": session_name
+            "session_name": session_name or "Unnamed Session"
         })
 
     except Exception as e:
@@ -1029,7 +4311,7 @@ def get_session_messages(session_id):
 def get_session_messages_sdk(session_id):
     """Fallback method using SDK"""
     try:
-        sessions = assistant.list_sessions(id=session_id)
+        sessions = ragflow_breaker.call(assistant.list_sessions, id=session_id)
 
         if not sessions or len(sessions) == 0:
             print(f"Session {session_id} not found")
@@ -1090,7 +4372,10 @@ def rename_session(session_id):
             'Content-Type': 'application/json'
         }
         update_url = f"{BASE_URL}/api/v1/chats/{CHAT_ID}/sessions/{session_id}"
-        response = requests.put(update_url, headers=headers, json={"name": new_name})
+        with ragflow_breaker.guard() as outcome:
+            response = outbound_http.put(update_url, headers=headers, json={"name": new_name}, timeout=10)
+            if response.status_code >= 500:
+                outcome.fail()
 
         if response.status_code == 200:
             print(f"Successfully renamed using API")
@@ -1099,6 +4384,9 @@ def rename_session(session_id):
             print(f"API rename failed: {response.status_code} - {response.text}")
             return jsonify({"error": "Failed to rename session"}), 500
 
+    except CircuitOpenError as e:
+        print(f"Error renaming session: {e}")
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         print(f"Error renaming session: {e}")
         return jsonify({"error": str(e)}), 500
@@ -1108,7 +4396,7 @@ def rename_session(session_id):
 def delete_session(session_id):
     """Delete a session"""
     try:
-        assistant.delete_session(session_id=session_id)
+        ragflow_breaker.call(assistant.delete_session, session_id=session_id)
         if session.get("active_session_id") == session_id:
             new_session_id = get_or_create_default_session()
             session["active_session_id"] = new_session_id
@@ -1133,57 +4421,20 @@ def get_current_session():
             return jsonify({"active_session": None, "error": "Could not create session"})
 
     try:
-        connection = get_mysql_connection()
         messages = []
         session_name = "Unnamed Session"
 
-        if connection:
-            try:
-                cursor = connection.cursor(dictionary=True)
-
-                query = """
-                    SELECT message, name, create_date 
-                    FROM conversation 
-                    WHERE dialog_id = %s 
-                    ORDER BY create_date ASC
-                    LIMIT 1
-                """
-
-                cursor.execute(query, (active_session_id,))
-                row = cursor.fetchone()
-
-                if row:
-                    session_name = row.get('name', 'Unnamed Session')
-                    message_json = row.get('message', '[]')
-
-                    if isinstance(message_json, str):
-                        try:
-                            messages_array = json.loads(message_json)
-                            if isinstance(messages_array, list):
-                                for msg in messages_array:
-                                    if isinstance(msg, dict):
-                                        content = msg.get('content')
-                                        role = msg.get('role', 'assistant')
-                                        if content:
-                                            messages.append({"role": role, "content": content})
-                        except:
-                            pass
-                    elif isinstance(message_json, list):
-                        for msg in message_json:
-                            if isinstance(msg, dict):
-                                content = msg.get('content')
-                                role = msg.get('role', 'assistant')
-                                if content:
-                                    messages.append({"role": role, "content": content})
-
-                cursor.close()
-                connection.close()
-            except Exception as db_error:
-                print(f"MySQL error in get_current_session: {db_error}")
+        with mysql_connection() as connection:
+            if connection:
+                try:
+                    name, messages = load_conversation(connection, active_session_id)
+                    session_name = name or session_name
+                except Exception as db_error:
+                    print(f"MySQL error in get_current_session: {db_error}")
 
         if not messages:
             try:
-                sessions = assistant.list_sessions(id=active_session_id)
+                sessions = ragflow_breaker.call(assistant.list_sessions, id=active_session_id)
                 if sessions:
                     session_name = getattr(sessions[0], 'name', 'Unnamed Session')
             except Exception as sdk_error:
@@ -1207,29 +4458,28 @@ def get_current_session():
 def debug_table_structure():
     """Debug endpoint to inspect database structure"""
     try:
-        connection = get_mysql_connection()
-        if not connection:
-            return jsonify({"error": "Could not connect to MySQL"}), 500
+        with mysql_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Could not connect to MySQL"}), 500
 
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SHOW TABLES")
-        tables = [list(row.values())[0] for row in cursor.fetchall()]
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SHOW TABLES")
+            tables = [list(row.values())[0] for row in cursor.fetchall()]
 
-        result = {"tables": {}}
+            result = {"tables": {}}
 
-        for table in tables:
-            cursor.execute(f"DESCRIBE {table}")
-            result["tables"][table] = cursor.fetchall()
+            for table in tables:
+                cursor.execute(f"DESCRIBE {table}")
+                result["tables"][table] = cursor.fetchall()
 
-            cursor.execute(f"SELECT * FROM {table} LIMIT 1")
-            sample = cursor.fetchone()
-            if sample:
-                result["tables"][table + "_sample"] = {
-                    k: str(v)[:100] for k, v in sample.items()
-                }
+                cursor.execute(f"SELECT * FROM {table} LIMIT 1")
+                sample = cursor.fetchone()
+                if sample:
+                    result["tables"][table + "_sample"] = {
+                        k: str(v)[:100] for k, v in sample.items()
+                    }
 
-        cursor.close()
-        connection.close()
+            cursor.close()
 
         return jsonify(result)
 
@@ -1237,6 +4487,54 @@ def debug_table_structure():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/debug/mysql-pool", methods=["GET"])
+def debug_mysql_pool():
+    """Debug endpoint exposing MySQL connection pool metrics"""
+    return jsonify(mysql_pool.stats())
+
+
+@app.route("/debug/workout-detector", methods=["GET"])
+def debug_workout_detector():
+    """Debug endpoint exposing workout detection counters"""
+    return jsonify(workout_detector.stats())
+
+
+@app.route("/debug/circuit-breakers", methods=["GET"])
+def debug_circuit_breakers():
+    """Debug endpoint exposing per-backend circuit breaker state"""
+    return jsonify({name: breaker.stats() for name, breaker in circuit_breakers.items()})
+
+
+@app.route("/debug/outbound-http", methods=["GET"])
+def debug_outbound_http():
+    """Per-host requests, errors, in-flight and latency of outbound calls, plus connection pool reuse"""
+    return jsonify(outbound_http.stats())
+
+
+@app.route("/debug/router", methods=["GET"])
+def debug_router():
+    """Route decisions, rolling TTFT per backend and how often the hedge fires / who wins"""
+    return jsonify(latency_router.stats())
+
+
+@app.route("/debug/generations", methods=["GET"])
+def debug_generations():
+    """Completed / cancelled / failed /ask generations per backend"""
+    return jsonify(generation_stats.stats())
+
+
+@app.route("/debug/events", methods=["GET"])
+def debug_events():
+    """Debug endpoint exposing SSE event broker subscribers and counters"""
+    return jsonify(event_broker.stats())
+
+
+@app.route("/debug/jobs", methods=["GET"])
+def debug_jobs():
+    """Debug endpoint exposing background job queue depth and latency metrics"""
+    return jsonify(background_jobs.stats())
+
+
 def get_coaching_style_prompt(style):
     """Get the coaching style modifier for the system prompt"""
     styles = {
@@ -1382,7 +4680,7 @@ def update_assistant_with_profile(profile_data, settings=None):
             }
         }
 
-        assistant.update(update_data)
+        ragflow_breaker.call(assistant.update, update_data)
         print(f"✅ Updated RAGFlow assistant with personalized prompt and settings")
         print(f"📝 Coaching Style: {coaching_style}")
         print(f"📝 Detail Level: {detail_level}")
@@ -1503,70 +4801,199 @@ def debug_system_prompt():
 
 
 @app.route("/workout-stats/load-json", methods=["GET"])
+@conditional_stats_response
 def load_workout_json():
     """Load workout stats from JSON file"""
     user_id = request.args.get("user_id", "default_user")
     
     try:
-        json_path = os.path.join(STATS_DIR, f"{user_id}_workout_stats.json")
-        
-        if os.path.exists(json_path):
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return jsonify(data)
-        else:
-            return jsonify({
-                "user_id": user_id,
-                "total_workouts": 0,
-                "last_updated": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                "workouts": []
-            })
+        with mysql_connection() as connection:
+            # Snapshot and delta file merged on read; no re-export needed. The change cursor is read
+            # together with it, so syncing from it picks up exactly what the export does not have yet.
+            with export_barrier.settled(user_id):
+                change_cursor = current_change_cursor(connection, user_id) if connection else None
+                data = read_workout_export(user_id)
+        data['change_cursor'] = change_cursor
+        return jsonify(data)
     
     except Exception as e:
         print(f"Error loading workout JSON: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class WorkoutAnalytics:
+    """Vectorized progress analytics: the window is loaded into NumPy columns once and every
+    metric (volume, estimated 1RM, weekly trends, streaks, pace) is computed on whole arrays.
+    """
+
+    COLUMNS = ('exercise_name', 'exercise_type', 'weight', 'reps', 'sets',
+               'duration', 'distance', 'workout_date')
+
+    def __init__(self, rows: List[tuple], today: Optional[date] = None):
+        self.n = len(rows)
+
+        def column(i):
+            return [row[i] for row in rows]
+
+        # Exercise names become integer group codes in a single pass (cheaper than np.unique on strings)
+        codes = {}
+        self.group = np.fromiter((codes.setdefault(name, len(codes)) for name in column(0)),
+                                 dtype=np.int64, count=self.n)
+        self.names = list(codes)
+        self.exercise_type = np.array(column(1), dtype=object)
+
+        # None (and DECIMAL) become float/NaN
+        self.weight = np.array(column(2), dtype=float)
+        self.reps = np.array(column(3), dtype=float)
+        self.sets = np.array(column(4), dtype=float)
+        self.duration = np.array(column(5), dtype=float)
+        self.distance = np.array(column(6), dtype=float)
+
+        # Dates become day numbers since 1970-01-01 (DATE objects from MySQL, strings from the JSON export)
+        dates = column(7)
+        if dates and isinstance(dates[0], str):
+            self.day = np.array([d[:10] for d in dates], dtype='datetime64[D]').astype(np.int64)
+        else:
+            self.day = np.fromiter((d.toordinal() for d in dates), dtype=np.int64, count=self.n) - EPOCH_ORDINAL
+        self.today = (today or date.today()).toordinal() - EPOCH_ORDINAL
+
+        self.strength = self.exercise_type == 'strength'
+        self.cardio = self.exercise_type == 'cardio'
+        self.volume = workout_volume(self.weight, self.reps, self.sets)
+        # Epley estimate, only meaningful for a real set with a load
+        self.est_1rm = np.where((self.reps >= 1) & (self.weight > 0), self.weight * (1 + self.reps / 30), np.nan)
+        self.pace = np.where((self.distance > 0) & (self.duration > 0), self.duration / self.distance, np.nan)
+
+    @classmethod
+    def from_dicts(cls, workouts: List[Dict], today: Optional[date] = None) -> "WorkoutAnalytics":
+        return cls([tuple(w.get(c) for c in cls.COLUMNS) for w in workouts], today)
+
+    @staticmethod
+    def _value(x):
+        """NumPy scalar -> JSON value (NaN -> None)"""
+        x = float(x)
+        return None if np.isnan(x) else round(x, 2)
+
+    def streaks(self) -> Dict:
+        days = np.unique(self.day)
+        if days.size == 0:
+            return {"current": 0, "longest": 0}
+        breaks = np.flatnonzero(np.diff(days) != 1) + 1
+        runs = np.diff(np.concatenate(([0], breaks, [days.size])))
+        # The current streak survives until the end of the day after the last workout
+        current = int(runs[-1]) if days[-1] >= self.today - 1 else 0
+        return {"current": current, "longest": int(runs.max())}
+
+    def totals(self) -> Dict:
+        strength_weight = self.weight[self.strength]
+        return {
+            "total_workouts": self.n,
+            "days_worked": int(np.unique(self.day).size),
+            "strength_sessions": int(self.strength.sum()),
+            "total_volume": float(np.nansum(self.volume[self.strength])),
+            "max_weight": self._value(np.nanmax(strength_weight)) if np.any(strength_weight > 0) else None,
+            "cardio_sessions": int(self.cardio.sum()),
+            "total_distance": float(np.nansum(self.distance[self.cardio])),
+            "total_duration": float(np.nansum(self.duration[self.cardio]))
+        }
+
+    def per_exercise(self) -> List[Dict]:
+        if self.n == 0:
+            return []
+        group, names = self.group, self.names
+        k = len(names)
+
+        def group_sum(values):
+            return np.bincount(group, weights=np.nan_to_num(values), minlength=k)
+
+        def group_reduce(ufunc, values):
+            out = np.full(k, np.nan)
+            ufunc.at(out, group, values)  # fmax/fmin skip NaN
+            return out
+
+        def weekly_slope(values):
+            # Least-squares slope of values against time in weeks, per group, from grouped sums
+            valid = ~np.isnan(values)
+            g, x, y = group[valid], self.day[valid] / 7.0, values[valid]
+            n = np.bincount(g, minlength=k)
+            sx = np.bincount(g, weights=x, minlength=k)
+            sy = np.bincount(g, weights=y, minlength=k)
+            sxy = np.bincount(g, weights=x * y, minlength=k)
+            sxx = np.bincount(g, weights=x * x, minlength=k)
+            denominator = n * sxx - sx * sx
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where((n >= 2) & (denominator > 0), (n * sxy - sx * sy) / denominator, np.nan)
+
+        sessions = np.bincount(group, minlength=k)
+        volume = group_sum(self.volume)
+        distance = group_sum(self.distance)
+        duration = group_sum(self.duration)
+        paced = ~np.isnan(self.pace)
+        paced_distance = np.bincount(group[paced], weights=self.distance[paced], minlength=k)
+        paced_duration = np.bincount(group[paced], weights=self.duration[paced], minlength=k)
+        max_weight = group_reduce(np.fmax, self.weight)
+        est_1rm = group_reduce(np.fmax, self.est_1rm)
+        best_pace = group_reduce(np.fmin, self.pace)
+        one_rm_trend = weekly_slope(self.est_1rm)
+        pace_trend = weekly_slope(self.pace)
+        first = np.zeros(k, dtype=np.int64)
+        first[group[::-1]] = np.arange(self.n)[::-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_pace = np.where(paced_distance > 0, paced_duration / paced_distance, np.nan)
+
+        return [{
+            "exercise_name": names[i],
+            "exercise_type": self.exercise_type[first[i]],
+            "sessions": int(sessions[i]),
+            "volume": self._value(volume[i]),
+            "max_weight": self._value(max_weight[i]),
+            "est_1rm": self._value(est_1rm[i]),
+            "est_1rm_trend_per_week": self._value(one_rm_trend[i]),
+            "distance": self._value(distance[i]),
+            "duration": self._value(duration[i]),
+            "best_pace": self._value(best_pace[i]),
+            "avg_pace": self._value(avg_pace[i]),
+            "pace_trend_per_week": self._value(pace_trend[i])
+        } for i in np.argsort(-sessions, kind='stable')]
+
+
 @app.route("/workout-stats/progress-summary", methods=["GET"])
+@conditional_stats_response
 def get_progress_summary():
     """Get AI-generated progress summary for workouts"""
     user_id = request.args.get("user_id", "default_user")
     days = request.args.get("days", 30, type=int)
     
     try:
-        connection = get_mysql_connection()
-        
-        # Try database first
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            query = """
-            SELECT * FROM workout_stats 
-            WHERE user_id = %s 
-            AND workout_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
-            ORDER BY workout_date DESC, create_time DESC
-            """
-            cursor.execute(query, (user_id, days))
-            workouts = cursor.fetchall()
-            cursor.close()
-            connection.close()
-        else:
-            workouts = []
+        # Try database first; only the analysed columns, as tuples
+        rows = []
+        with mysql_connection() as connection:
+            if connection:
+                cursor = connection.cursor()
+                query = f"""
+                SELECT {', '.join(WorkoutAnalytics.COLUMNS)} FROM workout_stats 
+                WHERE user_id = %s 
+                AND workout_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+                """
+                cursor.execute(query, (user_id, days))
+                rows = cursor.fetchall()
+                cursor.close()
+        analytics = WorkoutAnalytics(rows)
         
         # If no DB data, try JSON file
-        if not workouts:
-            json_path = os.path.join(STATS_DIR, f"{user_id}_workout_stats.json")
-            if os.path.exists(json_path):
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    all_workouts = data.get('workouts', [])
-                    cutoff_date = (datetime.now() - timedelta(days=days)).date()
-                    workouts = [
-                        w for w in all_workouts 
-                        if datetime.strptime(w['workout_date'], '%Y-%m-%d').date() >= cutoff_date
-                    ]
+        if not analytics.n:
+            all_workouts = read_workout_export(user_id).get('workouts', [])
+            cutoff_date = (datetime.now() - timedelta(days=days)).date()
+            analytics = WorkoutAnalytics.from_dicts([
+                w for w in all_workouts 
+                if datetime.strptime(w['workout_date'], '%Y-%m-%d').date() >= cutoff_date
+            ])
         
         # If still no data, return error message
-        if not workouts:
+        if not analytics.n:
             return jsonify({
                 "has_data": False,
                 "summary": "No workout data available for analysis. Start logging your workouts to see progress insights!",
@@ -1574,26 +5001,24 @@ def get_progress_summary():
             })
         
         # Summarize workout data
-        total_workouts = len(workouts)
-        days_worked = len(set(w.get('workout_date') for w in workouts if w.get('workout_date')))
-        
-        strength_workouts = [w for w in workouts if w.get('exercise_type') == 'strength']
-        cardio_workouts = [w for w in workouts if w.get('exercise_type') == 'cardio']
+        totals = analytics.totals()
+        streaks = analytics.streaks()
+        exercises = analytics.per_exercise()
+        total_workouts = totals['total_workouts']
+        days_worked = totals['days_worked']
         
         strength_summary = ""
-        if strength_workouts:
-            total_volume = sum(
-                float(w.get('weight', 0)) * int(w.get('reps', 0)) * int(w.get('sets', 0))
-                for w in strength_workouts if w.get('weight') and w.get('reps') and w.get('sets')
-            )
-            max_weight = max(float(w.get('weight', 0)) for w in strength_workouts if w.get('weight'))
-            strength_summary = f"💪 Strength: {len(strength_workouts)} sessions, {total_volume:.0f} total volume, {max_weight:.1f}kg max"
+        if totals['strength_sessions']:
+            max_weight = totals['max_weight'] or 0.0
+            strength_summary = f"💪 Strength: {totals['strength_sessions']} sessions, {totals['total_volume']:.0f} total volume, {max_weight:.1f}kg max"
         
         cardio_summary = ""
-        if cardio_workouts:
-            total_distance = sum(float(w.get('distance', 0)) for w in cardio_workouts if w.get('distance'))
-            total_duration = sum(int(w.get('duration', 0)) for w in cardio_workouts if w.get('duration'))
-            cardio_summary = f"🏃 Cardio: {len(cardio_workouts)} sessions, {total_distance:.1f}km distance, {total_duration} minutes"
+        if totals['cardio_sessions']:
+            cardio_summary = f"🏃 Cardio: {totals['cardio_sessions']} sessions, {totals['total_distance']:.1f}km distance, {totals['total_duration']:.0f} minutes"
+        
+        streak_summary = ""
+        if streaks['longest'] > 1:
+            streak_summary = f"🔥 Streak: {streaks['current']} days current, {streaks['longest']} days longest"
         
         # Generate motivational summary
         summary = f"""## 📊 Your Progress Summary
@@ -1604,6 +5029,8 @@ Over the last {days} days, you've completed **{total_workouts} workouts** across
 
 {cardio_summary}
 
+{streak_summary}
+
 ### 🎯 Keep It Up!
 You're building great momentum. The consistency you're showing is exactly what leads to results. Keep logging your workouts and you'll see amazing progress!
 """
@@ -1612,7 +5039,10 @@ You're building great momentum. The consistency you're showing is exactly what l
             "has_data": True,
             "summary": summary,
             "total_workouts": total_workouts,
-            "days_worked": days_worked
+            "days_worked": days_worked,
+            "totals": totals,
+            "streaks": streaks,
+            "exercises": exercises
         })
     
     except Exception as e:
@@ -1625,10 +5055,511 @@ You're building great momentum. The consistency you're showing is exactly what l
         })
 
 
+# Async serving mode (python main.py serve-async): /ask and /events run as coroutines so an open
+# stream holds a socket and a few KB instead of a thread; every other route goes through the WSGI bridge
+ASYNC_PORT = int(os.getenv("ASYNC_PORT", "5001"))
+ASYNC_WSGI_THREADS = int(os.getenv("ASYNC_WSGI_THREADS", "32"))
+ASYNC_UPSTREAM_CONNECTIONS = int(os.getenv("ASYNC_UPSTREAM_CONNECTIONS", "0"))  # 0 = no limit
+ASYNC_MAX_BODY = int(os.getenv("ASYNC_MAX_BODY", str(64 * 1024 * 1024)))
+ASYNC_READ_BUFSIZE = 1024 * 1024  # RAGFlow repeats the whole answer (and references) on every line
+
+SSE_HEADERS = {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+if web:
+    ASYNC_HTTP = web.AppKey("http", aiohttp.ClientSession)
+    ASYNC_WSGI_EXECUTOR = web.AppKey("wsgi_executor", ThreadPoolExecutor)
+
+# Only touched from the event loop thread, so no lock
+async_stream_stats = {'active': 0, 'peak': 0, 'started': 0, 'completed': 0, 'cancelled': 0}
+async_bridge_stats = {'active': 0, 'peak': 0, 'requests': 0}
+
+
+async def aiter_upstream_lines(content, coalescer: SSEFrameCoalescer):
+    """Async twin of iter_upstream_lines: lines of an aiohttp stream, None when a held delta falls due.
+
+    The pending readline is waited on, never cancelled, so a timeout cannot drop half a line.
+    """
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(content.readline())
+            done, _ = await asyncio.wait({pending}, timeout=coalescer.time_left())
+            if not done:
+                yield None
+                continue
+            line, pending = pending.result(), None
+            if not line:
+                return
+            yield line
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+async def agenerate_response(http, question: str, session_id: str,
+                             coalescer: Optional[SSEFrameCoalescer] = None, leg: Optional["HedgeLeg"] = None):
+    """Async twin of generate_response: same SSE frames, but waiting on RAGFlow holds no thread"""
+    full_response = ""
+    coalescer = coalescer or SSEFrameCoalescer()
+    started = time.monotonic()
+    finished = False
+    try:
+        with ragflow_breaker.guard() as outcome:
+            response = await http.post(
+                f"{BASE_URL}/api/v1/chats/{CHAT_ID}/completions",
+                headers={'Authorization': f'Bearer {API_KEY}', 'Content-Type': 'application/json'},
+                json={"question": question, "session_id": session_id, "stream": True},
+                timeout=aiohttp.ClientTimeout(sock_connect=RAGFLOW_CONNECT_TIMEOUT, sock_read=RAGFLOW_READ_TIMEOUT)
+            )
+            if response.status >= 500:
+                outcome.fail()
+        if leg:
+            leg.attach(response)
+
+        # Leaving this block early (client gone, task cancelled) closes the upstream connection
+        async with response:
+            if response.status != 200:
+                finished = True
+                generation_stats.record("ragflow", "failed", 0, time.monotonic() - started)
+                yield f"data: {json.dumps({'error': f'RAGFlow error: {response.status}'})}\n\n"
+                yield f"data: {json.dumps({'done': True})}\n\n"
+                return
+
+            async for line in aiter_upstream_lines(response.content, coalescer):
+                if line is None:
+                    yield coalescer.flush()
+                    continue
+                line = line.decode('utf-8').strip()
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    event = json.loads(line[5:])
+                except json.JSONDecodeError:
+                    continue
+
+                if event.get("code", 0) != 0:
+                    yield coalescer.flush() + f"data: {json.dumps({'error': event.get('message', 'RAGFlow error')})}\n\n"
+                    break
+                data = event.get("data")
+                if not isinstance(data, dict):
+                    break  # RAGFlow ends the stream with "data": true
+
+                answer = data.get("answer") or ""
+                content = answer[len(full_response):] if answer.startswith(full_response) else answer
+                if content:
+                    if not full_response and not (leg and leg.stopped):
+                        latency_router.record_ttft("ragflow", time.monotonic() - started)
+                    full_response += content
+                    frame = coalescer.add(content)
+                    if frame:
+                        yield frame
+
+        finished = True
+        generation_stats.record("ragflow", "completed", len(full_response), time.monotonic() - started)
+        if full_response and not (leg and leg.abandoned):
+            # submit() can block briefly when the job queue is full, so keep it off the loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, background_jobs.submit, "save_to_mysql", save_to_mysql, session_id, question, full_response)
+
+        yield coalescer.flush() + f"data: {json.dumps({'done': True})}\n\n"
+    except (GeneratorExit, asyncio.CancelledError):
+        # Handler cancelled or closed us because the client disconnected; the upstream response is
+        # already closed by the async with block above
+        if not finished:
+            asyncio.get_running_loop().run_in_executor(
+                None, cancel_generation, "ragflow", session_id, question, full_response, started, leg)
+        raise
+    except Exception as e:
+        finished = True
+        if leg and leg.stopped:
+            await asyncio.get_running_loop().run_in_executor(
+                None, cancel_generation, "ragflow", session_id, question, full_response, started, leg)
+            return
+        generation_stats.record("ragflow", "failed", len(full_response), time.monotonic() - started)
+        print(f"Error in agenerate_response: {e}")
+        yield coalescer.flush() + f"data: {json.dumps({'error': str(e)})}\n\n"
+
+
+async def agenerate_response_direct(http, question: str, session_id: str = None,
+                                    coalescer: Optional[SSEFrameCoalescer] = None,
+                                    leg: Optional["HedgeLeg"] = None):
+    """Async twin of generate_response_direct"""
+    full_response = ""
+    coalescer = coalescer or SSEFrameCoalescer()
+    started = time.monotonic()
+    finished = False
+    ollama_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+    try:
+        with ollama_breaker.guard() as outcome:
+            response = await http.post(
+                f"{ollama_url}/api/chat",
+                json=direct_chat_payload(question),
+                timeout=aiohttp.ClientTimeout(sock_connect=OLLAMA_CONNECT_TIMEOUT, sock_read=OLLAMA_READ_TIMEOUT)
+            )
+            if response.status >= 500:
+                outcome.fail()
+        if leg:
+            leg.attach(response)
+
+        async with response:
+            if response.status != 200:
+                finished = True
+                generation_stats.record("ollama", "failed", 0, time.monotonic() - started)
+                yield f"data: {json.dumps({'error': f'Ollama error: {response.status}'})}\n\n"
+                yield f"data: {json.dumps({'done': True})}\n\n"
+                return
+
+            async for line in aiter_upstream_lines(response.content, coalescer):
+                if line is None:
+                    yield coalescer.flush()
+                    continue
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if data.get("message", {}).get("content"):
+                    content = data["message"]["content"]
+                    if not full_response and not (leg and leg.stopped):
+                        latency_router.record_ttft("ollama", time.monotonic() - started)
+                    full_response += content
+                    frame = coalescer.add(content)
+                    if frame:
+                        yield frame
+                if data.get("done"):
+                    break
+
+        finished = True
+        generation_stats.record("ollama", "completed", len(full_response), time.monotonic() - started)
+        if full_response and session_id and not (leg and leg.abandoned):
+            await asyncio.get_running_loop().run_in_executor(
+                None, background_jobs.submit, "save_to_mysql", save_to_mysql, session_id, question, full_response)
+
+        yield coalescer.flush() + f"data: {json.dumps({'done': True})}\n\n"
+
+    except (GeneratorExit, asyncio.CancelledError):
+        if not finished:
+            asyncio.get_running_loop().run_in_executor(
+                None, cancel_generation, "ollama", session_id, question, full_response, started, leg)
+        raise
+    except Exception as e:
+        finished = True
+        if leg and leg.stopped:
+            await asyncio.get_running_loop().run_in_executor(
+                None, cancel_generation, "ollama", session_id, question, full_response, started, leg)
+            return
+        generation_stats.record("ollama", "failed", len(full_response), time.monotonic() - started)
+        print(f"Error in async direct response: {e}")
+        yield coalescer.flush() + f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield f"data: {json.dumps({'done': True})}\n\n"
+
+
+async def agenerate_hedged(http, question: str, session_id: str, coalescer: SSEFrameCoalescer):
+    """Async generate_hedged: the losing leg's task is cancelled at once, closing its upstream request"""
+    race = HedgeRace(latency_router.hedge_budget)
+    out = asyncio.Queue()
+    tasks = []
+
+    async def pump(leg: HedgeLeg, frames):
+        try:
+            async for frame in frames:
+                out.put_nowait((leg.backend, frame))
+        finally:
+            await frames.aclose()
+            out.put_nowait((leg.backend, None))
+
+    def start(backend: str):
+        leg = race.add(backend)
+        generator = agenerate_response if backend == "ragflow" else agenerate_response_direct
+        task = asyncio.create_task(pump(leg, generator(http, question, session_id, coalescer.copy(), leg)))
+        leg.cancel = task.cancel
+        tasks.append(task)
+
+    start("ragflow")
+    try:
+        while not race.finished():
+            try:
+                backend, frame = await asyncio.wait_for(out.get(), race.timeout())
+            except asyncio.TimeoutError:
+                latency_router.count('hedges_fired')
+                start("ollama")
+                continue
+            if frame is None:
+                if race.on_end(backend):
+                    start("ollama")
+                continue
+            text = race.on_frame(backend, frame)
+            if text:
+                yield text
+        if race.leftovers():
+            yield race.leftovers()
+    finally:
+        race.close()
+        # Let cancelled legs run their cleanup (cancel_generation, closing upstream) before returning
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def load_flask_session(request) -> Dict:
+    """Read the signed Flask session cookie so async handlers share session state with the WSGI routes"""
+    value = request.cookies.get(app.config["SESSION_COOKIE_NAME"])
+    if not value:
+        return {}
+    serializer = app.session_interface.get_signing_serializer(app)
+    try:
+        return dict(serializer.loads(value, max_age=int(app.permanent_session_lifetime.total_seconds())))
+    except BadSignature:
+        return {}
+
+
+def store_flask_session(response, data: Dict):
+    serializer = app.session_interface.get_signing_serializer(app)
+    response.set_cookie(app.config["SESSION_COOKIE_NAME"], serializer.dumps(data),
+                        path=app.config["SESSION_COOKIE_PATH"] or "/", httponly=True)
+
+
+async def ask_async(request):
+    """/ask for serve-async: same routing and frames as ask(), streamed from a coroutine"""
+    question = request.query.get("question")
+    if not question:
+        return web.json_response({"error": "No question provided"}, status=400)
+
+    flask_session = load_flask_session(request)
+    session_id = request.query.get("session_id") or flask_session.get("active_session_id")
+    if not session_id:
+        session_id = await asyncio.get_running_loop().run_in_executor(None, get_or_create_default_session)
+        if not session_id:
+            return web.json_response({"error": "Could not create session"}, status=500)
+
+    http = request.app[ASYNC_HTTP]
+    route = latency_router.route(question)
+    coalescer = coalescer_from_args(request.query)
+    print(f"[HYBRID] Using {route} for: {question[:50]}...")
+    if route == "hedged":
+        frames = agenerate_hedged(http, question, session_id, coalescer)
+    elif route == "ragflow":
+        frames = agenerate_response(http, question, session_id, coalescer)
+    else:
+        frames = agenerate_response_direct(http, question, session_id, coalescer)
+
+    response = web.StreamResponse(headers=SSE_HEADERS)
+    if flask_session.get("active_session_id") != session_id:
+        flask_session["active_session_id"] = session_id
+        store_flask_session(response, flask_session)
+
+    async_stream_stats['started'] += 1
+    async_stream_stats['active'] += 1
+    async_stream_stats['peak'] = max(async_stream_stats['peak'], async_stream_stats['active'])
+    try:
+        await response.prepare(request)
+        async for frame in frames:
+            await response.write(frame.encode())
+        await response.write_eof()
+        async_stream_stats['completed'] += 1
+    except (ConnectionResetError, asyncio.CancelledError) as e:
+        # EventSource closed: aiohttp cancels this task (or the next write fails) and the upstream
+        # request is closed when the generator is shut down below
+        async_stream_stats['cancelled'] += 1
+        if isinstance(e, asyncio.CancelledError):
+            raise
+    finally:
+        await frames.aclose()
+        async_stream_stats['active'] -= 1
+    return response
+
+
+async def events_async(request):
+    """/events for serve-async; parks on the broker with an asyncio.Event instead of a thread"""
+    user_id = request.query.get("user_id", "default_user")
+    last_event_id = request.headers.get("Last-Event-ID")
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    try:
+        cursor, missed = event_broker.subscribe(user_id, last_event_id)
+    except OverflowError as e:
+        return web.json_response({"error": str(e)}, status=503)
+
+    response = web.StreamResponse(headers=SSE_HEADERS)
+    try:
+        await response.prepare(request)
+        await response.write(f"retry: {EVENTS_RETRY_MS}\n\n".encode())
+        events = []
+        while True:
+            await response.write(format_sse_batch(events, missed).encode())
+            events, missed, cursor = await event_broker.wait_async(user_id, cursor, EVENTS_HEARTBEAT)
+    except ConnectionResetError:
+        pass
+    finally:
+        event_broker.unsubscribe(user_id)
+    return response
+
+
+async def debug_async(request):
+    return web.json_response({
+        'streams': dict(async_stream_stats),
+        'wsgi_bridge': dict(async_bridge_stats, max_threads=ASYNC_WSGI_THREADS),
+        'process_threads': threading.active_count()
+    })
+
+
+def _wsgi_environ(request, body: bytes) -> Dict:
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        # WSGI wants the undecoded path bytes as latin-1, like werkzeug's own server
+        'PATH_INFO': unquote_to_bytes(request.rel_url.raw_path).decode('latin-1'),
+        'QUERY_STRING': request.rel_url.raw_query_string,
+        'SERVER_NAME': request.url.host or 'localhost',
+        'SERVER_PORT': str(request.url.port or ASYNC_PORT),
+        'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+        'REMOTE_ADDR': request.remote or '',
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': request.scheme,
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in request.headers.items():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+            continue
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _close_wsgi_response(call):
+    if not call.cancelled() and call.exception() is None:
+        close = getattr(call.result(), "close", None)
+        if close:
+            close()
+
+
+async def wsgi_bridge(request):
+    """Run the Flask app for every other route on the bridge pool, streaming its body chunk by chunk"""
+    body = await request.read()
+    environ = _wsgi_environ(request, body)
+    executor = request.app[ASYNC_WSGI_EXECUTOR]
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = status, headers
+        return lambda data: None  # Flask never uses the legacy write() callable
+
+    async_bridge_stats['requests'] += 1
+    async_bridge_stats['active'] += 1
+    async_bridge_stats['peak'] = max(async_bridge_stats['peak'], async_bridge_stats['active'])
+    call = step = executor.submit(app, environ, start_response)
+    try:
+        chunks = iter(await asyncio.wrap_future(call))
+        status_code, _, reason = started['status'].partition(' ')
+        response = web.StreamResponse(status=int(status_code), reason=reason or None)
+        for name, value in started['headers']:
+            response.headers.add(name, value)
+        await response.prepare(request)
+        while True:
+            step = executor.submit(next, chunks, None)
+            chunk = await asyncio.wrap_future(step)
+            if chunk is None:
+                break
+            if chunk:
+                await response.write(chunk)
+        await response.write_eof()
+        return response
+    finally:
+        async_bridge_stats['active'] -= 1
+        # A bridge thread may still be inside app() or next(); close the iterable (running Flask's
+        # call_on_close hooks) only once it has returned
+        step.add_done_callback(lambda _: executor.submit(_close_wsgi_response, call))
+
+
+def outbound_trace_config():
+    """Feed the async client's calls into outbound_http's per-host metrics (in flight until headers)"""
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.host = urlsplit(str(params.url)).netloc
+        context.started = outbound_http.begin(context.host)
+
+    async def on_request_end(session, context, params):
+        outbound_http.responded(context.host, context.started, params.response.status)
+        outbound_http.end(context.host)
+
+    async def on_request_exception(session, context, params):
+        if isinstance(params.exception, BACKEND_ERRORS):
+            outbound_http.responded(context.host, context.started, None)
+        outbound_http.end(context.host)
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    return trace
+
+
+async def _open_async_clients(aio_app):
+    aio_app[ASYNC_HTTP] = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=ASYNC_UPSTREAM_CONNECTIONS),
+        read_bufsize=ASYNC_READ_BUFSIZE,
+        trace_configs=[outbound_trace_config()]
+    )
+
+
+async def _close_async_clients(aio_app):
+    await aio_app[ASYNC_HTTP].close()
+    aio_app[ASYNC_WSGI_EXECUTOR].shutdown(wait=False)
+
+
+def build_async_app():
+    """aiohttp application: native /ask, /events and /debug/async, everything else via the WSGI bridge"""
+    if web is None:
+        raise RuntimeError("serve-async needs aiohttp (pip install aiohttp)")
+    aio_app = web.Application(client_max_size=ASYNC_MAX_BODY)
+    aio_app[ASYNC_WSGI_EXECUTOR] = ThreadPoolExecutor(ASYNC_WSGI_THREADS, thread_name_prefix="wsgi-bridge")
+    aio_app.router.add_get("/ask", ask_async)
+    aio_app.router.add_get("/events", events_async)
+    aio_app.router.add_get("/debug/async", debug_async)
+    aio_app.router.add_route("*", "/{tail:.*}", wsgi_bridge)
+    aio_app.on_startup.append(_open_async_clients)
+    aio_app.on_cleanup.append(_close_async_clients)
+    return aio_app
+
+
+def serve_async(host: str = "0.0.0.0", port: int = ASYNC_PORT):
+    print("🚀 Starting FitCoach AI server (asyncio mode)...")
+    create_tables()
+    # handler_cancellation: a dropped EventSource cancels its handler, which closes the upstream stream
+    web.run_app(build_async_app(), host=host, port=port, handler_cancellation=True)
+
+
 if __name__ == "__main__":
+    # One-shot maintenance commands: python main.py <command>
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate-messages":
+        create_conversation_message_table()
+        migrate_conversation_messages()
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild-rollup":
+        create_workout_stats_table()
+        create_workout_rollup_table()
+        rebuild_daily_rollup(sys.argv[2] if len(sys.argv) > 2 else None)
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild-records":
+        create_workout_stats_table()
+        create_personal_record_table()
+        rebuild_personal_records(sys.argv[2] if len(sys.argv) > 2 else None)
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "serve-async":
+        serve_async()
+        sys.exit(0)
+
     print("🚀 Starting FitCoach AI server...")
     try:
-        create_workout_stats_table()
+        create_tables()
         app.run(debug=True, threaded=True, host='0.0.0.0', port=5001)
     except Exception as e:
         print(f"❌ Fatal error: {e}")
@@ -3,6 +3,7 @@ let renamedOnce = false;
 let recognition = null;
 let uploadedFiles = [];
 let userProfile = {};
+let activeAnswerStream = null; // /ask EventSource still streaming, if any
 
 // Initialize
 document.addEventListener("DOMContentLoaded", () => {
@@ -11,6 +12,7 @@ document.addEventListener("DOMContentLoaded", () => {
   loadProfile();  // ← ADD THIS
   loadStats();
   loadWorkoutDataFromJson(); // NEW: Load JSON on startup
+  subscribeToStatsEvents();
   initializeVoiceRecognition();
 
   // Auto-resize textarea
@@ -29,23 +31,114 @@ document.addEventListener("DOMContentLoaded", () => {
   document.getElementById("file-input").addEventListener("change", handleFiles);
 });
 
+// Conditional GETs for stats endpoints: send the last ETag and reuse the cached body on 304
+const statsEtagCache = new Map();
+
+async function fetchStatsJson(url) {
+  const cached = statsEtagCache.get(url);
+  const res = await fetch(url, {
+    cache: "no-store",
+    headers: cached ? { "If-None-Match": cached.etag } : {},
+  });
+  if (res.status === 304 && cached) {
+    return { ok: true, status: 200, data: cached.data };
+  }
+  const data = await res.json();
+  const etag = res.headers.get("ETag");
+  if (res.ok && etag) statsEtagCache.set(url, { etag, data });
+  return { ok: res.ok, status: res.status, data };
+}
+
 // NEW: Load workout data from JSON file
+// cachedJsonWorkouts is the local copy; workoutChangeCursor is the last change-log seq applied to it
 let cachedJsonWorkouts = [];
+let workoutChangeCursor = null;
 
 async function loadWorkoutDataFromJson() {
   try {
-    const res = await fetch("/workout-stats/load-json?user_id=default_user");
-    const data = await res.json();
+    // The snapshot carries the change cursor it is consistent with; syncing from there misses nothing
+    const { data } = await fetchStatsJson("/workout-stats/load-json?user_id=default_user");
     if (data && data.workouts && Array.isArray(data.workouts)) {
       cachedJsonWorkouts = data.workouts;
       console.log(`✅ Loaded ${cachedJsonWorkouts.length} workouts from JSON`);
     }
+    if (data && typeof data.change_cursor === "number") {
+      workoutChangeCursor = data.change_cursor;
+      await syncWorkoutChanges();
+    }
   } catch (err) {
     console.error("Error loading JSON workouts:", err);
     cachedJsonWorkouts = [];
+    workoutChangeCursor = null;
   }
 }
 
+// Apply change-log entries to the local copy (by id, so replays are harmless)
+function applyWorkoutChanges(changes) {
+  const byId = new Map(cachedJsonWorkouts.map(w => [w.id, w]));
+  changes.forEach(change => {
+    if (change.op === "delete") {
+      byId.delete(change.id);
+    } else if (change.workout) {
+      byId.set(change.id, change.workout);
+    }
+  });
+  cachedJsonWorkouts = Array.from(byId.values());
+}
+
+// Pull only what changed since the last sync; falls back to a full load without a cursor
+async function syncWorkoutChanges() {
+  if (workoutChangeCursor === null) {
+    await loadWorkoutDataFromJson();
+    return 0;
+  }
+  let applied = 0;
+  try {
+    let hasMore = true;
+    while (hasMore) {
+      const { ok, data } = await fetchStatsJson(
+        `/workout-stats/changes?user_id=default_user&since=${workoutChangeCursor}`
+      );
+      if (!ok || !Array.isArray(data.changes)) break;
+      applyWorkoutChanges(data.changes);
+      applied += data.changes.length;
+      workoutChangeCursor = data.cursor;
+      hasMore = data.has_more;
+    }
+    if (applied > 0) console.log(`🔄 Applied ${applied} workout change(s)`);
+  } catch (err) {
+    console.error("Error syncing workout changes:", err);
+  }
+  return applied;
+}
+
+// Server-pushed stats events: sync the local copy as soon as a save commits instead of polling
+function subscribeToStatsEvents() {
+  if (typeof EventSource === "undefined") return;
+  const events = new EventSource("/events?user_id=default_user");
+
+  const refresh = async () => {
+    const applied = await syncWorkoutChanges();
+    const progressSection = document.getElementById("progress-section");
+    if (applied > 0 && progressSection && progressSection.style.display === "block") {
+      showProgressChart();
+    }
+  };
+
+  events.addEventListener("workouts_detected", (e) => {
+    const data = JSON.parse(e.data);
+    showToast(`💪 Logged ${data.count} workout${data.count === 1 ? "" : "s"}`, "success");
+    refresh();
+  });
+  events.addEventListener("pr_broken", (e) => {
+    const pr = JSON.parse(e.data);
+    const label = pr.record_type.replace(/_/g, " ");
+    showToast(`🏆 New ${label} PR for ${pr.exercise_name}: ${pr.value}${pr.unit ? " " + pr.unit : ""}`, "success");
+  });
+  events.addEventListener("export_ready", refresh);
+  events.addEventListener("resync", refresh);
+}
+
 // Load user profile
 function loadProfile() {
   const saved = localStorage.getItem("fitcoach-profile");
@@ -435,9 +528,12 @@ async function sendMessageWithText(text) {
   chatBox.scrollTop = chatBox.scrollHeight;
 
   try {
+    // Regenerate / a new question abandons the previous answer: closing it lets the server stop generating
+    if (activeAnswerStream) activeAnswerStream.close();
     const eventSource = new EventSource(
       `/ask?question=${encodeURIComponent(text)}`
     );
+    activeAnswerStream = eventSource;
     let fullText = "";
     let aiDiv = null;
 
@@ -1090,31 +1186,41 @@ async function showProgressChart() {
     return;
   }
 
-  // Fetch from backend first, fallback to cached JSON
-  let workouts = [];
+  // Daily counts come pre-bucketed (and downsampled) from the server
+  let dates = [];
+  let counts = [];
   try {
-    const res = await fetch(`/workout-stats?user_id=default_user&days=30`);
-    const data = await res.json();
-    if (data && Array.isArray(data.workouts) && data.workouts.length > 0) {
-      workouts = data.workouts;
-      console.log(`📊 Loaded ${workouts.length} workouts from database`);
+    const { ok, data } = await fetchStatsJson(
+      "/workout-stats/series?user_id=default_user&metric=count&bucket=day&days=30&points=60"
+    );
+    if (ok && Array.isArray(data.dates)) {
+      dates = data.dates;
+      counts = data.values;
+      console.log(`📊 Loaded ${data.raw_points} days of workout counts`);
     }
   } catch (err) {
-    console.error("Error fetching workout stats from DB:", err);
+    console.error("Error fetching workout series:", err);
   }
 
-  // Fallback to cached JSON if DB is empty
-  if (!workouts || workouts.length === 0) {
-    if (cachedJsonWorkouts.length > 0) {
-      console.log("📦 Using cached JSON workouts as fallback");
-      const cutoff = new Date();
-      cutoff.setDate(cutoff.getDate() - 30);
-      workouts = cachedJsonWorkouts.filter(w => new Date(w.workout_date) >= cutoff);
-    }
+  // Fallback when the database is unavailable: aggregate the local copy by date
+  if (dates.length === 0) {
+    await syncWorkoutChanges();
+    const cutoff = new Date();
+    cutoff.setDate(cutoff.getDate() - 30);
+    const dateMap = {};
+    cachedJsonWorkouts
+      .filter(w => new Date(w.workout_date) >= cutoff)
+      .forEach(w => {
+        const date = w.workout_date || (w.create_date ? w.create_date.split(" ")[0] : null);
+        if (!date) return;
+        dateMap[date] = (dateMap[date] || 0) + 1;
+      });
+    dates = Object.keys(dateMap).sort((a,b) => new Date(a) - new Date(b));
+    counts = dates.map(d => dateMap[d]);
   }
 
   // If still no data: hide chart and show only progress summary
-  if (!workouts || workouts.length === 0) {
+  if (dates.length === 0) {
     try { 
       if (progressChart && typeof progressChart.dispose === "function") {
         progressChart.dispose();
@@ -1152,17 +1258,6 @@ async function showProgressChart() {
     return;
   }
 
-  // Aggregate workouts by date
-  const dateMap = {};
-  workouts.forEach(w => {
-    const date = w.workout_date || (w.create_date ? w.create_date.split(" ")[0] : null);
-    if (!date) return;
-    dateMap[date] = (dateMap[date] || 0) + 1;
-  });
-  
-  const dates = Object.keys(dateMap).sort((a,b) => new Date(a) - new Date(b));
-  const counts = dates.map(d => dateMap[d]);
-
   const option = {
     backgroundColor: '#ffffff',
     title: { 
@@ -1252,8 +1347,8 @@ async function loadProgressSummary(days = 30) {
   if (summaryElement) summaryElement.textContent = '';
 
   try {
-    const response = await fetch(`/workout-stats/progress-summary?user_id=default_user&days=${days}`);
-    const data = await response.json();
+    const response = await fetchStatsJson(`/workout-stats/progress-summary?user_id=default_user&days=${days}`);
+    const data = response.data;
     
     if (!response.ok || data.error) {
       throw new Error(data.error || `HTTP ${response.status}`);
@@ -0,0 +1,89 @@
+"""
+Compare peak RSS of the streaming workout export against the old buffered export
+Each mode runs in its own subprocess so ru_maxrss reflects only that export.
+Usage:
+  python tools/benchmark_export_memory.py --seed 2000000 --user bench_user
+  python tools/benchmark_export_memory.py --user bench_user --format csv
+"""
+import argparse, json, os, resource, subprocess, sys, time, uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def seed(user_id, count):
+    """Insert `count` synthetic workouts for user_id"""
+    now = datetime.now()
+    now_ms = int(now.timestamp() * 1000)
+    session_id = f"bench_{uuid.uuid4().hex[:8]}"
+    main.create_tables()
+    with main.mysql_connection() as connection:
+        cursor = connection.cursor()
+        for start in range(0, count, 10000):
+            rows = [
+                main.workout_row(user_id, session_id, {
+                    "exercise_name": "Bench Press", "exercise_type": "strength",
+                    "sets": 3, "reps": 5, "weight": 60 + i % 40, "weight_unit": "kg",
+                    "notes": "benchmark row"
+                }, (now - timedelta(days=i % 3650)).date(), now_ms, now)
+                for i in range(start, min(start + 10000, count))
+            ]
+            main.insert_workout_rows(cursor, rows, main.WORKOUT_INSERT_CHUNK)
+            connection.commit()
+            print(f"seeded {start + len(rows)}/{count}", end="\r")
+        cursor.close()
+    print()
+
+
+def run_export(mode, user_id, fmt):
+    """Export once in this process and return (bytes written, seconds, peak RSS in MB)"""
+    started = time.time()
+    written = 0
+    with open(os.devnull, "w") as sink:
+        if mode == "stream":
+            connection = main.get_mysql_connection()
+            for chunk in main.stream_workout_export(connection, user_id, fmt):
+                written += len(chunk)
+                sink.write(chunk)
+        else:
+            with main.mysql_connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                cursor.execute("SELECT * FROM workout_stats WHERE user_id = %s "
+                               "ORDER BY workout_date DESC, create_time DESC", (user_id,))
+                workouts = [main.serialize_workout(row) for row in cursor.fetchall()]
+                cursor.close()
+            body = json.dumps({"user_id": user_id, "total_workouts": len(workouts),
+                               "workouts": workouts}, default=str)
+            written = len(body)
+            sink.write(body)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return written, time.time() - started, peak_mb
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", default="bench_user")
+    parser.add_argument("--seed", type=int, default=0, help="insert this many synthetic rows first")
+    parser.add_argument("--format", default="json", choices=["json", "ndjson", "csv"])
+    parser.add_argument("--mode", choices=["stream", "buffered"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_export(args.mode, args.user, args.format)))
+        return
+
+    if args.seed:
+        seed(args.user, args.seed)
+
+    print(f"{'mode':>10} {'MB out':>10} {'seconds':>9} {'peak RSS MB':>12}")
+    for mode in ("buffered", "stream"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--user", args.user, "--format", args.format],
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        written, seconds, peak_mb = json.loads(output)
+        print(f"{mode:>10} {written / 1048576:>10.1f} {seconds:>9.1f} {peak_mb:>12.1f}")
+
+
+if __name__ == "__main__": main_cli()
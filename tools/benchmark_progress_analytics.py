@@ -0,0 +1,89 @@
+"""
+Benchmark the vectorized WorkoutAnalytics against the old per-row progress-summary loop
+Rows are synthetic and built in memory, so no database is needed.
+Usage:
+  python tools/benchmark_progress_analytics.py --sizes 10000 100000 1000000
+"""
+import argparse, os, random, sys, time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import WorkoutAnalytics
+
+EXERCISES = [
+    ("bench press", "strength"), ("squat", "strength"), ("deadlift", "strength"),
+    ("shoulder press", "strength"), ("pull-ups", "strength"),
+    ("running", "cardio"), ("cycling", "cardio"), ("rowing", "cardio"), ("yoga", "other")
+]
+
+
+def synthetic_workouts(count, seed=42):
+    rng = random.Random(seed)
+    today = date.today()
+    workouts = []
+    for _ in range(count):
+        name, kind = rng.choice(EXERCISES)
+        workout = dict.fromkeys(WorkoutAnalytics.COLUMNS)
+        workout.update(exercise_name=name, exercise_type=kind,
+                       workout_date=today - timedelta(days=rng.randrange(365)))
+        if kind == "strength":
+            workout.update(weight=rng.uniform(20, 180), reps=rng.randint(1, 12), sets=rng.randint(1, 5))
+        elif kind == "cardio":
+            workout.update(distance=rng.uniform(1, 20), duration=rng.randint(10, 120))
+        else:
+            workout.update(duration=rng.randint(20, 90))
+        workouts.append(workout)
+    return workouts
+
+
+def legacy_summary(workouts):
+    """The per-row loop get_progress_summary used before WorkoutAnalytics (totals only)"""
+    days_worked = len(set(w.get('workout_date') for w in workouts if w.get('workout_date')))
+    strength_workouts = [w for w in workouts if w.get('exercise_type') == 'strength']
+    cardio_workouts = [w for w in workouts if w.get('exercise_type') == 'cardio']
+    total_volume = sum(
+        float(w.get('weight', 0)) * int(w.get('reps', 0)) * int(w.get('sets', 0))
+        for w in strength_workouts if w.get('weight') and w.get('reps') and w.get('sets')
+    )
+    max_weight = max(float(w.get('weight', 0)) for w in strength_workouts if w.get('weight'))
+    total_distance = sum(float(w.get('distance', 0)) for w in cardio_workouts if w.get('distance'))
+    total_duration = sum(int(w.get('duration', 0)) for w in cardio_workouts if w.get('duration'))
+    return len(workouts), days_worked, total_volume, max_weight, total_distance, total_duration
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # totals vs legacy compares the same work; load + full is what the endpoint pays for far more output
+    print(f"{'rows':>9} {'legacy loop':>12} {'load arrays':>12} {'totals':>9} {'full':>9} "
+          f"{'totals vs legacy':>17} {'load+full':>10}")
+    for size in args.sizes:
+        workouts = synthetic_workouts(size)
+        rows = [tuple(w[c] for c in WorkoutAnalytics.COLUMNS) for w in workouts]
+
+        legacy_time, legacy = best_of(lambda: legacy_summary(workouts), args.repeat)
+        load_time, analytics = best_of(lambda: WorkoutAnalytics(rows), args.repeat)
+        totals_time, totals = best_of(analytics.totals, args.repeat)
+        full_time, _ = best_of(lambda: (analytics.totals(), analytics.streaks(), analytics.per_exercise()),
+                               args.repeat)
+
+        assert totals['days_worked'] == legacy[1]
+        assert abs(totals['total_volume'] - legacy[2]) < 1e-6 * max(1.0, legacy[2])
+        print(f"{size:>9} {legacy_time * 1000:>10.1f}ms {load_time * 1000:>10.1f}ms "
+              f"{totals_time * 1000:>7.1f}ms {full_time * 1000:>7.1f}ms "
+              f"{legacy_time / totals_time:>16.1f}x {(load_time + full_time) * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__": main_cli()
@@ -0,0 +1,117 @@
+"""
+Measure /ask frames, bytes and server socket writes per answer for different SSE coalescing settings
+Runs the fake Ollama from tools/load_test_ask.py and the threaded Flask server (no reloader) as
+subprocesses. The server counts its socket writes (one send syscall each for frames this small).
+Usage:
+  python tools/benchmark_sse_coalescing.py --tokens 300 --token-delay 0.02 --answers 5
+  python tools/benchmark_sse_coalescing.py --configs 0:0 25:512 50:1024 100:4096
+"""
+import argparse, os, socket, statistics, subprocess, sys, time
+
+import requests
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+
+
+def serve(port):
+    """Server subprocess: the threaded Flask app, counting writes to client sockets at /__socket-writes"""
+    import socketserver
+    from werkzeug.serving import run_simple
+    import main
+
+    writes = [0]
+    socket_write = socketserver._SocketWriter.write
+
+    def counting_write(self, data):
+        writes[0] += 1
+        return socket_write(self, data)
+
+    def counted_app(environ, start_response):
+        if environ["PATH_INFO"] == "/__socket-writes":
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [str(writes[0]).encode()]
+        return main.app(environ, start_response)
+
+    socketserver._SocketWriter.write = counting_write
+    run_simple("127.0.0.1", port, counted_app, threaded=True)
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"nothing listening on port {port}")
+
+
+def socket_writes(port):
+    return int(requests.get(f"http://127.0.0.1:{port}/__socket-writes", timeout=5).text)
+
+
+def one_answer(port, window_ms, max_bytes):
+    """Stream one answer; returns (frames, body bytes, seconds to first content, total seconds)"""
+    started = time.perf_counter()
+    first = None
+    frames = size = 0
+    with requests.get(f"http://127.0.0.1:{port}/ask", stream=True, timeout=120, params={
+        "question": "hi", "session_id": "bench-coalesce",
+        "coalesce_ms": window_ms, "coalesce_bytes": max_bytes
+    }) as response:
+        for chunk in response.iter_content(chunk_size=None):
+            size += len(chunk)
+            frames += chunk.count(b"data: ")
+            if first is None and b'"content"' in chunk:
+                first = time.perf_counter() - started
+    return frames, size, first, time.perf_counter() - started
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--configs", nargs="+", default=["0:0", "25:512", "50:1024", "100:4096"],
+                        help="coalesce_ms:coalesce_bytes pairs; 0:0 is one frame per delta")
+    parser.add_argument("--answers", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=5091)
+    parser.add_argument("--ollama-port", type=int, default=11591)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    quiet = dict(stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    fake = subprocess.Popen([sys.executable, os.path.join(TOOLS_DIR, "load_test_ask.py"),
+                             "--fake-ollama", str(args.ollama_port), "--tokens", str(args.tokens),
+                             "--token-delay", str(args.token_delay)], **quiet)
+    server = subprocess.Popen([sys.executable, __file__, "--serve", str(args.port)], **quiet,
+                              env={**os.environ, "OLLAMA_BASE_URL": f"http://127.0.0.1:{args.ollama_port}"})
+    try:
+        wait_for_port(args.ollama_port)
+        wait_for_port(args.port)
+        one_answer(args.port, 0, 0)  # warm-up
+
+        # writes include the response headers and the /__socket-writes probe itself
+        print(f"{args.tokens} deltas per answer, one every {args.token_delay * 1000:.0f}ms")
+        print(f"{'ms:bytes':>10} {'frames':>7} {'bytes':>8} {'writes':>7} {'ttft p50':>9} {'answer s':>9}")
+        for config in args.configs:
+            window_ms, max_bytes = (int(v) for v in config.split(":"))
+            before = socket_writes(args.port)
+            results = [one_answer(args.port, window_ms, max_bytes) for _ in range(args.answers)]
+            writes = (socket_writes(args.port) - before) / args.answers
+            frames = statistics.mean(r[0] for r in results)
+            size = statistics.mean(r[1] for r in results)
+            ttft = statistics.median(r[2] for r in results)
+            total = statistics.mean(r[3] for r in results)
+            print(f"{config:>10} {frames:>7.0f} {size:>8.0f} {writes:>7.0f} {ttft * 1000:>7.0f}ms {total:>9.2f}")
+    finally:
+        server.terminate()
+        fake.terminate()
+
+
+if __name__ == "__main__": main_cli()
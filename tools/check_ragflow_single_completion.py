@@ -0,0 +1,104 @@
+"""
+Check that one RAGFlow /ask turn costs exactly one upstream completion
+Starts a stand-in RAGFlow (and Ollama) on localhost, points main.py at it and asks a few knowledge-base
+questions through the Flask test client. After each answer the background jobs are drained, then the
+completion calls for that turn are counted. Exits non-zero if any turn made more or fewer than one.
+Usage:
+  python tools/check_ragflow_single_completion.py --turns 3
+"""
+import argparse, asyncio, json, os, sys, threading, time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTION = "how many sets should I do for bench press to build strength"
+
+
+class FakeBackends:
+    """Stand-in RAGFlow chat completions + Ollama /api/chat that count their calls"""
+
+    def __init__(self, port):
+        self.port = port
+        self.calls = {"completions": 0, "ollama": 0}
+        self.ready = threading.Event()
+
+    async def completions(self, request):
+        body = await request.json()
+        self.calls["completions"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        answer = ""
+        for word in ("Three", "to", "five", "sets."):
+            answer = f"{answer} {word}".strip()
+            event = {"code": 0, "data": {"answer": answer, "session_id": body.get("session_id")}}
+            await response.write(f"data: {json.dumps(event)}\n\n".encode())
+        await response.write(b'data: {"code": 0, "data": true}\n\n')
+        return response
+
+    async def list_chats(self, request):
+        return web.json_response({"code": 0, "data": []})
+
+    async def ollama_chat(self, request):
+        await request.read()
+        self.calls["ollama"] += 1
+        return web.json_response({"message": {"content": "[]"}, "done": True})
+
+    def run(self):
+        async def serve():
+            app = web.Application()
+            app.router.add_post("/api/v1/chats/{chat_id}/completions", self.completions)
+            app.router.add_get("/api/v1/chats", self.list_chats)
+            app.router.add_post("/api/chat", self.ollama_chat)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", self.port).start()
+            self.ready.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        self.ready.wait(10)
+
+
+def drain_jobs(jobs, timeout=30):
+    """Wait until every submitted background job has finished"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = jobs.stats()
+        if stats['submitted'] - stats['rejected'] <= stats['completed'] + stats['failed']:
+            return
+        time.sleep(0.05)
+    raise RuntimeError("background jobs did not finish")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--port", type=int, default=11791)
+    args = parser.parse_args()
+
+    fake = FakeBackends(args.port)
+    fake.run()
+    os.environ.update({
+        "BASE_URL": f"http://127.0.0.1:{args.port}", "CHAT_ID": "check-chat", "API_KEY": "check",
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{args.port}", "ROUTER_MODE": "static"
+    })
+    import main
+
+    client = main.app.test_client()
+    failures = 0
+    for turn in range(1, args.turns + 1):
+        before = fake.calls["completions"]
+        response = client.get("/ask", query_string={"question": QUESTION, "session_id": "single-completion-check"})
+        body = response.get_data(as_text=True)
+        drain_jobs(main.background_jobs)
+        completions = fake.calls["completions"] - before
+        ok = completions == 1 and '"done": true' in body
+        failures += not ok
+        print(f"turn {turn}: {completions} completion call(s) {'✅' if ok else '❌'}")
+
+    print(f"{args.turns - failures}/{args.turns} turns made exactly one RAGFlow completion")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__": main_cli()
@@ -0,0 +1,118 @@
+"""
+Evaluate the WorkoutMessageGate pre-filter against a labelled message set
+Compares each threshold with the always-call baseline (every message goes to the LLM), then checks
+that the rule-based fast path never accepts a labelled non-workout (exits non-zero if it does).
+Usage:
+  python tools/evaluate_workout_gate.py --thresholds 1 1.5 2 2.5 3
+"""
+import argparse, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import RuleBasedWorkoutParser, WorkoutMessageGate
+
+# (message, contains a loggable workout)
+LABELLED_MESSAGES = [
+    ("I benched 80kg for 5 reps, 3 sets", True),
+    ("Did 100kg squats today, 5x5", True),
+    ("Ran 5km in 30 minutes", True),
+    ("Deadlifted 120kg", True),
+    ("bench press: 80kg x 5 reps x 3 sets", True),
+    ("30 minute run this morning", True),
+    ("squatted 100kg 5x3", True),
+    ("deadlift 140kg for a single, new PR!", True),
+    ("Went for a run after work, about 8k", True),
+    ("did 3 sets of 12 pull-ups", True),
+    ("Swam 40 laps at the pool today", True),
+    ("hit the gym, did chest and triceps, bench was 85 for 6", True),
+    ("Cycled to work and back, roughly an hour total", True),
+    ("just finished 45 mins on the elliptical", True),
+    ("I managed 20 push-ups in a row", True),
+    ("Leg day: squats 3x8 at 90kg, lunges 3x10", True),
+    ("rowed 2000m in 7:45", True),
+    ("Walked 10,000 steps today", True),
+    ("I lifted for an hour this morning", True),
+    ("Yoga class for 60 minutes", True),
+    ("curled 15kg dumbbells for 3 sets of 12", True),
+    ("Did a HIIT workout, 20 minutes", True),
+    ("jogged around the park for half an hour", True),
+    ("Overhead press 50kg 5 reps", True),
+    ("I did 3 rounds of burpees and a 2 mile run", True),
+    ("what should I eat before bed?", False),
+    ("How many calories are in a banana?", False),
+    ("Can you make me a workout plan for next week?", False),
+    ("What's the best way to improve my bench?", False),
+    ("how much protein do I need per day", False),
+    ("Is creatine safe to take?", False),
+    ("I'm feeling tired lately, any advice", False),
+    ("Tell me about intermittent fasting", False),
+    ("Should I do cardio before or after weights?", False),
+    ("What muscles does the deadlift work?", False),
+    ("I want to lose 5kg by summer", False),
+    ("Tomorrow I'm going to run 10km", False),
+    ("Give me a 5x5 program for beginners", False),
+    ("My goal is to squat 150kg", False),
+    ("Thanks, that was really helpful!", False),
+    ("Can you explain progressive overload", False),
+    ("What's a good stretching routine for lower back pain", False),
+    ("I slept 8 hours last night", False),
+    ("How do I track macros?", False),
+    ("Recommend a pre-workout meal", False),
+    ("Please summarize my progress this month", False),
+    ("I'm 25 years old and weigh 80kg", False),
+    ("Is 3 sets enough to build muscle?", False),
+    ("Write me a meal plan with 2500 calories", False),
+    ("Why do my knees hurt when I run?", False),
+    # Numbers and exercises, but not something the user just did
+    ("I never ran 5km", False),
+    ("I haven't run 5km in years", False),
+    ("my friend ran 10km", False),
+    ("I used to squat 140kg", False),
+    ("I couldn't do 10 pull-ups", False),
+    ("my goal: deadlift 200kg", False),
+    ("My bench PR is 100kg", False),
+    ("Bench 100kg is my target", False),
+]
+
+
+def evaluate(gate):
+    tp = fp = fn = tn = 0
+    for message, label in LABELLED_MESSAGES:
+        predicted = gate.should_detect(message)
+        if predicted and label: tp += 1
+        elif predicted and not label: fp += 1
+        elif not predicted and label: fn += 1
+        else: tn += 1
+    calls = tp + fp
+    precision = tp / calls if calls else 0.0
+    recall = tp / (tp + fn) if (tp + fn) else 0.0
+    return precision, recall, calls, [m for m, l in LABELLED_MESSAGES if l and not gate.should_detect(m)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[1.0, 1.5, 2.0, 2.5, 3.0])
+    parser.add_argument("--show-misses", action="store_true")
+    args = parser.parse_args()
+
+    total = len(LABELLED_MESSAGES)
+    positives = sum(1 for _, l in LABELLED_MESSAGES if l)
+    print(f"{total} labelled messages, {positives} workouts")
+    print(f"{'threshold':>10} {'precision':>10} {'recall':>8} {'llm calls':>10} {'saved':>7}")
+    print(f"{'always':>10} {positives / total:>10.2f} {1.0:>8.2f} {total:>10} {0:>6.0%}")
+    for threshold in args.thresholds:
+        precision, recall, calls, misses = evaluate(WorkoutMessageGate(threshold))
+        print(f"{threshold:>10.1f} {precision:>10.2f} {recall:>8.2f} {calls:>10} {1 - calls / total:>6.0%}")
+        if args.show_misses:
+            for m in misses: print(f"{'':>12}missed: {m}")
+
+    # The fast path skips the LLM entirely, so a false positive here is a workout row that never happened
+    fast_parser = RuleBasedWorkoutParser()
+    parsed = [(m, l) for m, l in LABELLED_MESSAGES if fast_parser.parse(m) is not None]
+    false_positives = [m for m, l in parsed if not l]
+    print(f"fast path: parsed {sum(1 for _, l in parsed if l)}/{positives} workouts, "
+          f"{len(false_positives)} non-workouts")
+    for m in false_positives: print(f"{'':>12}false positive: {m}")
+    sys.exit(1 if false_positives else 0)
+
+
+if __name__ == "__main__": main()
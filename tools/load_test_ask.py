@@ -0,0 +1,128 @@
+"""
+Concurrent-stream load test for /ask: threaded Flask (python main.py) vs asyncio (python main.py serve-async)
+Point OLLAMA_BASE_URL at the built-in fake Ollama so generation time is controlled and no GPU is needed,
+and use a short question ("hi") so /ask takes the direct path.
+Usage:
+  python tools/load_test_ask.py --fake-ollama 11500 --tokens 200 --token-delay 0.05
+  OLLAMA_BASE_URL=http://localhost:11500 python main.py serve-async      # or: python main.py
+  python tools/load_test_ask.py --url http://localhost:5001 --levels 100 500 1000 2000 --server-pid <pid>
+"""
+import argparse, asyncio, json, resource, statistics, time
+
+import aiohttp
+from aiohttp import web
+
+
+def run_fake_ollama(port, tokens, token_delay):
+    """Stand-in for Ollama /api/chat that streams `tokens` NDJSON chunks, one every token_delay seconds"""
+    async def chat(request):
+        await request.read()
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for i in range(tokens):
+            await asyncio.sleep(token_delay)
+            await response.write((json.dumps({"message": {"content": f"tok{i} "}, "done": False}) + "\n").encode())
+        await response.write((json.dumps({"message": {"content": ""}, "done": True}) + "\n").encode())
+        return response
+
+    fake = web.Application()
+    fake.router.add_post("/api/chat", chat)
+    web.run_app(fake, port=port)
+
+
+def sample_process(pid):
+    """(threads, RSS MB) of the server process from /proc"""
+    threads = rss_kb = 0
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("Threads:"):
+                threads = int(line.split()[1])
+            elif line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+    return threads, rss_kb / 1024
+
+
+async def one_stream(http, url, timeout):
+    """Open one /ask stream and read it to the done frame; returns seconds to first content or None"""
+    started = time.perf_counter()
+    first = None
+    try:
+        async with http.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                return None
+            async for line in response.content:
+                if not line.startswith(b"data:"):
+                    continue
+                frame = json.loads(line[5:])
+                if "error" in frame:
+                    return None
+                if first is None and frame.get("content"):
+                    first = time.perf_counter() - started
+                if frame.get("done"):
+                    return first
+    except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError):
+        return None
+    return None
+
+
+async def run_level(base_url, concurrency, timeout, server_pid):
+    url = f"{base_url}/ask?question=hi&session_id=load-test"
+    peak_threads = peak_rss = 0.0
+    done = asyncio.Event()
+
+    async def sampler():
+        nonlocal peak_threads, peak_rss
+        while not done.is_set():
+            threads, rss = sample_process(server_pid)
+            peak_threads, peak_rss = max(peak_threads, threads), max(peak_rss, rss)
+            await asyncio.sleep(0.2)
+
+    connector = aiohttp.TCPConnector(limit=0, force_close=True)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        sampling = asyncio.create_task(sampler()) if server_pid else None
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one_stream(http, url, timeout) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+        done.set()
+        if sampling:
+            await sampling
+
+    ttfb = sorted(r for r in results if r is not None)
+    p50 = statistics.median(ttfb) if ttfb else float("nan")
+    p95 = ttfb[min(len(ttfb) - 1, int(len(ttfb) * 0.95))] if ttfb else float("nan")
+    return len(ttfb), concurrency - len(ttfb), p50, p95, wall, peak_threads, peak_rss
+
+
+async def run_levels(args):
+    print(f"{'streams':>8} {'ok':>6} {'failed':>7} {'ttfb p50':>9} {'ttfb p95':>9} {'wall s':>7} "
+          f"{'threads':>8} {'RSS MB':>7}")
+    for concurrency in args.levels:
+        ok, failed, p50, p95, wall, threads, rss = await run_level(args.url, concurrency, args.timeout, args.server_pid)
+        print(f"{concurrency:>8} {ok:>6} {failed:>7} {p50 * 1000:>7.0f}ms {p95 * 1000:>7.0f}ms {wall:>7.1f} "
+              f"{threads or '-':>8} {f'{rss:.0f}' if rss else '-':>7}")
+        await asyncio.sleep(args.pause)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--levels", type=int, nargs="+", default=[50, 200, 500, 1000, 2000])
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--pause", type=float, default=2, help="seconds between levels")
+    parser.add_argument("--server-pid", type=int, help="sample thread count and RSS of this process")
+    parser.add_argument("--fake-ollama", type=int, metavar="PORT", help="run the fake Ollama instead")
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.fake_ollama:
+        run_fake_ollama(args.fake_ollama, args.tokens, args.token_delay)
+        return
+
+    # Thousands of sockets on the client side too
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    asyncio.run(run_levels(args))
+
+
+if __name__ == "__main__": main_cli()
@@ -3,11 +3,12 @@ import sys
 
 packages = [
     "flask",
-    "openai>=1.0.0",
     "ragflow-sdk",
     "python-dotenv",
     "requests",
-    "mysql-connector-python"
+    "mysql-connector-python",
+    "numpy",
+    "aiohttp"
 ]
 
 def install(package):